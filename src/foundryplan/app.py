@@ -62,6 +62,8 @@ def main() -> None:
 
             loop.set_exception_handler(_handler)
 
+    app.on_shutdown(db.close)
+
     ui.run(host=settings.host, port=settings.port, title=planta, reload=False)
 
 
@@ -6,16 +6,42 @@ import re
 import logging
 from datetime import date, datetime, timedelta
 import math
+import threading
+from itertools import groupby
 from uuid import uuid4
 
-from foundryplan.data.db import Db
-from foundryplan.data.excel_io import coerce_date, coerce_float, normalize_columns, parse_int_strict, read_excel_bytes, to_int01
+from foundryplan.data.db import Db, bulk_insert
+from foundryplan.data.excel_io import (
+    coerce_date,
+    coerce_date_series,
+    coerce_float_series,
+    map_distinct,
+    normalize_columns,
+    parse_int_or_none,
+    read_excel_bytes,
+    read_xlsx_streaming,
+    to_int01_series,
+)
 from foundryplan.data.material_codes import extract_part_code, extract_alloy_code, get_material_type, is_finished_product, extract_part_code_sql
 from foundryplan.dispatcher.models import AuditEntry
 
 
 logger = logging.getLogger(__name__)
 
+# Lote parsing runs once per MB52 row: compile the patterns up front.
+_DIGITS_RE = re.compile(r"\d+")
+_LETTER_RE = re.compile(r"[A-Za-z]")
+
+_PROCESS_ALIASES = {
+    "vulcanizado": "en_vulcanizado",
+    "en-vulcanizado": "en_vulcanizado",
+    "vulc": "en_vulcanizado",
+    "en vulcanizado": "en_vulcanizado",
+    "toma_dureza": "toma_de_dureza",
+    "toma de dureza": "toma_de_dureza",
+    "toma-de-dureza": "toma_de_dureza",
+}
+
 
 class DataRepositoryImpl:
     """Data module repository implementation.
@@ -30,6 +56,21 @@ class DataRepositoryImpl:
 
     def __init__(self, db: Db):
         self.db = db
+        # core_config is tiny and only written through set_config: load it once, lazily.
+        # UI handlers run in asyncio.to_thread workers, so the dict is replaced (never
+        # mutated) under the lock; set_config applies a value only once it is committed,
+        # and the generation stops a concurrent load from installing an older copy.
+        self._config_lock = threading.Lock()
+        self._config_cache: dict[str, str] | None = None
+        self._config_generation = 0
+        # (process, alias) -> MB52 availability predicate SQL
+        self._avail_sql_cache: dict[tuple[str, str | None], str] = {}
+        # process -> normalized almacen; cleared when a sap_* config key changes
+        self._almacen_cache: dict[str, str] = {}
+        # name -> (Db.change_token, keys) for the (pedido, posicion) sets the dispatcher polls
+        self._orderpos_set_cache: dict[str, tuple[tuple[int, int, int], frozenset[tuple[str, str]]]] = {}
+        # (sql, params) -> (Db.change_token, COUNT(*)) for the row counts the UI polls
+        self._count_cache: dict[tuple[str, tuple], tuple[tuple[int, int, int], int]] = {}
 
         # Process keys used across config, derived orders, and cached programs.
         self.processes: dict[str, dict[str, str]] = {
@@ -85,7 +126,39 @@ class DataRepositoryImpl:
             priority_map = {"prueba": 1, "urgente": 2, "normal": 3}
         return {k: int(v) for k, v in priority_map.items()}
 
-    def _mb52_availability_predicate_sql(self, *, process: str) -> str:
+    @staticmethod
+    def _job_priority_overrides(con) -> tuple[set[tuple[str, str]], set[str]]:
+        """Manual priorities for the job sync: non-test (pedido, posicion) marks and legacy pedidos.
+
+        Shared by ``_create_jobs_from_mb52`` and ``rebuild_orders_from_sap_for``; both read
+        it once per call and look it up per order position.
+        """
+        manual_priority: set[tuple[str, str]] = set()
+        legacy_priority: set[str] = set()
+        try:
+            rows = con.execute(
+                """
+                SELECT pedido, posicion, COALESCE(kind, '') AS kind
+                FROM dispatcher_orderpos_priority
+                WHERE COALESCE(is_priority, 0) = 1
+                """
+            ).fetchall()
+            for r in rows:
+                if str(r["kind"] or "").strip().lower() == "test":
+                    continue
+                manual_priority.add((str(r["pedido"]).strip(), str(r["posicion"]).strip()))
+        except Exception:
+            pass
+        try:
+            rows = con.execute(
+                "SELECT pedido FROM dispatcher_order_priority WHERE COALESCE(is_priority, 0) = 1"
+            ).fetchall()
+            legacy_priority = {str(r[0]).strip() for r in rows}
+        except Exception:
+            pass
+        return manual_priority, legacy_priority
+
+    def _mb52_availability_predicate_sql(self, *, process: str, alias: str | None = None) -> str:
         """Process-specific MB52 availability predicate.
 
         Reads from core_processes.availability_predicate_json to generate SQL.
@@ -101,9 +174,17 @@ class DataRepositoryImpl:
         - {\"libre_utilizacion\": 1} -> only check libre_utilizacion
         
         Falls back to default (available stock) if no config found.
+        ``alias`` qualifies the columns (e.g. ``"m"`` -> ``m.libre_utilizacion``).
+        The SQL is cached per (process, alias); ``update_process_config`` clears it.
         """
         p = self._normalize_process(process)
-        
+        cache_key = (p, alias)
+        cached = self._avail_sql_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        # Default: available stock (libre_utilizacion=1 AND en_control_calidad=0)
+        flags = {"libre_utilizacion": 1, "en_control_calidad": 0}
         # Read from core_processes table
         try:
             with self.db.connect() as con:
@@ -115,49 +196,46 @@ class DataRepositoryImpl:
                 if row and row["availability_predicate_json"]:
                     import json
                     pred = json.loads(str(row["availability_predicate_json"]))
-                    
-                    conditions = []
-                    if "libre_utilizacion" in pred:
-                        val = int(pred["libre_utilizacion"])
-                        conditions.append(f"COALESCE(libre_utilizacion, 0) = {val}")
-                    
-                    if "en_control_calidad" in pred:
-                        val = int(pred["en_control_calidad"])
-                        conditions.append(f"COALESCE(en_control_calidad, 0) = {val}")
-                    
-                    if conditions:
-                        if len(conditions) == 1:
-                            return f"({conditions[0]})"
-                        else:
-                            # Multiple conditions: use AND logic
-                            return "(" + " AND ".join(conditions) + ")"
+                    configured = {
+                        col: int(pred[col])
+                        for col in ("libre_utilizacion", "en_control_calidad")
+                        if col in pred
+                    }
+                    if configured:
+                        flags = configured
         except Exception:
             pass  # Fall back to default
-        
-        # Default: available stock (libre_utilizacion=1 AND en_control_calidad=0)
-        return "(COALESCE(libre_utilizacion, 0) = 1 AND COALESCE(en_control_calidad, 0) = 0)"
+
+        prefix = f"{alias}." if alias else ""
+        # Multiple conditions: use AND logic
+        sql = "(" + " AND ".join(self._mb52_flag_condition(prefix + col, val) for col, val in flags.items()) + ")"
+        self._avail_sql_cache[cache_key] = sql
+        return sql
+
+    @staticmethod
+    def _mb52_flag_condition(col: str, val: int) -> str:
+        """SQL test of an MB52 0/1 flag.
+
+        The flags are stored NOT NULL (0/1), so a bare comparison is exact and lets
+        SQLite seek idx_mb52_availability instead of filtering row by row.
+        """
+        return f"{col} = {val}"
 
     def _normalize_process(self, process: str | None) -> str:
         p = str(process or "terminaciones").strip().lower()
-        aliases = {
-            "vulcanizado": "en_vulcanizado",
-            "en-vulcanizado": "en_vulcanizado",
-            "vulc": "en_vulcanizado",
-            "en vulcanizado": "en_vulcanizado",
-            "toma_dureza": "toma_de_dureza",
-            "toma de dureza": "toma_de_dureza",
-            "toma-de-dureza": "toma_de_dureza",
-        }
-        p = aliases.get(p, p)
+        p = _PROCESS_ALIASES.get(p, p)
         if p not in self.processes:
             raise ValueError(f"process no soportado: {process!r}")
         return p
 
     def _almacen_for_process(self, process: str | None) -> str:
         p = self._normalize_process(process)
-        key = self.processes[p]["almacen_key"]
-        raw = str(self.get_config(key=key, default="") or "").strip()
-        return self._normalize_sap_key(raw) or raw
+        almacen = self._almacen_cache.get(p)
+        if almacen is None:
+            key = self.processes[p]["almacen_key"]
+            raw = str(self.get_config(key=key, default="") or "").strip()
+            almacen = self._almacen_cache[p] = self._normalize_sap_key(raw) or raw
+        return almacen
 
     @staticmethod
     def _normalize_sap_key(value) -> str | None:
@@ -171,14 +249,21 @@ class DataRepositoryImpl:
             return None
         # Clean whitespace first (including non-breaking spaces)
         s = str(value).replace("\u00a0", " ").strip()
+        if isinstance(value, str) and s.isdecimal():
+            return str(int(s))  # common case: digit-only text such as "000010"
         if not s or s.lower() == "nan":
             return None
+        n = parse_int_or_none(value)
+        # If it's not numeric, return the cleaned string
+        return str(n) if n is not None else s
+
+    @staticmethod
+    def _coerce_opt_int(raw) -> int | None:
+        """Visión count cells (solicitado, bodega, stage columns): int, or None when empty/invalid."""
         try:
-            n = parse_int_strict(value, field="sap_key")
-            return str(int(n))
+            return int(float(raw)) if raw is not None and str(raw).strip() and str(raw).strip().lower() != "nan" else None
         except Exception:
-            # If it's not numeric, return the cleaned string
-            return s
+            return None
 
     @staticmethod
     def _lote_to_int(value) -> int | None:
@@ -199,13 +284,13 @@ class DataRepositoryImpl:
         if not s or s.lower() == "nan":
             return None
         
-        try:
-            return int(parse_int_strict(value, field="Lote"))
-        except Exception:
-            m = re.search(r"\d+", s)
+        n = parse_int_or_none(value)
+        if n is None:
+            m = _DIGITS_RE.search(s)
             if not m:
                 return None  # No digits found, return None instead of raising
             return int(m.group(0))
+        return n
 
     @staticmethod
     def _is_lote_test(lote: str) -> bool:
@@ -215,7 +300,7 @@ class DataRepositoryImpl:
         """
         if not lote:
             return False
-        return bool(re.search(r"[A-Za-z]", str(lote)))
+        return bool(_LETTER_RE.search(str(lote)))
 
     @staticmethod
     def _lote_to_int_last4(value) -> int:
@@ -234,6 +319,14 @@ class DataRepositoryImpl:
         if missing:
             raise ValueError(f"Faltan columnas: {missing}. Columnas detectadas: {sorted(cols)}")
 
+    @staticmethod
+    def _float_column(df: pd.DataFrame, col: str) -> list[float | None]:
+        """`coerce_float` for a whole column (None when empty or missing)."""
+        if col not in df.columns:
+            return [None] * len(df)
+        values = coerce_float_series(df[col])
+        return values.astype(object).where(values.notna(), None).tolist()
+
     def _update_jobs_from_vision(self, *, con) -> None:
         """Update existing jobs with fecha_de_pedido from Vision snapshot.
         
@@ -280,96 +373,46 @@ class DataRepositoryImpl:
                 "distinct_orderpos_missing_vision": 0,
             }
 
+        # One MB52 scan: group usable rows by (has_keys, pedido, posicion) and look up
+        # Vision once per group; the five counters are aggregates over those groups.
         with self.db.connect() as con:
-            usable_total = int(
-                con.execute(
-                    f"""
-                    SELECT COUNT(*)
-                    FROM core_sap_mb52_snapshot
-                    WHERE centro = ?
-                        AND almacen = ?
-                        AND {avail_sql}
-                    """.strip(),
-                    (centro, almacen),
-                ).fetchone()[0]
-            )
-
-            usable_with_keys = int(
-                con.execute(
-                    f"""
-                    SELECT COUNT(*)
+            row = con.execute(
+                f"""
+                WITH base AS (
+                    SELECT documento_comercial AS pedido,
+                           posicion_sd AS posicion,
+                           (documento_comercial IS NOT NULL AND TRIM(documento_comercial) <> ''
+                            AND posicion_sd IS NOT NULL AND TRIM(posicion_sd) <> ''
+                            AND lote IS NOT NULL AND TRIM(lote) <> '') AS has_keys
                     FROM core_sap_mb52_snapshot
                     WHERE centro = ?
                         AND almacen = ?
                         AND {avail_sql}
-                        AND documento_comercial IS NOT NULL AND TRIM(documento_comercial) <> ''
-                        AND posicion_sd IS NOT NULL AND TRIM(posicion_sd) <> ''
-                        AND lote IS NOT NULL AND TRIM(lote) <> ''
-                    """.strip(),
-                    (centro, almacen),
-                ).fetchone()[0]
-            )
-
-            usable_with_keys_and_vision = int(
-                con.execute(
-                    f"""
-                    SELECT COUNT(*)
-                    FROM core_sap_mb52_snapshot m
-                    JOIN core_sap_vision_snapshot v
-                        ON v.pedido = m.documento_comercial
-                     AND v.posicion = m.posicion_sd
-                    WHERE m.centro = ?
-                        AND m.almacen = ?
-                        AND {avail_sql.replace('libre_utilizacion', 'm.libre_utilizacion').replace('en_control_calidad', 'm.en_control_calidad')}
-                        AND m.documento_comercial IS NOT NULL AND TRIM(m.documento_comercial) <> ''
-                        AND m.posicion_sd IS NOT NULL AND TRIM(m.posicion_sd) <> ''
-                        AND m.lote IS NOT NULL AND TRIM(m.lote) <> ''
-                    """.strip(),
-                    (centro, almacen),
-                ).fetchone()[0]
-            )
-
-            distinct_orderpos = int(
-                con.execute(
-                    f"""
-                    SELECT COUNT(*)
-                    FROM (
-                        SELECT DISTINCT documento_comercial, posicion_sd
-                        FROM core_sap_mb52_snapshot
-                        WHERE centro = ?
-                          AND almacen = ?
-                          AND {avail_sql}
-                          AND documento_comercial IS NOT NULL AND TRIM(documento_comercial) <> ''
-                          AND posicion_sd IS NOT NULL AND TRIM(posicion_sd) <> ''
-                          AND lote IS NOT NULL AND TRIM(lote) <> ''
-                    )
-                    """.strip(),
-                    (centro, almacen),
-                ).fetchone()[0]
-            )
-
-            distinct_orderpos_missing_vision = int(
-                con.execute(
-                    f"""
-                    SELECT COUNT(*)
-                    FROM (
-                            SELECT DISTINCT m.documento_comercial AS pedido, m.posicion_sd AS posicion
-                            FROM core_sap_mb52_snapshot m
-                            LEFT JOIN core_sap_vision_snapshot v
-                                ON v.pedido = m.documento_comercial
-                             AND v.posicion = m.posicion_sd
-                            WHERE m.centro = ?
-                                AND m.almacen = ?
-                                AND {avail_sql.replace('libre_utilizacion', 'm.libre_utilizacion').replace('en_control_calidad', 'm.en_control_calidad')}
-                                AND m.documento_comercial IS NOT NULL AND TRIM(m.documento_comercial) <> ''
-                                AND m.posicion_sd IS NOT NULL AND TRIM(m.posicion_sd) <> ''
-                                AND m.lote IS NOT NULL AND TRIM(m.lote) <> ''
-                                AND v.pedido IS NULL
-                    )
-                    """.strip(),
-                    (centro, almacen),
-                ).fetchone()[0]
-            )
+                ),
+                grouped AS (
+                    SELECT has_keys,
+                           COUNT(*) AS n,
+                           CASE WHEN has_keys THEN (
+                               SELECT COUNT(*)
+                               FROM core_sap_vision_snapshot v
+                               WHERE v.pedido = base.pedido
+                                 AND v.posicion = base.posicion
+                           ) ELSE 0 END AS vision_rows
+                    FROM base
+                    GROUP BY has_keys, pedido, posicion
+                )
+                SELECT COALESCE(SUM(n), 0),
+                       COALESCE(SUM(CASE WHEN has_keys THEN n ELSE 0 END), 0),
+                       COALESCE(SUM(n * vision_rows), 0),
+                       COALESCE(SUM(has_keys), 0),
+                       COALESCE(SUM(has_keys AND vision_rows = 0), 0)
+                FROM grouped
+                """.strip(),
+                (centro, almacen),
+            ).fetchone()
+        usable_total, usable_with_keys, usable_with_keys_and_vision, distinct_orderpos, distinct_orderpos_missing_vision = (
+            int(v) for v in row
+        )
 
         return {
             "process": process,
@@ -393,60 +436,49 @@ class DataRepositoryImpl:
         if not centro_cfg or not almacen_cfg:
             return []
 
-        with self.db.connect() as con:
-            rows = con.execute(
-                """
-                SELECT material, texto_breve, centro, almacen, lote,
-                       COALESCE(libre_utilizacion, 0) AS libre,
-                       COALESCE(en_control_calidad, 0) AS qc,
-                       documento_comercial, posicion_sd
+        # Non-usable = not free OR in QC. Each disjunct is its own UNION ALL branch (the
+        # second excludes the first) so both seek idx_mb52_availability on the 0/1 flags.
+        base = """
+                SELECT COALESCE(documento_comercial, '') AS pedido,
+                       COALESCE(posicion_sd, '') AS posicion,
+                       material,
+                       COALESCE(texto_breve, '') AS texto_breve,
+                       COALESCE(centro, '') AS centro,
+                       COALESCE(almacen, '') AS almacen,
+                       COALESCE(lote, '') AS lote,
+                       libre_utilizacion AS libre,
+                       en_control_calidad AS qc
                 FROM core_sap_mb52_snapshot
                 WHERE documento_comercial IS NOT NULL AND TRIM(documento_comercial) <> ''
                   AND posicion_sd IS NOT NULL AND TRIM(posicion_sd) <> ''
-                        AND centro = ?
-                        AND almacen = ?
-                        AND (
-                                COALESCE(libre_utilizacion, 0) <> 1
-                            OR COALESCE(en_control_calidad, 0) <> 0
-                        )
-                ORDER BY documento_comercial, posicion_sd, material
+                  AND centro = ?
+                  AND almacen = ?
+        """
+        with self.db.connect() as con:
+            rows = con.execute(
+                f"""
+                {base}
+                  AND libre_utilizacion = 0
+                UNION ALL
+                {base}
+                  AND libre_utilizacion = 1
+                  AND en_control_calidad <> 0
+                ORDER BY pedido, posicion, material
                 LIMIT ?
                 """,
-                (centro_cfg, almacen_cfg, int(limit)),
+                (centro_cfg, almacen_cfg, centro_cfg, almacen_cfg, int(limit)),
             ).fetchall()
 
         out: list[dict] = []
         for r in rows:
-            material = str(r[0])
-            texto_breve = str(r[1]) if r[1] is not None else ""
-            centro = str(r[2]) if r[2] is not None else ""
-            almacen = str(r[3]) if r[3] is not None else ""
-            lote = str(r[4]) if r[4] is not None else ""
-            libre = int(r[5] or 0)
-            qc = int(r[6] or 0)
-            pedido = str(r[7]) if r[7] is not None else ""
-            posicion = str(r[8]) if r[8] is not None else ""
-
+            item = dict(r)
             reasons: list[str] = []
-            if libre != 1:
+            if item["libre"] != 1:
                 reasons.append("No libre utilizaci�n")
-            if qc != 0:
+            if item["qc"] != 0:
                 reasons.append("En control de calidad")
-
-            out.append(
-                {
-                    "pedido": pedido,
-                    "posicion": posicion,
-                    "material": material,
-                    "texto_breve": texto_breve,
-                    "centro": centro,
-                    "almacen": almacen,
-                    "lote": lote,
-                    "libre": libre,
-                    "qc": qc,
-                    "motivo": "; ".join(reasons) if reasons else "No usable",
-                }
-            )
+            item["motivo"] = "; ".join(reasons) if reasons else "No usable"
+            out.append(item)
 
         return out
 
@@ -462,23 +494,25 @@ class DataRepositoryImpl:
                 """
                 SELECT m.documento_comercial AS pedido,
                        m.posicion_sd AS posicion,
-                       m.material,
+                       m.material AS material,
                        COALESCE(MAX(m.texto_breve), '') AS texto_breve,
                        COUNT(*) AS piezas,
-                       MIN(m.lote) AS lote_min,
-                       MAX(m.lote) AS lote_max
+                       COALESCE(MIN(m.lote), '') AS lote_min,
+                       COALESCE(MAX(m.lote), '') AS lote_max
                 FROM core_sap_mb52_snapshot m
-                LEFT JOIN core_sap_vision_snapshot v
-                  ON v.pedido = m.documento_comercial
-                 AND v.posicion = m.posicion_sd
                 WHERE m.centro = ?
                   AND m.almacen = ?
-                  AND COALESCE(m.libre_utilizacion, 0) = 1
-                  AND COALESCE(m.en_control_calidad, 0) = 0
+                  AND m.libre_utilizacion = 1
+                  AND m.en_control_calidad = 0
                   AND m.documento_comercial IS NOT NULL AND TRIM(m.documento_comercial) <> ''
                   AND m.posicion_sd IS NOT NULL AND TRIM(m.posicion_sd) <> ''
                   AND m.lote IS NOT NULL AND TRIM(m.lote) <> ''
-                  AND v.pedido IS NULL
+                  AND NOT EXISTS (
+                      SELECT 1
+                      FROM core_sap_vision_snapshot v
+                      WHERE v.pedido = m.documento_comercial
+                        AND v.posicion = m.posicion_sd
+                  )
                 GROUP BY m.documento_comercial, m.posicion_sd, m.material
                 ORDER BY piezas DESC, pedido, posicion, m.material
                 LIMIT ?
@@ -486,18 +520,7 @@ class DataRepositoryImpl:
                 (centro, almacen, int(limit)),
             ).fetchall()
 
-        return [
-            {
-                "pedido": str(r[0]),
-                "posicion": str(r[1]),
-                "material": str(r[2]),
-                "texto_breve": str(r[3]) if r[3] is not None else "",
-                "piezas": int(r[4]),
-                "lote_min": str(r[5]) if r[5] is not None else "",
-                "lote_max": str(r[6]) if r[6] is not None else "",
-            }
-            for r in rows
-        ]
+        return [dict(r) for r in rows]
 
     def get_sap_mb52_almacen_counts(self, *, centro: str | None = None, limit: int = 50) -> list[dict]:
         """Return counts per almacen in sap_mb52 (optionally filtered by centro)."""
@@ -525,11 +548,18 @@ class DataRepositoryImpl:
         key = str(key).strip()
         if not key:
             raise ValueError("config key vac�o")
-        with self.db.connect() as con:
-            row = con.execute("SELECT config_value FROM core_config WHERE config_key = ?", (key,)).fetchone()
-        if row is None:
-            return default
-        return str(row[0])
+        with self._config_lock:
+            cache, generation = self._config_cache, self._config_generation
+        if cache is None:
+            with self.db.connect() as con:
+                rows = con.execute("SELECT config_key, config_value FROM core_config").fetchall()
+                # Inside an open transaction the rows may include writes that roll back
+                committed = not con.in_transaction
+            cache = {str(r[0]): str(r[1]) for r in rows}
+            with self._config_lock:
+                if committed and self._config_generation == generation:
+                    self._config_cache = cache
+        return cache.get(key, default)
 
     def get_active_alloy_codes(self) -> list[str]:
         """Get list of active alloy codes from catalog.
@@ -633,14 +663,15 @@ class DataRepositoryImpl:
         if not key:
             raise ValueError("config key vac�o")
 
+        # Audit config change
+        old_val = self.get_config(key=key, default="(none)")
+
         with self.db.connect() as con:
-            # Audit config change
-            old_val_row = con.execute("SELECT config_value FROM core_config WHERE config_key = ?", (key,)).fetchone()
-            old_val = old_val_row[0] if old_val_row else "(none)"
-        
-        self.log_audit("CONFIG", f"Updated '{key}'", f"From '{old_val}' to '{value}'")
-        
-        with self.db.connect() as con:
+            # Audit row, priority recalculation and upsert commit together.
+            if not con.in_transaction:
+                con.execute("BEGIN IMMEDIATE")
+            self.log_audit("CONFIG", f"Updated '{key}'", f"From '{old_val}' to '{value}'")
+
             # FASE 3.3: Handle priority map changes (recalculate job priorities)
             if key == "job_priority_map":
                 try:
@@ -681,9 +712,20 @@ class DataRepositoryImpl:
                 "INSERT INTO core_config(config_key, config_value) VALUES(?, ?) ON CONFLICT(config_key) DO UPDATE SET config_value=excluded.config_value",
                 (key, str(value).strip()),
             )
-            # Warehouse/filters affect derived orders and programs.
-            con.execute("DELETE FROM core_orders")
-            con.execute("DELETE FROM dispatcher_last_program")
+            # Warehouse/filters affect derived orders and programs; UI and planner
+            # settings do not, so they skip the invalidation.
+            if key.startswith("sap_") or key == "job_priority_map":
+                con.execute("DELETE FROM core_orders")
+                con.execute("DELETE FROM dispatcher_last_program")
+            self.db.after_commit(lambda: self._config_committed(key, str(value).strip()))
+
+    def _config_committed(self, key: str, value: str) -> None:
+        with self._config_lock:
+            self._config_generation += 1
+            if self._config_cache is not None:
+                self._config_cache = {**self._config_cache, key: value}
+        if key.startswith("sap_"):
+            self._almacen_cache.clear()
 
     def get_process_config(self, *, process_id: str) -> dict:
         """Get process configuration including almacen and availability filters.
@@ -757,15 +799,17 @@ class DataRepositoryImpl:
         with self.db.connect() as con:
             if sap_almacen is not None:
                 con.execute(
-                    "UPDATE process SET sap_almacen = ? WHERE process_id = ?",
+                    "UPDATE core_processes SET sap_almacen = ? WHERE process_id = ?",
                     (str(sap_almacen).strip(), p)
                 )
             
             if pred_json is not None:
                 con.execute(
-                    "UPDATE process SET availability_predicate_json = ? WHERE process_id = ?",
+                    "UPDATE core_processes SET availability_predicate_json = ? WHERE process_id = ?",
                     (pred_json, p)
                 )
+        # Rendered availability predicates depend on availability_predicate_json
+        self._avail_sql_cache.clear()
         
         self.log_audit("CONFIG", "Update Process", f"Process: {p}, Almacen: {sap_almacen}, Filters: {pred}")
 
@@ -810,15 +854,7 @@ class DataRepositoryImpl:
             con.execute("UPDATE core_material_master SET family_id = ? WHERE family_id = ?", (new, old))
 
             # Update line_config allowed families JSON
-            rows = con.execute("SELECT process, line_id, families_json FROM line_config").fetchall()
-            for r in rows:
-                families = json.loads(r["families_json"])
-                updated = [new if f == old else f for f in families]
-                updated = sorted(set(updated))
-                con.execute(
-                    "UPDATE line_config SET families_json = ? WHERE process = ? AND line_id = ?",
-                    (json.dumps(updated), str(r["process"]), int(r["line_id"])),
-                )
+            self._replace_line_family(con, old=old, new=new)
 
             # Remove old from catalog
             con.execute("DELETE FROM core_family_catalog WHERE family_id = ?", (old,))
@@ -833,28 +869,23 @@ class DataRepositoryImpl:
         if not name:
             raise ValueError("family_id inv�lida")
         with self.db.connect() as con:
-            in_use = int(con.execute("SELECT COUNT(*) FROM core_material_master WHERE family_id = ?", (name,)).fetchone()[0])
-            if in_use and force:
-                # Keep mappings: move affected parts to 'Otros'
-                con.execute("INSERT OR IGNORE INTO core_family_catalog(family_id, label) VALUES('Otros', 'Otros')")
+            if force:
+                # Keep mappings: move affected parts to 'Otros' (created only if a part needs it)
+                con.execute(
+                    """
+                    INSERT OR IGNORE INTO core_family_catalog(family_id, label)
+                    SELECT 'Otros', 'Otros'
+                    WHERE EXISTS (SELECT 1 FROM core_material_master WHERE family_id = ?)
+                    """,
+                    (name,),
+                )
                 con.execute("UPDATE core_material_master SET family_id='Otros' WHERE family_id = ?", (name,))
-            elif in_use and not force:
+            else:
                 # Default behavior: remove mappings so affected parts become "missing" and must be reassigned.
                 con.execute("DELETE FROM core_material_master WHERE family_id = ?", (name,))
 
             # Update line_config allowed families JSON (remove or replace)
-            rows = con.execute("SELECT process, line_id, families_json FROM line_config").fetchall()
-            for r in rows:
-                families = json.loads(r["families_json"])
-                if force:
-                    updated = ["Otros" if f == name else f for f in families]
-                else:
-                    updated = [f for f in families if f != name]
-                updated = sorted(set(updated))
-                con.execute(
-                    "UPDATE line_config SET families_json = ? WHERE process = ? AND line_id = ?",
-                    (json.dumps(updated), str(r["process"]), int(r["line_id"])),
-                )
+            self._replace_line_family(con, old=name, new="Otros" if force else None)
 
             con.execute("DELETE FROM core_family_catalog WHERE family_id = ?", (name,))
 
@@ -863,6 +894,32 @@ class DataRepositoryImpl:
         
         self.log_audit("MASTER_DATA", "Delete Family", f"Name: {name}, Force: {force}")
 
+    @staticmethod
+    def _replace_line_family(con, *, old: str, new: str | None) -> None:
+        """Rename (or drop, when ``new`` is None) a family in every line's families_json.
+
+        One UPDATE with JSON1: each affected array is rebuilt sorted and de-duplicated,
+        as the dispatcher writes it; lines without ``old`` are not touched.
+        """
+        con.execute(
+            """
+            UPDATE dispatcher_line_config
+            SET families_json = (
+                SELECT json_group_array(f)
+                FROM (
+                    SELECT DISTINCT CASE WHEN je.value = :old THEN :new ELSE je.value END AS f
+                    FROM json_each(dispatcher_line_config.families_json) je
+                    WHERE je.value <> :old OR :new IS NOT NULL
+                    ORDER BY f
+                )
+            )
+            WHERE EXISTS (
+                SELECT 1 FROM json_each(dispatcher_line_config.families_json) WHERE value = :old
+            )
+            """,
+            {"old": old, "new": new},
+        )
+
     # ---------- Material Master (Parts) ----------
     def upsert_part(self, *, material: str, family_id: str) -> None:
         material = str(material).strip()
@@ -993,7 +1050,7 @@ class DataRepositoryImpl:
         self.add_family(name=family_id)
 
         with self.db.connect() as con:
-            con.execute(
+            changed = con.execute(
                 "INSERT INTO core_material_master("
                 "part_code, family_id, vulcanizado_dias, mecanizado_dias, inspeccion_externa_dias, peso_unitario_ton, "
                 "mec_perf_inclinada, sobre_medida_mecanizado, aleacion, flask_size, piezas_por_molde, tiempo_enfriamiento_molde_horas, "
@@ -1013,15 +1070,45 @@ class DataRepositoryImpl:
                 "piezas_por_molde=excluded.piezas_por_molde, "
                 "tiempo_enfriamiento_molde_horas=excluded.tiempo_enfriamiento_molde_horas, "
                 "finish_days=excluded.finish_days, "
-                "min_finish_days=excluded.min_finish_days",
+                "min_finish_days=excluded.min_finish_days "
+                # Skip no-op re-upserts (e.g. re-importing the same master) so they keep the program
+                "WHERE (family_id, vulcanizado_dias, mecanizado_dias, inspeccion_externa_dias, peso_unitario_ton, "
+                "mec_perf_inclinada, sobre_medida_mecanizado, aleacion, flask_size, piezas_por_molde, "
+                "tiempo_enfriamiento_molde_horas, finish_days, min_finish_days) "
+                "IS NOT (excluded.family_id, excluded.vulcanizado_dias, excluded.mecanizado_dias, "
+                "excluded.inspeccion_externa_dias, excluded.peso_unitario_ton, excluded.mec_perf_inclinada, "
+                "excluded.sobre_medida_mecanizado, excluded.aleacion, excluded.flask_size, excluded.piezas_por_molde, "
+                "excluded.tiempo_enfriamiento_molde_horas, excluded.finish_days, excluded.min_finish_days) "
+                "RETURNING part_code",
                 (part_code, family_id, v, m, i, pt, mec_perf, sm, aleacion_val, flask_val, ppm, t_enfr, fd_val, mfd_val),
-            )
+            ).fetchone()
 
-            # Invalidate any previously generated program
-            con.execute("DELETE FROM dispatcher_last_program")
+            # Invalidate any previously generated program (only if the row was inserted or changed)
+            if changed is not None:
+                con.execute("DELETE FROM dispatcher_last_program")
         
         self.log_audit("MASTER_DATA", "Upsert Part", f"Material: {material} Family: {family_id}")
 
+    def upsert_part_masters(self, parts: list[dict]) -> list[tuple[str, str]]:
+        """Upsert several part master rows (``upsert_part_master`` kwargs) in one transaction.
+
+        Each row runs in its own savepoint, so a failing row is rolled back whole (its
+        family and audit entries included) without losing the others; the batch commits
+        once instead of once per row (and per audit entry).
+        Returns ``(material, error)`` for the rows that failed.
+        """
+        failures: list[tuple[str, str]] = []
+        with self.db.connect() as con:
+            if not con.in_transaction:
+                con.execute("BEGIN IMMEDIATE")
+            for kwargs in parts:
+                try:
+                    with self.db.connect():
+                        self.upsert_part_master(**kwargs)
+                except Exception as ex:
+                    failures.append((str(kwargs.get("material", "")), str(ex)))
+        return failures
+
     def update_part_process_times(
         self,
         *,
@@ -1099,7 +1186,8 @@ class DataRepositoryImpl:
                 "END AS material_example "
                 "FROM core_material_master ORDER BY part_code"
             ).fetchall()
-        return [dict(r) for r in rows]
+        # map() keeps the per-row dict(Row) conversion in C (no listcomp frame); the master can be large
+        return list(map(dict, rows))
 
     def get_missing_parts_from_mb52(self) -> list[dict]:
         """Backward-compatible (Terminaciones) missing master detection."""
@@ -1114,7 +1202,7 @@ class DataRepositoryImpl:
         process = self._normalize_process(process)
         centro = (self.get_config(key="sap_centro", default="4000") or "").strip()
         almacen = self._almacen_for_process(process)
-        avail_sql = self._mb52_availability_predicate_sql(process=process)
+        avail_sql = self._mb52_availability_predicate_sql(process=process, alias="m")
         if not centro or not almacen:
             return []
         lim = int(limit or 500)
@@ -1131,20 +1219,20 @@ class DataRepositoryImpl:
                         END) AS part_code,
                         COALESCE(m.material_base, v.cod_material, m.material) AS material,
                         COALESCE(MAX(m.texto_breve), '') AS texto_breve,
-                        MAX(p.family_id) as family_id,
-                        MAX(p.vulcanizado_dias) as vulcanizado_dias,
-                        MAX(p.mecanizado_dias) as mecanizado_dias,
-                        MAX(p.inspeccion_externa_dias) as inspeccion_externa_dias,
-                        MAX(p.mec_perf_inclinada) as mec_perf_inclinada,
-                        MAX(p.sobre_medida_mecanizado) as sobre_medida_mecanizado,
-                        COALESCE(MAX(p.aleacion), (CASE
+                        p.family_id as family_id,
+                        p.vulcanizado_dias as vulcanizado_dias,
+                        p.mecanizado_dias as mecanizado_dias,
+                        p.inspeccion_externa_dias as inspeccion_externa_dias,
+                        p.mec_perf_inclinada as mec_perf_inclinada,
+                        p.sobre_medida_mecanizado as sobre_medida_mecanizado,
+                        COALESCE(p.aleacion, (CASE
                             WHEN substr(COALESCE(m.material_base, v.cod_material, m.material), 1, 2) = '40' AND substr(COALESCE(m.material_base, v.cod_material, m.material), 5, 2) = '00' THEN substr(COALESCE(m.material_base, v.cod_material, m.material), 3, 2)
                             WHEN substr(COALESCE(m.material_base, v.cod_material, m.material), 1, 3) = '435' AND substr(COALESCE(m.material_base, v.cod_material, m.material), 6, 1) = '0' THEN substr(COALESCE(m.material_base, v.cod_material, m.material), 4, 2)
                             WHEN substr(COALESCE(m.material_base, v.cod_material, m.material), 1, 3) = '436' AND substr(COALESCE(m.material_base, v.cod_material, m.material), 6, 1) = '0' THEN substr(COALESCE(m.material_base, v.cod_material, m.material), 4, 2)
                         END)) as aleacion,
-                        MAX(p.piezas_por_molde) as piezas_por_molde,
-                        MAX(p.peso_unitario_ton) as peso_unitario_ton,
-                        MAX(p.tiempo_enfriamiento_molde_horas) as tiempo_enfriamiento_molde_horas
+                        p.piezas_por_molde as piezas_por_molde,
+                        p.peso_unitario_ton as peso_unitario_ton,
+                        p.tiempo_enfriamiento_molde_horas as tiempo_enfriamiento_molde_horas
                 FROM core_sap_mb52_snapshot m
                 LEFT JOIN core_sap_vision_snapshot v
                     ON v.pedido = m.documento_comercial
@@ -1159,7 +1247,7 @@ class DataRepositoryImpl:
                     AND TRIM(COALESCE(m.material_base, v.cod_material, m.material)) <> ''
                   AND m.centro = ?
                   AND m.almacen = ?
-                    AND {avail_sql.replace('libre_utilizacion', 'm.libre_utilizacion').replace('en_control_calidad', 'm.en_control_calidad')}
+                    AND {avail_sql}
                   AND m.documento_comercial IS NOT NULL AND TRIM(m.documento_comercial) <> ''
                   AND m.posicion_sd IS NOT NULL AND TRIM(m.posicion_sd) <> ''
                   AND m.lote IS NOT NULL AND TRIM(m.lote) <> ''
@@ -1232,20 +1320,20 @@ class DataRepositoryImpl:
                     END) AS part_code,
                     m.cod_material AS material,
                     COALESCE(MAX(m.descripcion_material), '') AS descripcion_material,
-                    MAX(p.family_id) as family_id,
-                    MAX(p.vulcanizado_dias) as vulcanizado_dias,
-                    MAX(p.mecanizado_dias) as mecanizado_dias,
-                    MAX(p.inspeccion_externa_dias) as inspeccion_externa_dias,
-                    MAX(p.mec_perf_inclinada) as mec_perf_inclinada,
-                    MAX(p.sobre_medida_mecanizado) as sobre_medida_mecanizado,
-                    COALESCE(MAX(p.aleacion), (CASE
+                    p.family_id as family_id,
+                    p.vulcanizado_dias as vulcanizado_dias,
+                    p.mecanizado_dias as mecanizado_dias,
+                    p.inspeccion_externa_dias as inspeccion_externa_dias,
+                    p.mec_perf_inclinada as mec_perf_inclinada,
+                    p.sobre_medida_mecanizado as sobre_medida_mecanizado,
+                    COALESCE(p.aleacion, (CASE
                         WHEN substr(m.cod_material, 1, 2) = '40' AND substr(m.cod_material, 5, 2) = '00' THEN substr(m.cod_material, 3, 2)
                         WHEN substr(m.cod_material, 1, 3) = '435' AND substr(m.cod_material, 6, 1) = '0' THEN substr(m.cod_material, 4, 2)
                         WHEN substr(m.cod_material, 1, 3) = '436' AND substr(m.cod_material, 6, 1) = '0' THEN substr(m.cod_material, 4, 2)
                     END)) as aleacion,
-                    MAX(p.piezas_por_molde) as piezas_por_molde,
-                    MAX(p.peso_unitario_ton) as peso_unitario_ton,
-                    MAX(p.tiempo_enfriamiento_molde_horas) as tiempo_enfriamiento_molde_horas
+                    p.piezas_por_molde as piezas_por_molde,
+                    p.peso_unitario_ton as peso_unitario_ton,
+                    p.tiempo_enfriamiento_molde_horas as tiempo_enfriamiento_molde_horas
                 FROM core_sap_vision_snapshot m
                 LEFT JOIN core_material_master p ON p.part_code = (CASE
                     WHEN substr(m.cod_material, 1, 2) = '40' AND substr(m.cod_material, 5, 2) = '00' THEN substr(m.cod_material, 7, 5)
@@ -1310,14 +1398,16 @@ class DataRepositoryImpl:
                 """
                 SELECT DISTINCT o.material
                 FROM core_orders o
-                LEFT JOIN core_material_master p ON p.part_code = (CASE
-                    WHEN substr(o.material, 1, 2) = '40' AND substr(o.material, 5, 2) = '00' THEN substr(o.material, 7, 5)
-                    WHEN substr(o.material, 1, 4) = '4310' AND substr(o.material, 10, 2) = '01' THEN substr(o.material, 5, 5)
-                    WHEN substr(o.material, 1, 3) = '435' AND substr(o.material, 6, 1) = '0' THEN substr(o.material, 7, 5)
-                    WHEN substr(o.material, 1, 3) = '436' AND substr(o.material, 6, 1) = '0' THEN substr(o.material, 7, 5)
-                END)
                 WHERE o.process = ?
-                  AND p.part_code IS NULL
+                  AND NOT EXISTS (
+                    SELECT 1 FROM core_material_master p
+                    WHERE p.part_code = (CASE
+                        WHEN substr(o.material, 1, 2) = '40' AND substr(o.material, 5, 2) = '00' THEN substr(o.material, 7, 5)
+                        WHEN substr(o.material, 1, 4) = '4310' AND substr(o.material, 10, 2) = '01' THEN substr(o.material, 5, 5)
+                        WHEN substr(o.material, 1, 3) = '435' AND substr(o.material, 6, 1) = '0' THEN substr(o.material, 7, 5)
+                        WHEN substr(o.material, 1, 3) = '436' AND substr(o.material, 6, 1) = '0' THEN substr(o.material, 7, 5)
+                    END)
+                  )
                 ORDER BY o.material
                 """,
                 (process,),
@@ -1329,19 +1419,18 @@ class DataRepositoryImpl:
         with self.db.connect() as con:
             row = con.execute(
                 """
-                SELECT COUNT(*)
-                FROM (
-                    SELECT DISTINCT o.material
-                    FROM core_orders o
-                    LEFT JOIN core_material_master p ON p.part_code = (CASE
+                SELECT COUNT(DISTINCT o.material)
+                FROM core_orders o
+                WHERE o.process = ?
+                  AND NOT EXISTS (
+                    SELECT 1 FROM core_material_master p
+                    WHERE p.part_code = (CASE
                         WHEN substr(o.material, 1, 2) = '40' AND substr(o.material, 5, 2) = '00' THEN substr(o.material, 7, 5)
                         WHEN substr(o.material, 1, 4) = '4310' AND substr(o.material, 10, 2) = '01' THEN substr(o.material, 5, 5)
                         WHEN substr(o.material, 1, 3) = '435' AND substr(o.material, 6, 1) = '0' THEN substr(o.material, 7, 5)
                         WHEN substr(o.material, 1, 3) = '436' AND substr(o.material, 6, 1) = '0' THEN substr(o.material, 7, 5)
                     END)
-                    WHERE o.process = ?
-                      AND p.part_code IS NULL
-                )
+                  )
                 """,
                 (process,),
             ).fetchone()
@@ -1355,17 +1444,20 @@ class DataRepositoryImpl:
                 """
                 SELECT DISTINCT o.material
                 FROM core_orders o
-                JOIN core_material_master p ON p.part_code = (CASE
-                    WHEN substr(o.material, 1, 2) = '40' AND substr(o.material, 5, 2) = '00' THEN substr(o.material, 7, 5)
-                    WHEN substr(o.material, 1, 4) = '4310' AND substr(o.material, 10, 2) = '01' THEN substr(o.material, 5, 5)
-                    WHEN substr(o.material, 1, 3) = '435' AND substr(o.material, 6, 1) = '0' THEN substr(o.material, 7, 5)
-                    WHEN substr(o.material, 1, 3) = '436' AND substr(o.material, 6, 1) = '0' THEN substr(o.material, 7, 5)
-                END)
                 WHERE o.process = ?
-                  AND (
-                       p.vulcanizado_dias IS NULL
-                    OR p.mecanizado_dias IS NULL
-                    OR p.inspeccion_externa_dias IS NULL
+                  AND EXISTS (
+                    SELECT 1 FROM core_material_master p
+                    WHERE p.part_code = (CASE
+                        WHEN substr(o.material, 1, 2) = '40' AND substr(o.material, 5, 2) = '00' THEN substr(o.material, 7, 5)
+                        WHEN substr(o.material, 1, 4) = '4310' AND substr(o.material, 10, 2) = '01' THEN substr(o.material, 5, 5)
+                        WHEN substr(o.material, 1, 3) = '435' AND substr(o.material, 6, 1) = '0' THEN substr(o.material, 7, 5)
+                        WHEN substr(o.material, 1, 3) = '436' AND substr(o.material, 6, 1) = '0' THEN substr(o.material, 7, 5)
+                    END)
+                      AND (
+                           p.vulcanizado_dias IS NULL
+                        OR p.mecanizado_dias IS NULL
+                        OR p.inspeccion_externa_dias IS NULL
+                      )
                   )
                 ORDER BY o.material
                 """,
@@ -1378,23 +1470,23 @@ class DataRepositoryImpl:
         with self.db.connect() as con:
             row = con.execute(
                 """
-                SELECT COUNT(*)
-                FROM (
-                    SELECT DISTINCT o.material
-                    FROM core_orders o
-                    JOIN core_material_master p ON p.part_code = (CASE
+                SELECT COUNT(DISTINCT o.material)
+                FROM core_orders o
+                WHERE o.process = ?
+                  AND EXISTS (
+                    SELECT 1 FROM core_material_master p
+                    WHERE p.part_code = (CASE
                         WHEN substr(o.material, 1, 2) = '40' AND substr(o.material, 5, 2) = '00' THEN substr(o.material, 7, 5)
                         WHEN substr(o.material, 1, 4) = '4310' AND substr(o.material, 10, 2) = '01' THEN substr(o.material, 5, 5)
                         WHEN substr(o.material, 1, 3) = '435' AND substr(o.material, 6, 1) = '0' THEN substr(o.material, 7, 5)
                         WHEN substr(o.material, 1, 3) = '436' AND substr(o.material, 6, 1) = '0' THEN substr(o.material, 7, 5)
                     END)
-                    WHERE o.process = ?
                       AND (
                            p.vulcanizado_dias IS NULL
                         OR p.mecanizado_dias IS NULL
                         OR p.inspeccion_externa_dias IS NULL
                       )
-                )
+                  )
                 """,
                 (process,),
             ).fetchone()
@@ -1434,43 +1526,23 @@ class DataRepositoryImpl:
         with self.db.connect() as con:
             row = con.execute(
                 """
-                WITH v AS (
-                    SELECT
-                        pedido,
-                        posicion,
-                        MAX(COALESCE(cod_material, '')) AS cod_material,
-                        MAX(COALESCE(fecha_de_pedido, '')) AS fecha_de_pedido,
-                        MAX(COALESCE(solicitado, 0)) AS solicitado,
-                        MAX(COALESCE(bodega, 0)) AS bodega,
-                        MAX(COALESCE(despachado, 0)) AS despachado,
-                        MAX(peso_unitario_ton) AS peso_unitario_ton
-                    FROM core_sap_vision_snapshot
-                    -- We trust core_sap_vision_snapshot contains only valid/filtered rows (Active, date > 2023, valid families/ZTLH)
-                    GROUP BY pedido, posicion
-                ), joined AS (
+                WITH joined AS (
                     SELECT
-                        v.fecha_de_pedido AS fecha_de_pedido,
-                        CASE
-                            WHEN (v.solicitado - v.bodega - v.despachado) < 0 THEN 0
-                            ELSE (v.solicitado - v.bodega - v.despachado)
-                        END AS pendientes,
+                        -- Undated positions ('9999-12-31' in orderpos) count as overdue, as they always have
+                        COALESCE(NULLIF(v.fecha_de_pedido_max, '9999-12-31'), '') AS fecha_de_pedido,
+                        v.pendientes AS pendientes,
                         v.bodega AS bodega,
                         COALESCE(p.peso_unitario_ton, v.peso_unitario_ton, 0.0) AS peso_unitario_ton
-                    FROM v
-                    LEFT JOIN core_material_master p
-                      ON p.part_code = (CASE
-                        WHEN substr(v.cod_material, 1, 2) = '40' AND substr(v.cod_material, 5, 2) = '00' THEN substr(v.cod_material, 7, 5)
-                        WHEN substr(v.cod_material, 1, 4) = '4310' AND substr(v.cod_material, 10, 2) = '01' THEN substr(v.cod_material, 5, 5)
-                        WHEN substr(v.cod_material, 1, 3) = '435' AND substr(v.cod_material, 6, 1) = '0' THEN substr(v.cod_material, 7, 5)
-                        WHEN substr(v.cod_material, 1, 3) = '436' AND substr(v.cod_material, 6, 1) = '0' THEN substr(v.cod_material, 7, 5)
-                    END)
+                    -- We trust core_sap_vision_snapshot contains only valid/filtered rows (Active, date > 2023, valid families/ZTLH)
+                    FROM core_sap_vision_orderpos v
+                    LEFT JOIN core_material_master p ON p.part_code = v.part_code
                 )
                 SELECT
-                    COALESCE(SUM((CASE WHEN pendientes > 0 THEN pendientes ELSE 0 END) * peso_unitario_ton), 0.0) AS tons_por_entregar,
+                    COALESCE(SUM(pendientes * peso_unitario_ton), 0.0) AS tons_por_entregar,
                     COALESCE(SUM(
                         CASE WHEN fecha_de_pedido < ? THEN
-                            ((CASE WHEN pendientes > 0 THEN pendientes ELSE 0 END) * peso_unitario_ton)
-                            + ((CASE WHEN pendientes <= 0 THEN bodega ELSE 0 END) * peso_unitario_ton)
+                            (pendientes * peso_unitario_ton)
+                            + ((CASE WHEN pendientes = 0 THEN bodega ELSE 0 END) * peso_unitario_ton)
                         ELSE 0.0 END
                     ), 0.0) AS tons_atrasadas
                 FROM joined
@@ -1503,7 +1575,9 @@ class DataRepositoryImpl:
     def get_vision_kpi_daily_rows(self, *, limit: int = 120) -> list[dict]:
         lim = max(1, min(int(limit or 120), 2000))
         with self.db.connect() as con:
-            rows = con.execute(
+            cur = con.cursor()
+            cur.row_factory = None
+            rows = cur.execute(
                 """
                 SELECT snapshot_date, snapshot_at, tons_por_entregar, tons_atrasadas
                 FROM core_vision_kpi_daily
@@ -1512,85 +1586,15 @@ class DataRepositoryImpl:
                 """,
                 (lim,),
             ).fetchall()
-        return [dict(r) for r in rows]
+        return [
+            {"snapshot_date": d, "snapshot_at": at, "tons_por_entregar": por_entregar, "tons_atrasadas": atrasadas}
+            for d, at, por_entregar, atrasadas in rows
+        ]
 
     def get_orders_overdue_rows(self, *, today: date | None = None, limit: int = 200) -> list[dict]:
         """Orders with fecha_de_pedido < today across all processes."""
-        d0 = today or date.today()
         lim = max(1, min(int(limit or 200), 2000))
-        with self.db.connect() as con:
-            rows = con.execute(
-                """
-                SELECT
-                    v.pedido AS pedido,
-                    v.posicion AS posicion,
-                    COALESCE(v.cod_material, '') AS material,
-                    COALESCE(v.solicitado, 0) AS solicitado,
-                    COALESCE(v.bodega, 0) AS bodega,
-                    v.fecha_de_pedido AS fecha_de_pedido,
-                    COALESCE(v.cliente, '') AS cliente,
-                    CASE
-                        WHEN (COALESCE(v.solicitado, 0) - COALESCE(v.bodega, 0) - COALESCE(v.despachado, 0)) < 0 THEN 0
-                        ELSE (COALESCE(v.solicitado, 0) - COALESCE(v.bodega, 0) - COALESCE(v.despachado, 0))
-                    END AS pendientes,
-                    (
-                        CASE
-                            WHEN (COALESCE(v.solicitado, 0) - COALESCE(v.bodega, 0) - COALESCE(v.despachado, 0)) < 0 THEN 0
-                            ELSE (COALESCE(v.solicitado, 0) - COALESCE(v.bodega, 0) - COALESCE(v.despachado, 0))
-                        END
-                        * COALESCE(p.peso_unitario_ton, v.peso_unitario_ton, 0.0)
-                    ) AS tons,
-                    (COALESCE(v.bodega, 0) * COALESCE(p.peso_unitario_ton, v.peso_unitario_ton, 0.0)) AS tons_dispatch
-                FROM (
-                    SELECT
-                        pedido,
-                        posicion,
-                        MAX(cliente) AS cliente,
-                        MAX(cod_material) AS cod_material,
-                        MAX(COALESCE(fecha_de_pedido, '9999-12-31')) AS fecha_de_pedido,
-                        MAX(COALESCE(solicitado, 0)) AS solicitado,
-                        MAX(COALESCE(bodega, 0)) AS bodega,
-                        MAX(COALESCE(despachado, 0)) AS despachado,
-                        MAX(peso_unitario_ton) AS peso_unitario_ton
-                    FROM core_sap_vision_snapshot
-                    GROUP BY pedido, posicion
-                HAVING MAX(COALESCE(fecha_de_pedido, '9999-12-31')) < ?
-                ) v
-                LEFT JOIN core_material_master p
-                  ON p.part_code = (CASE
-                    WHEN substr(v.cod_material, 1, 2) = '40' AND substr(v.cod_material, 5, 2) = '00' THEN substr(v.cod_material, 7, 5)
-                    WHEN substr(v.cod_material, 1, 4) = '4310' AND substr(v.cod_material, 10, 2) = '01' THEN substr(v.cod_material, 5, 5)
-                    WHEN substr(v.cod_material, 1, 3) = '435' AND substr(v.cod_material, 6, 1) = '0' THEN substr(v.cod_material, 7, 5)
-                    WHEN substr(v.cod_material, 1, 3) = '436' AND substr(v.cod_material, 6, 1) = '0' THEN substr(v.cod_material, 7, 5)
-                END)
-                ORDER BY v.fecha_de_pedido ASC, v.pedido, v.posicion
-                LIMIT ?
-                """,
-                (d0.isoformat(), lim),
-            ).fetchall()
-
-        out: list[dict] = []
-        for r in rows:
-            fe = date.fromisoformat(str(r["fecha_de_pedido"]))
-            atraso = (d0 - fe).days
-            row_id = f"{r['pedido']}|{r['posicion']}"
-            out.append(
-                {
-                    "_row_id": row_id,
-                    "pedido": str(r["pedido"]),
-                    "posicion": str(r["posicion"]),
-                    "material": str(r["material"]),
-                    "solicitado": int(r["solicitado"] or 0),
-                    "bodega": int(r["bodega"] or 0),
-                    "pendientes": int(r["pendientes"] or 0),
-                    "fecha_de_pedido": fe.isoformat(),
-                    "dias": int(atraso),
-                    "cliente": str(r["cliente"] or "").strip(),
-                    "tons": float(r["tons"] or 0.0),
-                    "tons_dispatch": float(r["tons_dispatch"] or 0.0),
-                }
-            )
-        return out
+        return self._orders_by_due_date(today=today, days=0, overdue_limit=lim, due_soon_limit=0)[0]
 
     def get_orders_due_soon_rows(
         self,
@@ -1600,124 +1604,189 @@ class DataRepositoryImpl:
         limit: int = 200,
     ) -> list[dict]:
         """Orders with fecha_de_pedido between today and today+days (inclusive)."""
-        d0 = today or date.today()
-        horizon = d0.toordinal() + int(days)
-        d1 = date.fromordinal(horizon)
         lim = max(1, min(int(limit or 200), 2000))
+        return self._orders_by_due_date(today=today, days=days, overdue_limit=0, due_soon_limit=lim)[1]
+
+    def get_orders_dashboard_rows(
+        self,
+        *,
+        today: date | None = None,
+        days: int = 14,
+        overdue_limit: int = 200,
+        due_soon_limit: int = 200,
+    ) -> tuple[list[dict], list[dict]]:
+        """(overdue, due_soon) rows as the two methods above return them, in one query."""
+        return self._orders_by_due_date(
+            today=today,
+            days=days,
+            overdue_limit=max(1, min(int(overdue_limit or 200), 2000)),
+            due_soon_limit=max(1, min(int(due_soon_limit or 200), 2000)),
+        )
+
+    def _orders_by_due_date(
+        self,
+        *,
+        today: date | None,
+        days: int,
+        overdue_limit: int,
+        due_soon_limit: int,
+    ) -> tuple[list[dict], list[dict]]:
+        """Overdue (latest fecha_de_pedido < today) and due-soon (earliest one within
+        [today, today+days]) order positions; a bucket with limit 0 is not queried.
+        """
+        d0 = today or date.today()
+        d1 = date.fromordinal(d0.toordinal() + int(days))
         with self.db.connect() as con:
-            rows = con.execute(
+            cur = con.cursor()
+            cur.row_factory = None  # plain tuples: rows are unpacked positionally below
+            cur.execute(
                 """
-                WITH orderpos AS (
-                    SELECT pedido, posicion, MIN(COALESCE(fecha_de_pedido, '9999-12-31')) AS fecha_de_pedido
-                    FROM core_sap_vision_snapshot
-                    GROUP BY pedido, posicion
-                    HAVING MIN(COALESCE(fecha_de_pedido, '9999-12-31')) >= ?
-                       AND MIN(COALESCE(fecha_de_pedido, '9999-12-31')) <= ?
+                -- Each bucket walks its fecha index, whose trailing columns are the (pedido, posicion)
+                -- key, so LIMIT stops the scan early. The LEFT JOIN does not guarantee that order,
+                -- so the outer ORDER BY only sorts the (at most limit-sized) result.
+                WITH r AS (
+                    SELECT * FROM (
+                        SELECT
+                            1 AS overdue,
+                            fecha_de_pedido_max AS fecha_de_pedido,
+                            pedido, posicion, cliente, cod_material, part_code,
+                            solicitado, bodega, pendientes, peso_unitario_ton
+                        FROM core_sap_vision_orderpos
+                        WHERE fecha_de_pedido_max < :d0
+                        ORDER BY fecha_de_pedido_max, pedido, posicion
+                        LIMIT :overdue_limit
+                    )
+                    UNION ALL
+                    SELECT * FROM (
+                        SELECT
+                            0 AS overdue,
+                            fecha_de_pedido_min AS fecha_de_pedido,
+                            pedido, posicion, cliente, cod_material, part_code,
+                            solicitado, bodega, pendientes, peso_unitario_ton
+                        FROM core_sap_vision_orderpos
+                        WHERE fecha_de_pedido_min >= :d0
+                          AND fecha_de_pedido_min <= :d1
+                        ORDER BY fecha_de_pedido_min, pedido, posicion
+                        LIMIT :due_soon_limit
+                    )
                 )
                 SELECT
-                    op.pedido AS pedido,
-                    op.posicion AS posicion,
-                    COALESCE(v.cod_material, '') AS material,
-                    COALESCE(v.solicitado, 0) AS solicitado,
-                    op.fecha_de_pedido AS fecha_de_pedido,
-                    COALESCE(v.cliente, '') AS cliente,
-                    CASE
-                        WHEN (COALESCE(v.solicitado, 0) - COALESCE(v.bodega, 0) - COALESCE(v.despachado, 0)) < 0 THEN 0
-                        ELSE (COALESCE(v.solicitado, 0) - COALESCE(v.bodega, 0) - COALESCE(v.despachado, 0))
-                    END AS pendientes,
-                    (
-                        CASE
-                            WHEN (COALESCE(v.solicitado, 0) - COALESCE(v.bodega, 0) - COALESCE(v.despachado, 0)) < 0 THEN 0
-                            ELSE (COALESCE(v.solicitado, 0) - COALESCE(v.bodega, 0) - COALESCE(v.despachado, 0))
-                        END
-                        * COALESCE(p.peso_unitario_ton, v.peso_unitario_ton, 0.0)
-                    ) AS tons
-                FROM orderpos op
-                LEFT JOIN (
-                    SELECT
-                        pedido,
-                        posicion,
-                        MAX(cliente) AS cliente,
-                        MAX(cod_material) AS cod_material,
-                        MAX(COALESCE(solicitado, 0)) AS solicitado,
-                        MAX(COALESCE(bodega, 0)) AS bodega,
-                        MAX(COALESCE(despachado, 0)) AS despachado,
-                        MAX(peso_unitario_ton) AS peso_unitario_ton
-                    FROM core_sap_vision_snapshot
-                    GROUP BY pedido, posicion
-                ) v
-                  ON v.pedido = op.pedido
-                 AND v.posicion = op.posicion
-                LEFT JOIN core_material_master p
-                  ON p.part_code = (CASE
-                    WHEN substr(v.cod_material, 1, 2) = '40' AND substr(v.cod_material, 5, 2) = '00' THEN substr(v.cod_material, 7, 5)
-                    WHEN substr(v.cod_material, 1, 4) = '4310' AND substr(v.cod_material, 10, 2) = '01' THEN substr(v.cod_material, 5, 5)
-                    WHEN substr(v.cod_material, 1, 3) = '435' AND substr(v.cod_material, 6, 1) = '0' THEN substr(v.cod_material, 7, 5)
-                    WHEN substr(v.cod_material, 1, 3) = '436' AND substr(v.cod_material, 6, 1) = '0' THEN substr(v.cod_material, 7, 5)
-                END)
-                ORDER BY op.fecha_de_pedido ASC, op.pedido, op.posicion
-                LIMIT ?
+                    r.overdue AS overdue,
+                    r.pedido AS pedido,
+                    r.posicion AS posicion,
+                    COALESCE(r.cod_material, '') AS material,
+                    r.solicitado AS solicitado,
+                    r.bodega AS bodega,
+                    r.fecha_de_pedido AS fecha_de_pedido,
+                    CAST(
+                        CASE WHEN r.overdue
+                            THEN julianday(:d0) - julianday(r.fecha_de_pedido)
+                            ELSE julianday(r.fecha_de_pedido) - julianday(:d0)
+                        END AS INTEGER
+                    ) AS dias,
+                    COALESCE(r.cliente, '') AS cliente,
+                    r.pendientes AS pendientes,
+                    r.pendientes * COALESCE(p.peso_unitario_ton, r.peso_unitario_ton, 0.0) AS tons,
+                    r.bodega * COALESCE(p.peso_unitario_ton, r.peso_unitario_ton, 0.0) AS tons_dispatch
+                FROM r
+                LEFT JOIN core_material_master p ON p.part_code = r.part_code
+                ORDER BY r.overdue DESC, r.fecha_de_pedido, r.pedido, r.posicion
                 """,
-                (d0.isoformat(), d1.isoformat(), lim),
-            ).fetchall()
-
-        out: list[dict] = []
-        for r in rows:
-            fe = date.fromisoformat(str(r["fecha_de_pedido"]))
-            restantes = (fe - d0).days
-            row_id = f"{r['pedido']}|{r['posicion']}"
-            out.append(
                 {
-                    "_row_id": row_id,
-                    "pedido": str(r["pedido"]),
-                    "posicion": str(r["posicion"]),
-                    "material": str(r["material"]),
-                    "solicitado": int(r["solicitado"] or 0),
-                    "pendientes": int(r["pendientes"] or 0),
-                    "fecha_de_pedido": fe.isoformat(),
-                    "dias": int(restantes),
-                    "cliente": str(r["cliente"] or "").strip(),
-                    "tons": float(r["tons"] or 0.0),
-                }
+                    "d0": d0.isoformat(),
+                    "d1": d1.isoformat(),
+                    "overdue_limit": int(overdue_limit),
+                    "due_soon_limit": int(due_soon_limit),
+                },
             )
-        return out
+
+            # Stream the cursor into the two buckets: positional unpacking (SELECT order above).
+            # Values are used as SQLite returns them: the orderpos quantities are INTEGER NOT NULL,
+            # tons are REAL products, and pedido/posicion/material/cliente are non-NULL text.
+            overdue: list[dict] = []
+            due_soon: list[dict] = []
+            for is_overdue, pedido, posicion, material, solicitado, bodega, fecha, dias, cliente, pendientes, tons, tons_dispatch in cur:
+                if is_overdue:
+                    overdue.append(
+                        {
+                            "_row_id": f"{pedido}|{posicion}",
+                            "pedido": pedido,
+                            "posicion": posicion,
+                            "material": material,
+                            "solicitado": solicitado,
+                            "bodega": bodega,
+                            "pendientes": pendientes,
+                            "fecha_de_pedido": fecha,
+                            "dias": dias,
+                            "cliente": cliente.strip(),
+                            "tons": tons,
+                            "tons_dispatch": tons_dispatch,
+                        }
+                    )
+                else:
+                    due_soon.append(
+                        {
+                            "_row_id": f"{pedido}|{posicion}",
+                            "pedido": pedido,
+                            "posicion": posicion,
+                            "material": material,
+                            "solicitado": solicitado,
+                            "pendientes": pendientes,
+                            "fecha_de_pedido": fecha,
+                            "dias": dias,
+                            "cliente": cliente.strip(),
+                            "tons": tons,
+                        }
+                    )
+        return overdue, due_soon
 
     def get_process_load_rows(self) -> list[dict]:
         """Load summary per process/almacen: pieces + tons (tons from Vision: peso_neto/solicitado)."""
         with self.db.connect() as con:
             rows = con.execute(
                 """
+                -- Per order position first, so the distinct count is just COUNT(*) per process/almacen
+                WITH op AS (
+                    SELECT
+                        o.process AS process,
+                        o.almacen AS almacen,
+                        SUM(o.cantidad) AS piezas,
+                        SUM(o.cantidad * COALESCE(v.peso_unitario_ton, 0.0)) AS tons,
+                        SUM(CASE WHEN v.peso_unitario_ton IS NULL THEN o.cantidad ELSE 0 END) AS piezas_sin_peso
+                    FROM core_orders o
+                    LEFT JOIN core_sap_vision_snapshot v
+                      ON v.pedido = o.pedido
+                     AND v.posicion = o.posicion
+                    GROUP BY o.process, o.almacen, o.pedido, o.posicion
+                )
                 SELECT
-                    o.process AS process,
-                    o.almacen AS almacen,
-                    COALESCE(SUM(o.cantidad), 0) AS piezas,
-                    COALESCE(SUM(o.cantidad * COALESCE(v.peso_unitario_ton, 0.0)), 0.0) AS tons,
-                    COALESCE(SUM(CASE WHEN v.peso_unitario_ton IS NULL THEN o.cantidad ELSE 0 END), 0) AS piezas_sin_peso,
-                    COUNT(DISTINCT (o.pedido || '/' || o.posicion)) AS orderpos
-                FROM core_orders o
-                LEFT JOIN core_sap_vision_snapshot v
-                  ON v.pedido = o.pedido
-                 AND v.posicion = o.posicion
-                GROUP BY o.process, o.almacen
-                ORDER BY o.process, o.almacen
+                    process,
+                    almacen,
+                    COALESCE(SUM(piezas), 0) AS piezas,
+                    COALESCE(SUM(tons), 0.0) AS tons,
+                    COALESCE(SUM(piezas_sin_peso), 0) AS piezas_sin_peso,
+                    COUNT(*) AS orderpos
+                FROM op
+                GROUP BY process, almacen
+                ORDER BY process, almacen
                 """
             ).fetchall()
 
         out: list[dict] = []
         for r in rows:
-            proc = str(r["process"])
+            proc = r["process"]
             label = (self.processes.get(proc, {}) or {}).get("label", proc)
-            almacen = str(r["almacen"])
+            almacen = r["almacen"]
             out.append(
                 {
                     "_row_id": f"{proc}|{almacen}",
                     "process": proc,
                     "proceso": label,
                     "almacen": almacen,
-                    "piezas": int(r["piezas"] or 0),
-                    "tons": float(r["tons"] or 0.0),
-                    "piezas_sin_peso": int(r["piezas_sin_peso"] or 0),
-                    "orderpos": int(r["orderpos"] or 0),
+                    "piezas": r["piezas"],
+                    "tons": r["tons"],
+                    "piezas_sin_peso": r["piezas_sin_peso"],
+                    "orderpos": r["orderpos"],
                 }
             )
         return out
@@ -1872,22 +1941,34 @@ class DataRepositoryImpl:
     # continuing below...)
 
     # ---------- Count/Stats Methods ----------
+    def _cached_count(self, sql: str, params: tuple = ()) -> int:
+        """Return the ``COUNT(*)`` of ``sql``, reusing the previous value while the database is unchanged.
+
+        Counts taken inside an open transaction are not cached (see ``_cached_orderpos_set``).
+        """
+        key = (sql, params)
+        with self.db.connect() as con:
+            if con.in_transaction:
+                return int(con.execute(sql, params).fetchone()[0])
+            token = Db.change_token(con)
+            hit = self._count_cache.get(key)
+            if hit is None or hit[0] != token:
+                hit = (token, int(con.execute(sql, params).fetchone()[0]))
+                self._count_cache[key] = hit
+        return hit[1]
+
     def count_orders(self, *, process: str = "terminaciones") -> int:
         process = self._normalize_process(process)
-        with self.db.connect() as con:
-            return int(con.execute("SELECT COUNT(*) FROM core_orders WHERE process = ?", (process,)).fetchone()[0])
+        return self._cached_count("SELECT COUNT(*) FROM core_orders WHERE process = ?", (process,))
 
     def count_sap_mb52(self) -> int:
-        with self.db.connect() as con:
-            return int(con.execute("SELECT COUNT(*) FROM core_sap_mb52_snapshot").fetchone()[0])
+        return self._cached_count("SELECT COUNT(*) FROM core_sap_mb52_snapshot")
 
     def count_sap_vision(self) -> int:
-        with self.db.connect() as con:
-            return int(con.execute("SELECT COUNT(*) FROM core_sap_vision_snapshot").fetchone()[0])
+        return self._cached_count("SELECT COUNT(*) FROM core_sap_vision_snapshot")
 
     def count_sap_demolding(self) -> int:
-        with self.db.connect() as con:
-            return int(con.execute("SELECT COUNT(*) FROM core_sap_demolding_snapshot").fetchone()[0])
+        return self._cached_count("SELECT COUNT(*) FROM core_sap_demolding_snapshot")
 
     def count_usable_pieces(self, *, process: str = "terminaciones") -> int:
         process = self._normalize_process(process)
@@ -1896,23 +1977,19 @@ class DataRepositoryImpl:
         avail_sql = self._mb52_availability_predicate_sql(process=process)
         if not centro or not almacen:
             return 0
-        with self.db.connect() as con:
-            return int(
-                con.execute(
-                    f"""
-                    SELECT COUNT(*)
-                    FROM core_sap_mb52_snapshot
-                    WHERE centro = ?
-                      AND almacen = ?
-                      AND {avail_sql}
-                    """.strip(),
-                    (centro, almacen),
-                ).fetchone()[0]
-            )
+        return self._cached_count(
+            f"""
+            SELECT COUNT(*)
+            FROM core_sap_mb52_snapshot
+            WHERE centro = ?
+              AND almacen = ?
+              AND {avail_sql}
+            """.strip(),
+            (centro, almacen),
+        )
 
     def count_parts(self) -> int:
-        with self.db.connect() as con:
-            return int(con.execute("SELECT COUNT(*) FROM core_material_master").fetchone()[0])
+        return self._cached_count("SELECT COUNT(*) FROM core_material_master")
 
     # ---------- Excel Import ----------
     def import_excel_bytes(self, *, kind: str, content: bytes) -> None:
@@ -2093,56 +2170,70 @@ class DataRepositoryImpl:
         a fallback.
         """
         with self.db.connect() as con:
+            # The priority tables are tiny: read them whole and resolve the flag in Python,
+            # keeping the GROUP BY over orders x Vision free of the two lookup joins.
+            orderpos_priority = {
+                (r[0], r[1]): (r[2], r[3])
+                for r in con.execute("SELECT pedido, posicion, is_priority, kind FROM dispatcher_orderpos_priority")
+            }
+            order_priority = {
+                r[0]: r[1] for r in con.execute("SELECT pedido, is_priority FROM dispatcher_order_priority")
+            }
             rows = con.execute(
                 """
+                WITH o AS (
+                    SELECT pedido, posicion, MIN(fecha_de_pedido) AS fecha_de_pedido
+                    FROM core_orders
+                    GROUP BY pedido, posicion
+                )
                 SELECT
                     o.pedido AS pedido,
                     o.posicion AS posicion,
-                    COALESCE(opp.is_priority, op.is_priority, 0) AS is_priority,
-                    COALESCE(opp.kind, '') AS priority_kind,
-                    COALESCE(MAX(v.cliente), '') AS cliente,
-                    COALESCE(MAX(v.cod_material), '') AS cod_material,
-                    COALESCE(MAX(v.descripcion_material), '') AS descripcion_material,
-                  MIN(COALESCE(v.fecha_de_pedido, o.fecha_de_pedido)) AS fecha_de_pedido,
-                  COALESCE(MAX(v.solicitado), 0) AS solicitado,
-                  COALESCE(MAX(v.peso_neto), 0.0) AS peso_neto,
-                  COALESCE(MAX(v.bodega), 0) AS bodega,
-                  COALESCE(MAX(v.despachado), 0) AS despachado
-                FROM core_orders o
-                LEFT JOIN dispatcher_orderpos_priority opp
-                       ON opp.pedido = o.pedido AND opp.posicion = o.posicion
-                LEFT JOIN dispatcher_order_priority op
-                       ON op.pedido = o.pedido
-                LEFT JOIN core_sap_vision_snapshot v
-                       ON v.pedido = o.pedido AND v.posicion = o.posicion
-                GROUP BY o.pedido, o.posicion
-                ORDER BY COALESCE(opp.is_priority, op.is_priority, 0) DESC, fecha_de_pedido, o.pedido, o.posicion
+                    COALESCE(vo.cliente, '') AS cliente,
+                    COALESCE(vo.cod_material, '') AS cod_material,
+                    COALESCE(vo.descripcion_material, '') AS descripcion_material,
+                    COALESCE(NULLIF(vo.fecha_de_pedido_min, '9999-12-31'), o.fecha_de_pedido) AS fecha_de_pedido,
+                    COALESCE(vo.solicitado, 0) AS solicitado,
+                    COALESCE(vo.peso_neto_ton, 0.0) AS peso_neto,
+                    COALESCE(vo.bodega, 0) AS bodega,
+                    COALESCE(vo.despachado, 0) AS despachado
+                FROM o
+                LEFT JOIN core_sap_vision_orderpos vo
+                       ON vo.pedido = o.pedido AND vo.posicion = o.posicion
+                ORDER BY fecha_de_pedido, o.pedido, o.posicion
                 """
             ).fetchall()
 
         out: list[dict] = []
         for r in rows:
-            solicitado = int(r["solicitado"] or 0)
-            bodega = int(r["bodega"] or 0)
-            despachado = int(r["despachado"] or 0)
-            pendientes = solicitado - bodega - despachado
+            pedido = r["pedido"]
+            posicion = r["posicion"]
+            is_priority, priority_kind = orderpos_priority.get((pedido, posicion), (None, None))
+            if is_priority is None:
+                is_priority = order_priority.get(pedido)
+            # COALESCE'd columns come back as TEXT/INTEGER/REAL already; no per-field coercion.
+            solicitado = r["solicitado"]
+            bodega = r["bodega"]
+            despachado = r["despachado"]
             out.append(
                 {
-                    "pedido": str(r["pedido"]),
-                    "posicion": str(r["posicion"]),
-                    "is_priority": int(r["is_priority"] or 0),
-                    "priority_kind": str(r["priority_kind"] or ""),
-                    "cliente": str(r["cliente"] or ""),
-                    "cod_material": str(r["cod_material"] or ""),
-                    "descripcion_material": str(r["descripcion_material"] or ""),
-                    "fecha_de_pedido": str(r["fecha_de_pedido"] or ""),
+                    "pedido": pedido,
+                    "posicion": posicion,
+                    "is_priority": is_priority or 0,
+                    "priority_kind": priority_kind or "",
+                    "cliente": r["cliente"],
+                    "cod_material": r["cod_material"],
+                    "descripcion_material": r["descripcion_material"],
+                    "fecha_de_pedido": r["fecha_de_pedido"],
                     "solicitado": solicitado,
-                    "peso_neto": float(r["peso_neto"] or 0.0),
+                    "peso_neto": r["peso_neto"],
                     "bodega": bodega,
                     "despachado": despachado,
-                    "pendientes": int(pendientes),
+                    "pendientes": solicitado - bodega - despachado,
                 }
             )
+        # Stable sort: priority first, keeping the SQL (fecha_de_pedido, pedido, posicion) order within each flag.
+        out.sort(key=lambda d: -d["is_priority"])
         return out
 
     def set_pedido_priority(self, *, pedido: str, posicion: str, is_priority: bool) -> None:
@@ -2229,29 +2320,49 @@ class DataRepositoryImpl:
             ).fetchall()
         return [(str(r[0]), str(r[1])) for r in rows]
 
+    def _cached_orderpos_set(self, name: str, load) -> set[tuple[str, str]]:
+        """Return ``load(con)``, reusing the previous result while the database is unchanged.
+
+        The dispatcher views poll these small sets on every refresh; Db.change_token
+        moves on any write (own connection or another one), so results are never stale.
+        Reads inside an open transaction bypass the cache: a rollback undoes writes
+        without moving the token.
+        """
+        with self.db.connect() as con:
+            if con.in_transaction:
+                return set(load(con))
+            token = Db.change_token(con)
+            hit = self._orderpos_set_cache.get(name)
+            if hit is None or hit[0] != token:
+                hit = (token, frozenset(load(con)))
+                self._orderpos_set_cache[name] = hit
+        return set(hit[1])
+
     def get_priority_orderpos_set(self) -> set[tuple[str, str]]:
         """Priority keys for scheduling: (pedido, posicion).
 
         Uses `dispatcher_orderpos_priority` and also applies legacy pedido-only priority (`dispatcher_order_priority`)
         to all positions currently present in `orders`.
         """
-        with self.db.connect() as con:
-            direct = con.execute(
-                """
-                SELECT pedido, posicion
-                FROM dispatcher_orderpos_priority
-                WHERE COALESCE(is_priority, 0) = 1
-                """
-            ).fetchall()
+        return self._cached_orderpos_set("priority", self._load_priority_orderpos)
 
-            legacy = con.execute(
-                """
-                SELECT DISTINCT o.pedido, o.posicion
-                FROM core_orders o
-                INNER JOIN dispatcher_order_priority op ON op.pedido = o.pedido
-                WHERE COALESCE(op.is_priority, 0) = 1
-                """
-            ).fetchall()
+    def _load_priority_orderpos(self, con) -> set[tuple[str, str]]:
+        direct = con.execute(
+            """
+            SELECT pedido, posicion
+            FROM dispatcher_orderpos_priority
+            WHERE COALESCE(is_priority, 0) = 1
+            """
+        ).fetchall()
+
+        legacy = con.execute(
+            """
+            SELECT DISTINCT o.pedido, o.posicion
+            FROM core_orders o
+            INNER JOIN dispatcher_order_priority op ON op.pedido = o.pedido
+            WHERE COALESCE(op.is_priority, 0) = 1
+            """
+        ).fetchall()
 
         out: set[tuple[str, str]] = set()
         for r in direct:
@@ -2262,24 +2373,26 @@ class DataRepositoryImpl:
 
     def get_manual_priority_orderpos_set(self) -> set[tuple[str, str]]:
         """Manual (non-test) priorities as (pedido, posicion)."""
-        with self.db.connect() as con:
-            direct = con.execute(
-                """
-                SELECT pedido, posicion
-                FROM dispatcher_orderpos_priority
-                WHERE COALESCE(is_priority, 0) = 1
-                  AND COALESCE(kind, '') <> 'test'
-                """
-            ).fetchall()
+        return self._cached_orderpos_set("manual_priority", self._load_manual_priority_orderpos)
 
-            legacy = con.execute(
-                """
-                SELECT DISTINCT o.pedido, o.posicion
-                FROM core_orders o
-                INNER JOIN dispatcher_order_priority op ON op.pedido = o.pedido
-                WHERE COALESCE(op.is_priority, 0) = 1
-                """
-            ).fetchall()
+    def _load_manual_priority_orderpos(self, con) -> set[tuple[str, str]]:
+        direct = con.execute(
+            """
+            SELECT pedido, posicion
+            FROM dispatcher_orderpos_priority
+            WHERE COALESCE(is_priority, 0) = 1
+              AND COALESCE(kind, '') <> 'test'
+            """
+        ).fetchall()
+
+        legacy = con.execute(
+            """
+            SELECT DISTINCT o.pedido, o.posicion
+            FROM core_orders o
+            INNER JOIN dispatcher_order_priority op ON op.pedido = o.pedido
+            WHERE COALESCE(op.is_priority, 0) = 1
+            """
+        ).fetchall()
 
         out: set[tuple[str, str]] = set()
         for r in direct:
@@ -2290,37 +2403,36 @@ class DataRepositoryImpl:
 
     def get_test_orderpos_set(self) -> set[tuple[str, str]]:
         """Production test order positions (lote alfanum�rico) as (pedido, posicion)."""
+        return self._cached_orderpos_set("test", self._load_test_orderpos)
+
+    def _load_test_orderpos(self, con) -> set[tuple[str, str]]:
         centro = (self.get_config(key="sap_centro", default="4000") or "").strip()
         almacen = (self.get_config(key="sap_almacen_terminaciones", default="4035") or "").strip()
 
-        with self.db.connect() as con:
-            from_priority = con.execute(
-                """
-                SELECT pedido, posicion
-                FROM dispatcher_orderpos_priority
-                WHERE COALESCE(is_priority, 0) = 1
-                  AND COALESCE(kind, '') = 'test'
+        from_priority = con.execute(
+            """
+            SELECT pedido, posicion
+            FROM dispatcher_orderpos_priority
+            WHERE COALESCE(is_priority, 0) = 1
+              AND COALESCE(kind, '') = 'test'
+            """
+        ).fetchall()
+
+        from_mb52 = []
+        if centro and almacen:
+            from_mb52 = con.execute(
                 """
+                SELECT DISTINCT documento_comercial AS pedido, posicion_sd AS posicion
+                FROM core_sap_mb52_snapshot
+                WHERE centro = ?
+                  AND almacen = ?
+                  AND is_test = 1 AND libre_utilizacion = 1 AND en_control_calidad = 0
+                  AND documento_comercial IS NOT NULL AND TRIM(documento_comercial) <> ''
+                  AND posicion_sd IS NOT NULL AND TRIM(posicion_sd) <> ''
+                """,
+                (centro, almacen),
             ).fetchall()
 
-            from_mb52 = []
-            if centro and almacen:
-                from_mb52 = con.execute(
-                    """
-                    SELECT DISTINCT documento_comercial AS pedido, posicion_sd AS posicion
-                    FROM core_sap_mb52_snapshot
-                    WHERE centro = ?
-                      AND almacen = ?
-                      AND COALESCE(libre_utilizacion, 0) = 1
-                      AND COALESCE(en_control_calidad, 0) = 0
-                      AND lote IS NOT NULL AND TRIM(lote) <> ''
-                      AND (lote GLOB '*[A-Za-z]*')
-                      AND documento_comercial IS NOT NULL AND TRIM(documento_comercial) <> ''
-                      AND posicion_sd IS NOT NULL AND TRIM(posicion_sd) <> ''
-                    """,
-                    (centro, almacen),
-                ).fetchall()
-
         out: set[tuple[str, str]] = set()
         for r in from_priority:
             out.add((str(r[0]).strip(), str(r[1]).strip()))
@@ -2349,7 +2461,8 @@ class DataRepositoryImpl:
         if mode not in {"replace", "merge"}:
             raise ValueError(f"mode no soportado: {mode}")
 
-        df_raw = read_excel_bytes(content)
+        # Lectura en streaming (XML directo, sin workbook openpyxl).
+        df_raw = read_xlsx_streaming(content)
         df = normalize_columns(df_raw)
 
         required = {
@@ -2364,48 +2477,73 @@ class DataRepositoryImpl:
         }
         self._validate_columns(df.columns, required)
 
-        rows: list[tuple] = []
-        centro_almacen_pairs: set[tuple[str, str]] = set()
+        # Flags 0/1 vectorizados (evita to_int01 celda a celda dentro del loop).
+        df["libre_utilizacion"] = to_int01_series(df["libre_utilizacion"])
+        df["en_control_calidad"] = to_int01_series(df["en_control_calidad"])
 
-        # MB52: No prefix filtering (load all materials)
-        rows_snapshot: list[tuple] = []  # For core_sap_mb52_snapshot (v0.2 only, no legacy)
+        # MB52: No prefix filtering (load all materials). Work column-wise: filter once, then
+        # build the snapshot tuples from plain lists (no per-row Series as with iterrows).
+        materials = [str(v).strip() for v in df["material"].tolist()]
+        keep = [bool(m) for m in materials]
+        df = df.loc[keep]
+        materials = [m for m in materials if m]
+        n = len(df)
 
-        for _, r in df.iterrows():
-            material = str(r.get("material", "")).strip()
-            if not material:
-                continue
-            texto_breve = str(r.get("texto_breve_de_material", "") or r.get("texto_breve", "") or "").strip() or None
-            centro = self._normalize_sap_key(r.get("centro"))
-            almacen = self._normalize_sap_key(r.get("almacen"))
-            if centro and almacen:
-                centro_almacen_pairs.add((str(centro), str(almacen)))
-            lote = str(r.get("lote", "")).strip() or None
-            pb_almacen = float(r.get("pb_a_nivel_de_almacen", 0) or r.get("pb_almacen", 0) or 0) or None
-            libre = to_int01(r.get("libre_utilizacion"))
-            doc = self._normalize_sap_key(r.get("documento_comercial"))
-            pos = self._normalize_sap_key(r.get("posicion_sd"))
-            qc = to_int01(r.get("en_control_calidad"))
-            
-            # Derive fields for snapshot table
-            correlativo_int = self._lote_to_int(lote) if lote else None
-            is_test = 1 if (lote and self._is_lote_test(lote)) else 0
-            
-            # Snapshot table (v0.2) - includes derived fields
-            rows_snapshot.append((
+        def _column(col: str, default) -> list:
+            return df[col].tolist() if col in df.columns else [default] * n
+
+        textos = [
+            str(t or b or "").strip() or None
+            for t, b in zip(_column("texto_breve_de_material", ""), _column("texto_breve", ""))
+        ]
+        lotes = [str(v).strip() or None for v in _column("lote", "")]
+        pb_almacenes = [
+            float(a or b or 0) or None
+            for a, b in zip(_column("pb_a_nivel_de_almacen", 0), _column("pb_almacen", 0))
+        ]
+        centros = map_distinct(df["centro"], self._normalize_sap_key)
+        almacenes = map_distinct(df["almacen"], self._normalize_sap_key)
+
+        # Snapshot table (v0.2) - includes derived fields (correlativo_int, is_test)
+        rows_snapshot: list[tuple] = [
+            (
                 material, texto_breve, centro, almacen, lote, pb_almacen,
-                libre, doc, pos, qc, correlativo_int, is_test
-            ))
+                libre, doc, pos, qc,
+                self._lote_to_int(lote) if lote else None,
+                1 if (lote and self._is_lote_test(lote)) else 0,
+            )
+            for material, texto_breve, centro, almacen, lote, pb_almacen, libre, doc, pos, qc in zip(
+                materials,
+                textos,
+                centros,
+                almacenes,
+                lotes,
+                pb_almacenes,
+                df["libre_utilizacion"].tolist(),
+                map_distinct(df["documento_comercial"], self._normalize_sap_key),
+                map_distinct(df["posicion_sd"], self._normalize_sap_key),
+                df["en_control_calidad"].tolist(),
+            )
+        ]
+        centro_almacen_pairs = {(c, a) for c, a in zip(centros, almacenes) if c and a}
 
         with self.db.connect() as con:
             if mode == "replace":
                 con.execute("DELETE FROM core_sap_mb52_snapshot")
             else:
-                # Merge mode: replace only the centro/almacen subsets present in this file.
-                for c, a in sorted(centro_almacen_pairs):
-                    con.execute("DELETE FROM core_sap_mb52_snapshot WHERE centro = ? AND almacen = ?", (c, a))
+                # Merge mode: replace only the centro/almacen subsets present in this file, in one
+                # statement; each OR branch is a range on idx_mb52_availability (centro, almacen, ...).
+                pairs = sorted(centro_almacen_pairs)
+                if pairs:
+                    con.execute(
+                        "DELETE FROM core_sap_mb52_snapshot WHERE "
+                        + " OR ".join(["(centro = ? AND almacen = ?)"] * len(pairs)),
+                        [v for pair in pairs for v in pair],
+                    )
             
             # Insert into snapshot table (v0.2 only)
-            con.executemany(
+            bulk_insert(
+                con,
                 """
                 INSERT INTO core_sap_mb52_snapshot(
                     material, texto_breve, centro, almacen, lote, pb_almacen,
@@ -2490,41 +2628,12 @@ class DataRepositoryImpl:
         """
         from uuid import uuid4
         
-        # Get job_priority_map config
-        priority_map_str = self.get_config(key="job_priority_map", default='{"prueba": 1, "urgente": 2, "normal": 3}')
-        try:
-            priority_map = json.loads(priority_map_str) if isinstance(priority_map_str, str) else priority_map_str
-        except Exception:
-            priority_map = {"prueba": 1, "urgente": 2, "normal": 3}
-        
-        priority_normal = int(priority_map.get("normal", 3))
-        priority_prueba = int(priority_map.get("prueba", 1))
-        priority_urgente = int(priority_map.get("urgente", 2))
-
-        # Manual/legacy priority sets
-        manual_priority: set[tuple[str, str]] = set()
-        legacy_priority: set[str] = set()
-        try:
-            rows = con.execute(
-                """
-                SELECT pedido, posicion, COALESCE(kind, '') AS kind
-                FROM dispatcher_orderpos_priority
-                WHERE COALESCE(is_priority, 0) = 1
-                """
-            ).fetchall()
-            for r in rows:
-                if str(r["kind"] or "").strip().lower() == "test":
-                    continue
-                manual_priority.add((str(r["pedido"]).strip(), str(r["posicion"]).strip()))
-        except Exception:
-            pass
-        try:
-            rows = con.execute(
-                "SELECT pedido FROM dispatcher_order_priority WHERE COALESCE(is_priority, 0) = 1"
-            ).fetchall()
-            legacy_priority = {str(r[0]).strip() for r in rows}
-        except Exception:
-            pass
+        # Resolved once per import (not per process/order position)
+        priority_map = self._get_priority_map_values()
+        priority_normal = priority_map.get("normal", 3)
+        priority_prueba = priority_map.get("prueba", 1)
+        priority_urgente = priority_map.get("urgente", 2)
+        manual_priority, legacy_priority = self._job_priority_overrides(con)
         
         # Get all active processes
         processes = con.execute(
@@ -2546,7 +2655,9 @@ class DataRepositoryImpl:
             avail_sql = self._mb52_availability_predicate_sql(process=process_id)
             
             # Auto-split by test vs non-test lotes:
-            # create separate jobs per (pedido, posicion, material, is_test)
+            # create separate jobs per (pedido, posicion, material, is_test).
+            # One scan per process, ordered by that key; each group carries its own lotes
+            # (no second snapshot query per key).
             rows = con.execute(
                 f"""
                 SELECT 
@@ -2554,7 +2665,8 @@ class DataRepositoryImpl:
                     posicion_sd AS posicion,
                     material,
                     COALESCE(is_test, 0) AS is_test,
-                    COUNT(*) AS qty
+                    lote,
+                    correlativo_int
                 FROM core_sap_mb52_snapshot
                 WHERE centro = ?
                   AND almacen = ?
@@ -2562,17 +2674,18 @@ class DataRepositoryImpl:
                   AND documento_comercial IS NOT NULL AND TRIM(documento_comercial) <> ''
                   AND posicion_sd IS NOT NULL AND TRIM(posicion_sd) <> ''
                   AND material IS NOT NULL AND TRIM(material) <> ''
-                GROUP BY documento_comercial, posicion_sd, material, COALESCE(is_test, 0)
+                ORDER BY documento_comercial, posicion_sd, material, COALESCE(is_test, 0)
                 """,
                 (str(centro_normalized), almacen),
             ).fetchall()
             
-            for r in rows:
-                pedido = str(r["pedido"]).strip()
-                posicion = str(r["posicion"]).strip()
-                material = str(r["material"]).strip()
-                qty = int(r["qty"])
-                is_test = int(r["is_test"] or 0)
+            for key, group in groupby(rows, key=lambda r: (r[0], r[1], r[2], r[3])):
+                pedido = str(key[0]).strip()
+                posicion = str(key[1]).strip()
+                material = str(key[2]).strip()
+                is_test = int(key[3] or 0)
+                # Current MB52 lotes for this key and this test flag
+                lotes_rows = [r for r in group if r["lote"] is not None and str(r["lote"]).strip()]
                 
                 if not pedido or not posicion or not material:
                     continue
@@ -2633,23 +2746,6 @@ class DataRepositoryImpl:
                     )
                     target_job_id = new_job_id
 
-                # Get all current MB52 lotes for this key and this test flag
-                lotes_rows = con.execute(
-                    f"""
-                    SELECT lote, correlativo_int
-                    FROM core_sap_mb52_snapshot
-                    WHERE centro = ?
-                      AND almacen = ?
-                      AND documento_comercial = ?
-                      AND posicion_sd = ?
-                      AND material = ?
-                      AND COALESCE(is_test, 0) = ?
-                      AND {avail_sql}
-                      AND lote IS NOT NULL AND TRIM(lote) <> ''
-                    """,
-                    (str(centro_normalized), almacen, pedido, posicion, material, int(is_test)),
-                ).fetchall()
-                
                 # Allocation Plan: job_id -> list of (lote, corr)
                 allocations: dict[str, list[tuple[str, int | None]]] = {}
                 
@@ -2687,18 +2783,16 @@ class DataRepositoryImpl:
                     # Replace job units
                     con.execute("DELETE FROM dispatcher_job_unit WHERE job_id = ?", (job_id,))
                     
-                    for lote, corr in items:
-                        job_unit_id = f"ju_{job_id}_{uuid4().hex[:8]}"
-                        con.execute(
-                            """
-                            INSERT INTO dispatcher_job_unit(
-                                job_unit_id, job_id, lote, correlativo_int, qty, status,
-                                created_at, updated_at
-                            )
-                            VALUES(?, ?, ?, ?, 1, 'available', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-                            """,
-                            (job_unit_id, job_id, lote, corr),
+                    con.executemany(
+                        """
+                        INSERT INTO dispatcher_job_unit(
+                            job_unit_id, job_id, lote, correlativo_int, qty, status,
+                            created_at, updated_at
                         )
+                        VALUES(?, ?, ?, ?, 1, 'available', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+                        """,
+                        [(f"ju_{job_id}_{uuid4().hex[:8]}", job_id, lote, corr) for lote, corr in items],
+                    )
                         
                     updated_job_ids.add(job_id)
             
@@ -2746,7 +2840,7 @@ class DataRepositoryImpl:
 
     def import_sap_vision_bytes(self, *, content: bytes) -> None:
         """Import Vision Planta (customer order status) from Excel."""
-        df_raw = read_excel_bytes(content)
+        df_raw = read_xlsx_streaming(content)
         df = normalize_columns(df_raw)
 
         # Canonicalize column variants
@@ -2826,15 +2920,57 @@ class DataRepositoryImpl:
             logger.warning("No active alloys in catalog, falling back to default set")
             active_alloys = {'32', '33', '34', '37', '38', '42', '21', '28'}
 
+        # Fechas parseadas en bloque; lo que no calza con los formatos conocidos cae a coerce_date.
+        fechas_iso = coerce_date_series(df["fecha_de_pedido"]).tolist()
+        pesos_kg = self._float_column(df, "peso_neto")
+
+        # Column-wise: plain lists zipped below instead of a pandas Series per row (iterrows).
+        # Keys and the small integer counters repeat heavily, so they are parsed once per
+        # distinct value; the coerce_date fallback stays per row, after the earlier filters.
+        n = len(df)
+
+        def _column(col: str, default=None) -> list:
+            return df[col].tolist() if col in df.columns else [default] * n
+
+        def _int_column(col: str) -> list[int | None]:
+            return map_distinct(df[col], self._coerce_opt_int) if col in df.columns else [None] * n
+
+        stage_cols = (
+            "x_programar", "programado", "por_fundir", "desmoldeo", "tt", "terminaciones",
+            "mecanizado_interno", "mecanizado_externo", "vulcanizado", "insp_externa",
+            "en_vulcanizado", "pend_vulcanizado", "rech_insp_externa", "lib_vulcanizado_de",
+        )
+        stages = list(zip(*(_int_column(col) for col in stage_cols)))
+        has_peso_neto = "peso_neto" in df.columns
+
         rows: list[tuple] = []
-        for _, r in df.iterrows():
-            pedido = self._normalize_sap_key(r.get("pedido")) or ""
-            posicion = self._normalize_sap_key(r.get("posicion")) or ""
+        for (
+            pedido, posicion, cod_material, tipo_posicion, status_comercial, fecha_raw, fecha_iso,
+            desc, solicitado, stage_values, bodega, despachado, rechazo, peso_neto_kg, cliente, oc_cliente,
+        ) in zip(
+            map_distinct(df["pedido"], self._normalize_sap_key),
+            map_distinct(df["posicion"], self._normalize_sap_key),
+            map_distinct(df["cod_material"], self._normalize_sap_key),
+            _column("tipo_posicion", ""),
+            _column("status_comercial", ""),
+            df["fecha_de_pedido"].tolist(),
+            fechas_iso,
+            _column("descripcion_material", ""),
+            _int_column("solicitado"),
+            stages,
+            _int_column("bodega"),
+            _int_column("despachado"),
+            _int_column("rechazo"),
+            pesos_kg,
+            _column("cliente", ""),
+            _column("n_oc_cliente", ""),
+        ):
+            pedido = pedido or ""
+            posicion = posicion or ""
             if not pedido or not posicion:
                 continue
 
-            tipo_posicion = str(r.get("tipo_posicion", "") or "").strip() or None
-            cod_material = self._normalize_sap_key(r.get("cod_material"))
+            tipo_posicion = str(tipo_posicion or "").strip() or None
 
             # Filter: Only finished products (Pieza: 40XX00YYYYY) with configured alloys
             # or special ZTLH tipo_posicion
@@ -2852,70 +2988,26 @@ class DataRepositoryImpl:
             if not is_valid_mat and not is_ztlh:
                 continue
 
-            fecha_de_pedido = coerce_date(r.get("fecha_de_pedido"))
+            fecha_de_pedido = fecha_iso or coerce_date(fecha_raw)
             if not fecha_de_pedido or fecha_de_pedido <= "2023-12-31":
                 continue
 
             # Filter: Status comercial (reject only if "0" or empty)
-            status_comercial = str(r.get("status_comercial", "") or "").strip() or None
+            status_comercial = str(status_comercial or "").strip() or None
             if not status_comercial or status_comercial == "0":
                 continue
 
-            desc = str(r.get("descripcion_material", "")).strip() or None
-            solicitado = None
-            if "solicitado" in df.columns:
-                raw = r.get("solicitado")
-                try:
-                    solicitado = int(float(raw)) if raw is not None and str(raw).strip() and str(raw).strip().lower() != "nan" else None
-                except Exception:
-                    solicitado = None
-
-            def _coerce_opt_int(col: str) -> int | None:
-                if col not in df.columns:
-                    return None
-                raw = r.get(col)
-                try:
-                    return int(float(raw)) if raw is not None and str(raw).strip() and str(raw).strip().lower() != "nan" else None
-                except Exception:
-                    return None
-
-            x_programar = _coerce_opt_int("x_programar")
-            programado = _coerce_opt_int("programado")
-            por_fundir = _coerce_opt_int("por_fundir")
-            desmoldeo = _coerce_opt_int("desmoldeo")
-            tt = _coerce_opt_int("tt")
-            terminaciones = _coerce_opt_int("terminaciones")
-            mecanizado_interno = _coerce_opt_int("mecanizado_interno")
-            mecanizado_externo = _coerce_opt_int("mecanizado_externo")
-            vulcanizado = _coerce_opt_int("vulcanizado")
-            insp_externa = _coerce_opt_int("insp_externa")
-            en_vulcanizado = _coerce_opt_int("en_vulcanizado")
-            pend_vulcanizado = _coerce_opt_int("pend_vulcanizado")
-            rech_insp_externa = _coerce_opt_int("rech_insp_externa")
-            lib_vulcanizado_de = _coerce_opt_int("lib_vulcanizado_de")
-            rechazo = _coerce_opt_int("rechazo")
-
-            bodega = None
-            if "bodega" in df.columns:
-                raw = r.get("bodega")
-                try:
-                    bodega = int(float(raw)) if raw is not None and str(raw).strip() and str(raw).strip().lower() != "nan" else None
-                except Exception:
-                    bodega = None
-
-            despachado = None
-            if "despachado" in df.columns:
-                raw = r.get("despachado")
-                try:
-                    despachado = int(float(raw)) if raw is not None and str(raw).strip() and str(raw).strip().lower() != "nan" else None
-                except Exception:
-                    despachado = None
+            desc = str(desc).strip() or None
+            (
+                x_programar, programado, por_fundir, desmoldeo, tt, terminaciones,
+                mecanizado_interno, mecanizado_externo, vulcanizado, insp_externa,
+                en_vulcanizado, pend_vulcanizado, rech_insp_externa, lib_vulcanizado_de,
+            ) = stage_values
 
             # Visi�n Planta provides weights in kg; the app uses tons.
             peso_neto = None
             peso_unitario_ton = None
-            if "peso_neto" in df.columns:
-                peso_neto_kg = coerce_float(r.get("peso_neto"))
+            if has_peso_neto:
                 if peso_neto_kg is not None:
                     try:
                         peso_neto = float(peso_neto_kg) / 1000.0
@@ -2928,8 +3020,8 @@ class DataRepositoryImpl:
                     except Exception:
                         peso_unitario_ton = None
 
-            cliente = str(r.get("cliente", "")).strip() or None
-            oc_cliente = str(r.get("n_oc_cliente", "") or "").strip() or None
+            cliente = str(cliente).strip() or None
+            oc_cliente = str(oc_cliente or "").strip() or None
             rows.append(
                 (
                     pedido,
@@ -2966,7 +3058,8 @@ class DataRepositoryImpl:
 
         with self.db.connect() as con:
             con.execute("DELETE FROM core_sap_vision_snapshot")
-            con.executemany(
+            bulk_insert(
+                con,
                 """
                 INSERT INTO core_sap_vision_snapshot(
                     pedido, posicion, cod_material, descripcion_material, fecha_de_pedido,
@@ -2997,93 +3090,91 @@ class DataRepositoryImpl:
                 """
             )
 
-            # Update material weights from Vision (finished products only: 40XX00YYYYY)
+            # Master fields from Vision (finished products only: 40XX00YYYYY), taking the earliest
+            # order per part. Each UPDATE ranks Vision once with ROW_NUMBER() instead of a
+            # correlated ORDER BY ... LIMIT 1 (+ EXISTS) scan of the snapshot per part.
+
+            # Update material weights from Vision
             con.execute(
                 """
-                UPDATE core_material_master
-                SET peso_unitario_ton = COALESCE(
-                    (
-                        SELECT v.peso_unitario_ton
-                        FROM core_sap_vision_snapshot v
-                        WHERE substr(v.cod_material, 1, 2) = '40'
-                          AND substr(v.cod_material, 5, 2) = '00'
-                          AND substr(v.cod_material, 7, 5) = core_material_master.part_code
-                          AND v.peso_unitario_ton IS NOT NULL
-                          AND v.peso_unitario_ton >= 0
-                        ORDER BY v.fecha_de_pedido ASC, v.pedido ASC, v.posicion ASC
-                        LIMIT 1
-                    ),
-                    peso_unitario_ton
+                WITH ranked AS (
+                    SELECT
+                        substr(v.cod_material, 7, 5) AS part_code,
+                        v.peso_unitario_ton AS value,
+                        ROW_NUMBER() OVER (
+                            PARTITION BY substr(v.cod_material, 7, 5)
+                            ORDER BY v.fecha_de_pedido ASC, v.pedido ASC, v.posicion ASC
+                        ) AS rn
+                    FROM core_sap_vision_snapshot v
+                    WHERE substr(v.cod_material, 1, 2) = '40'
+                      AND substr(v.cod_material, 5, 2) = '00'
+                      AND v.peso_unitario_ton IS NOT NULL
+                      AND v.peso_unitario_ton >= 0
+                ),
+                first_value AS (
+                    SELECT part_code, value FROM ranked WHERE rn = 1
                 )
-                WHERE EXISTS (
-                    SELECT 1
-                    FROM core_sap_vision_snapshot v2
-                    WHERE substr(v2.cod_material, 1, 2) = '40'
-                      AND substr(v2.cod_material, 5, 2) = '00'
-                      AND substr(v2.cod_material, 7, 5) = core_material_master.part_code
-                      AND v2.peso_unitario_ton IS NOT NULL
-                      AND v2.peso_unitario_ton >= 0
+                UPDATE core_material_master
+                SET peso_unitario_ton = (
+                    SELECT f.value FROM first_value f WHERE f.part_code = core_material_master.part_code
                 )
+                WHERE part_code IN (SELECT part_code FROM first_value)
                 """
             )
 
             # Update aleacion from Vision (finished products only: 40XX00YYYYY -> extract XX)
             con.execute(
                 """
-                UPDATE core_material_master
-                SET aleacion = COALESCE(
-                    (
-                        SELECT substr(v.cod_material, 3, 2)
-                        FROM core_sap_vision_snapshot v
-                        WHERE substr(v.cod_material, 1, 2) = '40'
-                          AND substr(v.cod_material, 5, 2) = '00'
-                          AND substr(v.cod_material, 7, 5) = core_material_master.part_code
-                          AND substr(v.cod_material, 3, 2) IS NOT NULL
-                          AND TRIM(substr(v.cod_material, 3, 2)) <> ''
-                        ORDER BY v.fecha_de_pedido ASC, v.pedido ASC, v.posicion ASC
-                        LIMIT 1
-                    ),
-                    aleacion
+                WITH ranked AS (
+                    SELECT
+                        substr(v.cod_material, 7, 5) AS part_code,
+                        substr(v.cod_material, 3, 2) AS value,
+                        ROW_NUMBER() OVER (
+                            PARTITION BY substr(v.cod_material, 7, 5)
+                            ORDER BY v.fecha_de_pedido ASC, v.pedido ASC, v.posicion ASC
+                        ) AS rn
+                    FROM core_sap_vision_snapshot v
+                    WHERE substr(v.cod_material, 1, 2) = '40'
+                      AND substr(v.cod_material, 5, 2) = '00'
+                      AND substr(v.cod_material, 3, 2) IS NOT NULL
+                      AND TRIM(substr(v.cod_material, 3, 2)) <> ''
+                ),
+                first_value AS (
+                    SELECT part_code, value FROM ranked WHERE rn = 1
                 )
-                WHERE EXISTS (
-                    SELECT 1
-                    FROM core_sap_vision_snapshot v2
-                    WHERE substr(v2.cod_material, 1, 2) = '40'
-                      AND substr(v2.cod_material, 5, 2) = '00'
-                      AND substr(v2.cod_material, 7, 5) = core_material_master.part_code
-                      AND substr(v2.cod_material, 3, 2) IS NOT NULL
-                      AND TRIM(substr(v2.cod_material, 3, 2)) <> ''
+                UPDATE core_material_master
+                SET aleacion = (
+                    SELECT f.value FROM first_value f WHERE f.part_code = core_material_master.part_code
                 )
+                WHERE part_code IN (SELECT part_code FROM first_value)
                 """
             )
 
             # Update descripcion_pieza for finished products (40XX00YYYYY) from Vision
             con.execute(
                 """
-                UPDATE core_material_master
-                SET descripcion_pieza = COALESCE(
-                    (
-                        SELECT v.descripcion_material
-                        FROM core_sap_vision_snapshot v
-                        WHERE substr(v.cod_material, 1, 2) = '40'
-                          AND substr(v.cod_material, 5, 2) = '00'
-                          AND substr(v.cod_material, 7, 5) = core_material_master.part_code
-                          AND v.descripcion_material IS NOT NULL
-                          AND TRIM(v.descripcion_material) <> ''
-                        ORDER BY v.fecha_de_pedido ASC, v.pedido ASC, v.posicion ASC
-                        LIMIT 1
-                    ),
-                    descripcion_pieza
+                WITH ranked AS (
+                    SELECT
+                        substr(v.cod_material, 7, 5) AS part_code,
+                        v.descripcion_material AS value,
+                        ROW_NUMBER() OVER (
+                            PARTITION BY substr(v.cod_material, 7, 5)
+                            ORDER BY v.fecha_de_pedido ASC, v.pedido ASC, v.posicion ASC
+                        ) AS rn
+                    FROM core_sap_vision_snapshot v
+                    WHERE substr(v.cod_material, 1, 2) = '40'
+                      AND substr(v.cod_material, 5, 2) = '00'
+                      AND v.descripcion_material IS NOT NULL
+                      AND TRIM(v.descripcion_material) <> ''
+                ),
+                first_value AS (
+                    SELECT part_code, value FROM ranked WHERE rn = 1
                 )
-                WHERE EXISTS (
-                    SELECT 1
-                    FROM core_sap_vision_snapshot v2
-                    WHERE substr(v2.cod_material, 1, 2) = '40'
-                      AND substr(v2.cod_material, 5, 2) = '00'
-                      AND substr(v2.cod_material, 7, 5) = core_material_master.part_code
-                      AND v2.descripcion_material IS NOT NULL
-                      AND TRIM(v2.descripcion_material) <> ''
+                UPDATE core_material_master
+                SET descripcion_pieza = (
+                    SELECT f.value FROM first_value f WHERE f.part_code = core_material_master.part_code
                 )
+                WHERE part_code IN (SELECT part_code FROM first_value)
                 """
             )
 
@@ -3133,7 +3224,16 @@ class DataRepositoryImpl:
         piezas_rows: list[tuple] = []  # Completed (with demolding_date)
         snapshot_rows: list[tuple] = []  # Raw snapshot rows for compatibility
         
-        for _, r in df.iterrows():
+        none_dates = [None] * len(df)
+        demolding_iso = coerce_date_series(df["demolding_date"]).tolist() if "demolding_date" in df.columns else none_dates
+        poured_iso = coerce_date_series(df["poured_date"]).tolist() if "poured_date" in df.columns else none_dates
+
+        cooling_values = self._float_column(df, "cooling_hours")
+        mold_qty_values = self._float_column(df, "mold_quantity")
+
+        for (_, r), demolding_date_iso, poured_date_iso, cooling_hours, mold_qty in zip(
+            df.iterrows(), demolding_iso, poured_iso, cooling_values, mold_qty_values
+        ):
             material_raw = str(r.get("material", "")).strip()  # "Pieza" column
             tipo_pieza_raw = str(r.get("tipo_pieza", "")).strip()  # "Tipo pieza" column
             lote = str(r.get("lote", "")).strip()
@@ -3142,12 +3242,11 @@ class DataRepositoryImpl:
             cancha_raw = str(r.get("cancha", "")).strip()
             demolding_date_raw = r.get("demolding_date")
             demolding_time = str(r.get("demolding_time", "")).strip() or None
-            cooling_hours = coerce_float(r.get("cooling_hours")) or None
+            cooling_hours = cooling_hours or None
             mold_type = str(r.get("mold_type", "")).strip() or None
             poured_date_raw = r.get("poured_date")
             poured_time = str(r.get("poured_time", "")).strip() or None
             # mold_quantity es la fracción de caja que usa UNA pieza (inverso de piezas_por_molde)
-            mold_qty = coerce_float(r.get("mold_quantity"))
             if mold_qty is None or mold_qty <= 0:
                 mold_qty = 1.0  # Default: 1 pieza = 1 caja completa
 
@@ -3158,10 +3257,10 @@ class DataRepositoryImpl:
 
             # Try to parse demolding_date (handles None, NaN, NaT, empty strings)
             import pandas as pd
-            demolding_date = None
+            demolding_date = demolding_date_iso
             demolding_date_str = str(demolding_date_raw).strip().upper() if demolding_date_raw else ""
             # Check if it's a valid date (not NaT, NaN, None, empty, or "NAN"/"NAT")
-            if demolding_date_str and demolding_date_str not in ("", "NAN", "NAT", "NONE"):
+            if demolding_date is None and demolding_date_str and demolding_date_str not in ("", "NAN", "NAT", "NONE"):
                 try:
                     if not pd.isna(demolding_date_raw):
                         demolding_date = coerce_date(demolding_date_raw)
@@ -3169,9 +3268,9 @@ class DataRepositoryImpl:
                     demolding_date = None
             
             # Try to parse poured_date
-            poured_date = None
+            poured_date = poured_date_iso
             poured_date_str = str(poured_date_raw).strip().upper() if poured_date_raw else ""
-            if poured_date_str and poured_date_str not in ("", "NAN", "NAT", "NONE"):
+            if poured_date is None and poured_date_str and poured_date_str not in ("", "NAN", "NAT", "NONE"):
                 try:
                     if not pd.isna(poured_date_raw):
                         poured_date = coerce_date(poured_date_raw)
@@ -3260,7 +3359,8 @@ class DataRepositoryImpl:
             
             # Insert WIP molds (no demolding_date)
             if moldes_rows:
-                con.executemany(
+                bulk_insert(
+                    con,
                     """
                     INSERT INTO core_moldes_por_fundir(
                         material, part_code, tipo_pieza, lote, flask_id, cancha,
@@ -3273,7 +3373,8 @@ class DataRepositoryImpl:
             
             # Insert completed pieces (with demolding_date)
             if piezas_rows:
-                con.executemany(
+                bulk_insert(
+                    con,
                     """
                     INSERT INTO core_piezas_fundidas(
                         material, part_code, tipo_pieza, lote, flask_id, cancha, demolding_date, demolding_time,
@@ -3285,7 +3386,8 @@ class DataRepositoryImpl:
                 )
 
             if snapshot_rows:
-                con.executemany(
+                bulk_insert(
+                    con,
                     """
                     INSERT INTO core_sap_demolding_snapshot(
                         material, lote, flask_id, cancha, demolding_date, demolding_time,
@@ -3442,10 +3544,16 @@ class DataRepositoryImpl:
             raise ValueError(f"Config faltante: {self.processes[process]['almacen_key']}")
 
         with self.db.connect() as con:
+            # Write lock up front: the MB52/Visión reads and the DELETE + bulk insert see one
+            # snapshot (no import can commit in between) and the read->write upgrade cannot fail.
+            if not con.in_transaction:
+                con.execute("BEGIN IMMEDIATE")
             mb_rows = con.execute(
                                 f"""
                                 SELECT COALESCE(m.material_base, v.cod_material, m.material) AS material,
-                                             m.documento_comercial, m.posicion_sd, m.lote
+                                             m.documento_comercial, m.posicion_sd, m.lote,
+                                             m.correlativo_int, m.is_test,
+                                             v.snapshot_id, v.fecha_de_pedido, v.cliente
                                 FROM core_sap_mb52_snapshot m
                                 LEFT JOIN core_sap_vision_snapshot v
                                     ON v.pedido = m.documento_comercial
@@ -3465,20 +3573,12 @@ class DataRepositoryImpl:
                 con.execute("DELETE FROM dispatcher_last_program WHERE process = ?", (process,))
                 return 0
 
-            # Vision lookup
-            vision_rows = con.execute(
-                "SELECT pedido, posicion, fecha_de_pedido, cod_material, cliente FROM core_sap_vision_snapshot"
-            ).fetchall()
-            vision_by_key: dict[tuple[str, str], tuple[str, str | None, str | None]] = {}
-            for r in vision_rows:
-                vision_by_key[(str(r[0]).strip(), str(r[1]).strip())] = (
-                    str(r[2]).strip(),
-                    (str(r[3]).strip() if r[3] is not None else None),
-                    (str(r[4]).strip() if r[4] is not None else None)
-                )
-
-        # Group pieces
-        pieces: dict[tuple[str, str, str, int], set[str]] = {}
+        # Group pieces: lote -> correlativo. correlativo_int/is_test were derived from the lote
+        # at MB52 import (_lote_to_int/_is_lote_test), so no per-row parsing here.
+        pieces: dict[tuple[str, str, str, int], dict[str, int]] = {}
+        # Visión fields come through the LEFT JOIN above (no separate full-snapshot read); with
+        # repeated Visión rows for a key, the last loaded one (highest snapshot_id) wins.
+        vision_by_key: dict[tuple[str, str], tuple[int, str, str | None]] = {}
         auto_priority_orderpos: set[tuple[str, str]] = set()
         missing_vision: set[tuple[str, str]] = set()
         bad_lotes: list[str] = []
@@ -3488,25 +3588,32 @@ class DataRepositoryImpl:
             posicion = str(r[2]).strip()
             lote_raw = r[3]
             key = (pedido, posicion)
-            if key not in vision_by_key:
+            vision_id = r[6]
+            if vision_id is None:
                 missing_vision.add(key)
                 continue
+            seen = vision_by_key.get(key)
+            if seen is None or vision_id > seen[0]:
+                vision_by_key[key] = (
+                    vision_id,
+                    str(r[7]).strip(),
+                    (str(r[8]).strip() if r[8] is not None else None),
+                )
             lote_s = str(lote_raw).strip()
             if not lote_s:
                 continue
 
-            is_test = 1 if re.search(r"[A-Za-z]", lote_s) else 0
+            is_test = 1 if r[5] else 0
             if is_test:
                 auto_priority_orderpos.add((pedido, posicion))
 
-            try:
-                _ = self._lote_to_int(lote_s)
-            except Exception:
+            corr = r[4] if r[4] is not None else self._lote_to_int(lote_s)
+            if corr is None:
                 if len(bad_lotes) < 20:
                     bad_lotes.append(str(lote_raw))
                 continue
 
-            pieces.setdefault((pedido, posicion, material, is_test), set()).add(lote_s)
+            pieces.setdefault((pedido, posicion, material, is_test), {})[lote_s] = corr
 
         if bad_lotes:
             raise ValueError(
@@ -3541,23 +3648,23 @@ class DataRepositoryImpl:
         
         # tiempo_proceso_min is legacy field (not used by dispatcher or planner), always NULL
         for (pedido, posicion, material, is_test), lotes in pieces.items():
-            fecha_pedido_iso, _, cliente = vision_by_key[(pedido, posicion)]
+            _, fecha_pedido_iso, cliente = vision_by_key[(pedido, posicion)]
             cantidad = int(len(lotes))
-            lote_ints = [self._lote_to_int(ls) for ls in lotes]
-            corr_inicio = int(min(lote_ints))
-            corr_fin = int(max(lote_ints))
+            corr_inicio = int(min(lotes.values()))
+            corr_fin = int(max(lotes.values()))
             order_rows.append((pedido, posicion, material, cantidad, fecha_pedido_iso, corr_inicio, corr_fin, None, int(is_test), cliente))
 
         order_rows.sort(key=lambda t: (t[4], t[0], t[1], -int(t[8] or 0), t[2]))
 
         with self.db.connect() as con:
             con.execute("DELETE FROM core_orders WHERE process = ?", (process,))
-            con.executemany(
+            bulk_insert(
+                con,
                 """
                 INSERT INTO core_orders(process, almacen, pedido, posicion, material, cantidad, fecha_de_pedido, primer_correlativo, ultimo_correlativo, tiempo_proceso_min, is_test, cliente)
                 VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """,
-                [(process, almacen, *row) for row in order_rows],
+                ((process, almacen, *row) for row in order_rows),
             )
 
             if auto_priority_orderpos:
@@ -3579,35 +3686,12 @@ class DataRepositoryImpl:
             prio_normal = prio_vals.get("normal", 3)
             prio_urgente = prio_vals.get("urgente", 2)
             prio_prueba = prio_vals.get("prueba", 1)
-
-            manual_priority: set[tuple[str, str]] = set()
-            legacy_priority: set[str] = set()
-            try:
-                rows = con.execute(
-                    """
-                    SELECT pedido, posicion, COALESCE(kind, '') AS kind
-                    FROM dispatcher_orderpos_priority
-                    WHERE COALESCE(is_priority, 0) = 1
-                    """
-                ).fetchall()
-                for r in rows:
-                    if str(r["kind"] or "").strip().lower() == "test":
-                        continue
-                    manual_priority.add((str(r["pedido"]).strip(), str(r["posicion"]).strip()))
-            except Exception:
-                pass
-            try:
-                rows = con.execute(
-                    "SELECT pedido FROM dispatcher_order_priority WHERE COALESCE(is_priority, 0) = 1"
-                ).fetchall()
-                legacy_priority = {str(r[0]).strip() for r in rows}
-            except Exception:
-                pass
+            manual_priority, legacy_priority = self._job_priority_overrides(con)
 
             for row in order_rows:
                 key = (row[0], row[1], int(row[8]))
                 
-                lotes_set = pieces.get((row[0], row[1], row[2], int(row[8])), set())
+                lote_corrs = pieces.get((row[0], row[1], row[2], int(row[8])), {})
                 is_test_flag = int(row[8])
                 is_manual_priority = (row[0], row[1]) in manual_priority or row[0] in legacy_priority
                 prio = prio_prueba if is_test_flag else (prio_urgente if is_manual_priority else prio_normal)
@@ -3630,19 +3714,17 @@ class DataRepositoryImpl:
 
                 # Sync job_unit
                 con.execute("DELETE FROM dispatcher_job_unit WHERE job_id = ?", (jid,))
-                for lote in sorted(lotes_set):
-                    try:
-                        corr = self._lote_to_int(lote)
-                    except Exception:
-                        corr = None
-                    ju_id = f"ju_{jid}_{uuid4().hex[:8]}"
-                    con.execute(
-                        """
-                        INSERT INTO dispatcher_job_unit(job_unit_id, job_id, lote, correlativo_int, qty, status, created_at, updated_at)
-                        VALUES(?, ?, ?, ?, 1, 'available', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-                        """,
-                        (ju_id, jid, str(lote), corr),
-                    )
+                unit_rows = [
+                    (f"ju_{jid}_{uuid4().hex[:8]}", jid, str(lote), lote_corrs[lote])
+                    for lote in sorted(lote_corrs)
+                ]
+                con.executemany(
+                    """
+                    INSERT INTO dispatcher_job_unit(job_unit_id, job_id, lote, correlativo_int, qty, status, created_at, updated_at)
+                    VALUES(?, ?, ?, ?, 1, 'available', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+                    """,
+                    unit_rows,
+                )
 
             # Delete obsolete jobs
             to_del = [jid for jid in existing_map.values() if jid not in seen_existing_ids]
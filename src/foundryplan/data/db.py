@@ -1,10 +1,15 @@
 from __future__ import annotations
 
+from collections.abc import Callable, Iterable
 from contextlib import contextmanager
+from itertools import islice
 from pathlib import Path
+import re
 import sqlite3
+import threading
 
 from foundryplan.data.schema import (
+    SCHEMA_VERSION,
     ensure_data_schema,
     ensure_dispatcher_schema,
     ensure_planner_schema,
@@ -12,37 +17,246 @@ from foundryplan.data.schema import (
 )
 
 
+# Per-connection tuning for read-heavy work: 64 MB page cache, in-memory temp
+# b-trees for GROUP BY/ORDER BY spills, and 256 MB of memory-mapped I/O for the
+# large snapshot scans. These settings do not persist in the database file.
+_TUNING_PRAGMAS = (
+    "PRAGMA cache_size=-65536;",
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA mmap_size=268435456;",
+)
+
+# Read/write connections: under WAL, synchronous=NORMAL drops the fsync on each
+# commit (durability is still guaranteed at checkpoint).
+_CONNECTION_PRAGMAS = ("PRAGMA synchronous=NORMAL;", *_TUNING_PRAGMAS)
+
+# Connections are long-lived (one per thread), so sqlite3's per-connection LRU of
+# prepared statements can hold every recurring query; the default is 128.
+_CACHED_STATEMENTS = 256
+
+
+# Trailing single-row VALUES(...) clause of an INSERT, expanded to multi-row VALUES by bulk_insert.
+_VALUES_TUPLE_RE = re.compile(r"\bVALUES\s*(\([^()]*\))\s*;?\s*$", re.IGNORECASE)
+
+
+def bulk_insert(con: sqlite3.Connection, sql: str, rows: Iterable[tuple], *, batch_size: int = 10_000) -> int:
+    """Bulk-load ``rows`` in batches, inside one transaction.
+
+    ``rows`` may be a generator: it is consumed ``batch_size`` rows at a time, so
+    large imports never build the full parameter list. A plain
+    ``INSERT ... VALUES(?, ...)`` is run as multi-row ``VALUES (...), (...)``
+    statements (one statement per batch instead of one per row), with the batch
+    capped so it stays under the connection's bound-variable limit; any other
+    statement shape falls back to ``executemany``. Opens ``BEGIN IMMEDIATE`` if
+    the connection is not already in a transaction (taking the write lock up
+    front); commit is left to the enclosing ``Db.connect()`` block.
+    Returns the number of rows inserted.
+    """
+    if not con.in_transaction:
+        con.execute("BEGIN IMMEDIATE")
+    m = _VALUES_TUPLE_RE.search(sql)
+    n_cols = m.group(1).count("?") if m else 0
+    if n_cols:
+        max_vars = con.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+        batch_size = max(1, min(batch_size, max_vars // n_cols))
+        head = sql[: m.start(1)]
+    total = 0
+    it = iter(rows)
+    while batch := list(islice(it, batch_size)):
+        if n_cols:
+            if any(len(row) != n_cols for row in batch):
+                raise sqlite3.ProgrammingError(f"bulk_insert: every row must have {n_cols} values")
+            con.execute(
+                head + ", ".join([m.group(1)] * len(batch)),
+                [v for row in batch for v in row],
+            )
+        else:
+            con.executemany(sql, batch)
+        total += len(batch)
+    return total
+
+
 class Db:
     def __init__(self, path: Path):
         self.path = path
         self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        # Every cached connection, whichever thread opened it (e.g. asyncio.to_thread
+        # workers), so close() can release them all; bumping the generation makes the
+        # other threads open fresh ones afterwards.
+        self._registry_lock = threading.Lock()
+        self._connections: list[sqlite3.Connection] = []
+        self._generation = 0
+
+    def _open(self, pragmas: Iterable[str]) -> sqlite3.Connection:
+        # check_same_thread=False only so close() may close it from another thread;
+        # each connection is still used by the thread that opened it.
+        con = sqlite3.connect(
+            self.path, timeout=20.0, cached_statements=_CACHED_STATEMENTS, check_same_thread=False
+        )
+        con.row_factory = sqlite3.Row
+        for pragma in pragmas:
+            con.execute(pragma)
+        with self._registry_lock:
+            self._connections.append(con)
+        return con
+
+    def _thread_state(self) -> threading.local:
+        local = self._local
+        if getattr(local, "generation", None) != self._generation:
+            local.rw = None
+            local.con = None
+            local.depth = 0
+            local.after_commit = []
+            local.generation = self._generation
+        return local
 
     @contextmanager
     def connect(self):
-        con = sqlite3.connect(self.path, timeout=20.0)
-        con.row_factory = sqlite3.Row
+        """Yield the per-thread read/write connection, committing on success.
+
+        The connection is opened once per thread and kept until ``close()``, so
+        SQLite's page cache and the per-connection PRAGMAs survive between calls.
+        Nested ``connect()`` blocks (e.g. ``get_config`` inside an import) share
+        the outer transaction through a SAVEPOINT: an exception in a nested block
+        rolls back only that block, but its writes become durable only when the
+        outermost block commits, and are rolled back with it if it fails.
+        Callers must not ``commit()`` inside a block.
+        """
+        local = self._thread_state()
+        con = local.rw
+        if con is None:
+            con = local.rw = self._open(_CONNECTION_PRAGMAS)
+
+        depth = local.depth
+        savepoint = f"nested_{depth}"
+        if depth:
+            con.execute(f"SAVEPOINT {savepoint}")
+        local.depth = depth + 1
+        pending = len(local.after_commit)
         try:
             yield con
-            con.commit()
+            if not depth:
+                con.commit()
+            elif con.in_transaction:
+                con.execute(f"RELEASE {savepoint}")
         except Exception:
-            con.rollback()
+            del local.after_commit[pending:]
+            if not depth:
+                con.rollback()
+            elif con.in_transaction:
+                con.execute(f"ROLLBACK TO {savepoint}")
+                con.execute(f"RELEASE {savepoint}")
             raise
         finally:
+            local.depth = depth
+        if not depth:
+            callbacks, local.after_commit = local.after_commit, []
+            for fn in callbacks:
+                fn()
+
+    def after_commit(self, fn: Callable[[], None]) -> None:
+        """Call ``fn`` once the current thread's outermost ``connect()`` block commits.
+
+        Runs immediately outside a block; dropped if the enclosing block (or the
+        nested block that registered it) rolls back. For in-memory caches that must
+        only reflect durable writes.
+        """
+        local = self._thread_state()
+        if local.depth:
+            local.after_commit.append(fn)
+        else:
+            fn()
+
+    @staticmethod
+    def change_token(con: sqlite3.Connection) -> tuple[int, int, int]:
+        """A value that differs whenever data visible to ``con`` may have changed.
+
+        Covers the connection's own writes (``total_changes``) and commits made
+        through any other connection (``PRAGMA data_version``); for caching small
+        derived reads without tracking every writer.
+        """
+        return (id(con), con.total_changes, con.execute("PRAGMA data_version").fetchone()[0])
+
+    def close(self) -> None:
+        """Close the cached connections of every thread (e.g. on app shutdown).
+
+        Threads that use the Db again afterwards open new connections.
+        """
+        with self._registry_lock:
+            connections, self._connections = self._connections, []
+            self._generation += 1
+        for con in connections:
             con.close()
+        self._thread_state()
+
+    @contextmanager
+    def shared_conn(self):
+        """Yield a per-thread cached connection for read-only paths.
+
+        Pages that issue several reads in a row (e.g. the saved planner result plus
+        its calendar/orders/parts) reuse one open handle instead of paying
+        sqlite3_open + setup on every call. The connection is ``query_only``;
+        with the WAL journal set up by ``ensure_schema`` its reads never wait on
+        (or block) a concurrent writer such as a planner run.
+        """
+        local = self._thread_state()
+        con = local.con
+        if con is None:
+            con = local.con = self._open((*_TUNING_PRAGMAS, "PRAGMA query_only=1;"))
+        try:
+            yield con
+        finally:
+            if con.in_transaction:
+                con.rollback()
 
     def ensure_schema(self) -> None:
         con = sqlite3.connect(self.path, timeout=10.0)
         try:
-            con.execute("PRAGMA journal_mode=WAL;")
-            con.execute("PRAGMA foreign_keys=ON;")
+            # journal_mode=WAL is persistent: only switch when the file is not WAL yet.
+            if str(con.execute("PRAGMA journal_mode;").fetchone()[0]).lower() != "wal":
+                con.execute("PRAGMA journal_mode=WAL;")
+            if self._schema_version(con) != SCHEMA_VERSION:
+                self._apply_schema(con)
+            # Refresh planner statistics (sqlite_stat1) for tables that need it
+            con.execute("PRAGMA optimize;")
+        finally:
+            con.close()
 
+    @staticmethod
+    def _apply_schema(con: sqlite3.Connection) -> None:
+        """Run every DDL, migration and seed, then record ``SCHEMA_VERSION``."""
+        con.execute("PRAGMA foreign_keys=ON;")
+        for pragma in _TUNING_PRAGMAS:
+            con.execute(pragma)
+
+        # All DDL, migrations and seeds commit once (one WAL commit at startup).
+        con.execute("BEGIN IMMEDIATE;")
+        try:
             ensure_data_schema(con)
             seed_alloy_catalog(con)
             ensure_dispatcher_schema(con)
             ensure_planner_schema(con)
-        finally:
-            con.commit()
-            con.close()
+            con.execute(
+                "INSERT OR REPLACE INTO core_config(config_key, config_value) VALUES('schema_version', ?)",
+                (str(SCHEMA_VERSION),),
+            )
+        except Exception:
+            con.rollback()
+            raise
+        con.commit()
+
+    @staticmethod
+    def _schema_version(con: sqlite3.Connection) -> int | None:
+        """Schema version recorded by the last successful ``ensure_schema`` (None if unknown)."""
+        try:
+            row = con.execute("SELECT config_value FROM core_config WHERE config_key = 'schema_version'").fetchone()
+        except sqlite3.OperationalError:  # fresh file: core_config does not exist yet
+            return None
+        try:
+            return int(row[0]) if row else None
+        except (TypeError, ValueError):
+            return None
 
     def _table_exists(self, con: sqlite3.Connection, table_name: str) -> bool:
         row = con.execute(
@@ -1,69 +1,346 @@
 from __future__ import annotations
 
+import importlib.util
 import io
+import math
+import posixpath
 import re
 import unicodedata
-from datetime import datetime
+import zipfile
+from collections.abc import Iterator
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from xml.etree import ElementTree as ET
 
+import numpy as np
 import pandas as pd
+from pandas.io.parsers import TextParser
+
+_WS_RE = re.compile(r"[\s\t]+")
+_NONALNUM_RE = re.compile(r"[^a-z0-9 ]+")
+_WS_COLLAPSE_RE = re.compile(r"\s+")
+
+# python-calamine (Rust) parsea XLSX en streaming; si no está instalado, openpyxl
+# (pandas ya lo abre en modo read_only/data_only).
+_EXCEL_ENGINE = "calamine" if importlib.util.find_spec("python_calamine") is not None else "openpyxl"
+
+# str.translate table dropping every BMP combining mark (~700 codepoints, built in
+# a few ms at import). Non-BMP marks are rare and handled by a per-char fallback.
+_COMBINING_TABLE = {cp: None for cp in range(0x10000) if unicodedata.combining(chr(cp))}
+
+_TRUTHY = frozenset({"1", "true", "si", "sí", "x"})
+_FALSY = frozenset({"0", "false", "no", ""})
+_INT01_MAP = {**dict.fromkeys(_TRUTHY, 1), **dict.fromkeys(_FALSY, 0)}
 
 
 def read_excel_bytes(content: bytes) -> pd.DataFrame:
     """Read .xlsx bytes into a DataFrame.
 
-    v1: reads first sheet.
+    v1: reads first sheet. Uses the calamine engine when available.
     """
     bio = io.BytesIO(content)
-    df = pd.read_excel(bio)
+    df = pd.read_excel(bio, engine=_EXCEL_ENGINE)
     # normalize column names
     df.columns = [str(c).strip() for c in df.columns]
     return df
 
 
+_NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_NS_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+_CELL_REF_RE = re.compile(r"([A-Z]+)")
+
+# Date detection as in openpyxl: built-in date/time numFmt ids, or a custom format code
+# with d/m/y/h/s outside quoted literals and [locale]/[color] blocks. [h]/[mm]/[ss]
+# codes are durations (timedelta). Serials count from 1899-12-30 (or 1904-01-01).
+_BUILTIN_DATE_FMT_IDS = frozenset({14, 15, 16, 17, 18, 19, 20, 21, 22, 45, 46, 47})
+_BUILTIN_TIMEDELTA_FMT_IDS = frozenset({46})
+_FMT_STRIP_RE = re.compile(r'".*?"|\[(?!hh?\]|mm?\]|ss?\])[^\]]*\]')
+_FMT_DATE_RE = re.compile(r"(?<![_\\])[dmhysDMHYS]")
+_FMT_TIMEDELTA_RE = re.compile(r"\[hh?\](:mm(:ss(\.0*)?)?)?|\[mm?\](:ss(\.0*)?)?|\[ss?\](\.0*)?", re.I)
+_EPOCH_1900 = datetime(1899, 12, 30)
+_EPOCH_1904 = datetime(1904, 1, 1)
+
+
+def _col_index(ref: str) -> int:
+    m = _CELL_REF_RE.match(ref)
+    idx = 0
+    for ch in m.group(1) if m else "":
+        idx = idx * 26 + (ord(ch) - 64)
+    return idx - 1
+
+
+def _first_sheet_path(zf: zipfile.ZipFile) -> str:
+    wb = ET.fromstring(zf.read("xl/workbook.xml"))
+    sheet = wb.find(f"{_NS_MAIN}sheets/{_NS_MAIN}sheet")
+    if sheet is None:
+        raise ValueError("El archivo Excel no tiene hojas")
+    rid = sheet.get(f"{_NS_REL}id")
+    rels = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+    for rel in rels.iter(f"{_NS_PKG_REL}Relationship"):
+        if rel.get("Id") == rid:
+            target = rel.get("Target", "")
+            if target.startswith("/"):
+                return target.lstrip("/")
+            return posixpath.normpath(posixpath.join("xl", target))
+    return "xl/worksheets/sheet1.xml"
+
+
+def _shared_strings(zf: zipfile.ZipFile) -> list[str]:
+    try:
+        raw = zf.open("xl/sharedStrings.xml")
+    except KeyError:
+        return []
+    out: list[str] = []
+    with raw:
+        for _, el in ET.iterparse(raw, events=("end",)):
+            if el.tag != f"{_NS_MAIN}si":
+                continue
+            # Texto plano (<t>) o rich text (<r><t>); se ignoran las lecturas fonéticas (<rPh>).
+            parts = [t.text or "" for t in el.findall(f"{_NS_MAIN}t")]
+            parts += [t.text or "" for t in el.findall(f"{_NS_MAIN}r/{_NS_MAIN}t")]
+            out.append("".join(parts))
+            el.clear()
+    return out
+
+
+def _date_styles(zf: zipfile.ZipFile) -> tuple[frozenset[str], frozenset[str]]:
+    """Cell style indices (the ``s`` attribute) formatted as dates, and the duration subset."""
+    try:
+        root = ET.fromstring(zf.read("xl/styles.xml"))
+    except KeyError:
+        return frozenset(), frozenset()
+    custom = {
+        int(f.get("numFmtId", "-1")): f.get("formatCode", "")
+        for f in root.iterfind(f"{_NS_MAIN}numFmts/{_NS_MAIN}numFmt")
+    }
+    dates: set[str] = set()
+    durations: set[str] = set()
+    for i, xf in enumerate(root.iterfind(f"{_NS_MAIN}cellXfs/{_NS_MAIN}xf")):
+        fmt_id = int(xf.get("numFmtId", "0"))
+        code = custom.get(fmt_id)
+        if code is None:
+            is_date = fmt_id in _BUILTIN_DATE_FMT_IDS
+            is_duration = fmt_id in _BUILTIN_TIMEDELTA_FMT_IDS
+        else:
+            first = code.split(";")[0]
+            is_date = _FMT_DATE_RE.search(_FMT_STRIP_RE.sub("", first)) is not None
+            is_duration = _FMT_TIMEDELTA_RE.match(first) is not None
+        if is_date:
+            dates.add(str(i))
+        if is_duration:
+            durations.add(str(i))
+    return frozenset(dates), frozenset(durations)
+
+
+def _uses_1904_epoch(zf: zipfile.ZipFile) -> bool:
+    pr = ET.fromstring(zf.read("xl/workbook.xml")).find(f"{_NS_MAIN}workbookPr")
+    return pr is not None and pr.get("date1904", "0").lower() in ("1", "true")
+
+
+def _from_excel_serial(value: float, *, epoch: datetime, duration: bool):
+    """Excel serial -> datetime (time for a bare fraction, timedelta for durations), like openpyxl."""
+    if duration:
+        td = timedelta(days=value)
+        if td.microseconds:
+            td = timedelta(seconds=td.total_seconds() // 1, microseconds=round(td.microseconds, -3))
+        return td
+    day, fraction = divmod(value, 1)
+    diff = timedelta(milliseconds=round(fraction * 86_400_000))
+    if 0 <= value < 1 and diff.days == 0:
+        return (datetime.min + diff).time()
+    if 0 < value < 60 and epoch == _EPOCH_1900:
+        day += 1  # Excel's phantom 1900-02-29
+    return epoch + timedelta(days=day) + diff
+
+
+def _cell_value(
+    c: ET.Element,
+    shared: list[str],
+    date_styles: frozenset[str] = frozenset(),
+    duration_styles: frozenset[str] = frozenset(),
+    epoch: datetime = _EPOCH_1900,
+):
+    t = c.get("t", "n")
+    if t == "inlineStr":
+        return "".join(x.text or "" for x in c.iter(f"{_NS_MAIN}t"))
+    v = c.find(f"{_NS_MAIN}v")
+    if v is None or v.text is None:
+        return None
+    text = v.text
+    if t == "s":
+        return shared[int(text)]
+    if t in ("str", "e"):
+        return text
+    if t == "b":
+        return text == "1"
+    # Numérico: mismo criterio que pandas+openpyxl (float entero -> int).
+    try:
+        num = float(text)
+    except ValueError:
+        return text
+    style = c.get("s")
+    if style in date_styles:
+        try:
+            return _from_excel_serial(num, epoch=epoch, duration=style in duration_styles)
+        except (OverflowError, ValueError):
+            return "#VALUE!"  # openpyxl turns out-of-range date serials into this error
+    return int(num) if num.is_integer() else num
+
+
+def iter_xlsx_rows(content: bytes) -> Iterator[tuple]:
+    """Stream the first sheet of an .xlsx as tuples of raw cell values.
+
+    Parses the worksheet XML with `iterparse` (no workbook DOM, no openpyxl
+    cell objects). Missing cells are None; numbers are int/float, shared and
+    inline strings are str; gaps between rows yield empty tuples. Date-formatted
+    numbers become datetime/time/timedelta, as openpyxl returns them.
+    """
+    with zipfile.ZipFile(io.BytesIO(content)) as zf:
+        shared = _shared_strings(zf)
+        date_styles, duration_styles = _date_styles(zf)
+        epoch = _EPOCH_1904 if _uses_1904_epoch(zf) else _EPOCH_1900
+        with zf.open(_first_sheet_path(zf)) as sheet:
+            row_num = 0
+            for _, el in ET.iterparse(sheet, events=("end",)):
+                if el.tag != f"{_NS_MAIN}row":
+                    continue
+                # Las filas vacías no se escriben en el XML: se rellenan los saltos.
+                r = el.get("r")
+                next_num = int(r) if r else row_num + 1
+                for _ in range(next_num - row_num - 1):
+                    yield ()
+                row_num = next_num
+                values: list = []
+                for c in el.iter(f"{_NS_MAIN}c"):
+                    ref = c.get("r")
+                    idx = _col_index(ref) if ref else len(values)
+                    if idx > len(values):
+                        values.extend([None] * (idx - len(values)))
+                    values.append(_cell_value(c, shared, date_styles, duration_styles, epoch))
+                el.clear()
+                yield tuple(values)
+
+
+def read_xlsx_streaming(content: bytes) -> pd.DataFrame:
+    """Like `read_excel_bytes`, but fed by `iter_xlsx_rows` instead of a workbook.
+
+    Rows go through pandas' own `TextParser` (same as `pd.read_excel`), so NA
+    handling and dtype inference match the regular path.
+    """
+    data: list[list] = []
+    width = 0
+    last_non_empty = 0
+    for row in iter_xlsx_rows(content):
+        values = ["" if v is None else v for v in row]
+        while values and values[-1] == "":
+            values.pop()
+        if values:
+            width = max(width, len(values))
+            last_non_empty = len(data) + 1
+        data.append(values)
+    data = data[:last_non_empty]
+    if not data:
+        return pd.DataFrame()
+    for values in data:
+        values.extend([""] * (width - len(values)))
+
+    df = TextParser(data, header=0, skip_blank_lines=False).read()
+    df.columns = [str(c).strip() for c in df.columns]
+    return df
+
+
+@lru_cache(maxsize=1024)
 def normalize_col_name(name: str) -> str:
     """Normalize Excel column names to an ASCII-ish snake_case token.
 
     Handles SAP exports with accents, non-breaking spaces, tabs, and punctuation.
+    Cached: SAP exports repeat the same fixed headers on every import.
     """
 
     s = str(name or "").strip().lower()
     s = unicodedata.normalize("NFKD", s)
-    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    s = s.translate(_COMBINING_TABLE)
+    if s and max(s) > "\uffff":
+        s = "".join(ch for ch in s if not unicodedata.combining(ch))
     s = s.replace("\u00a0", " ")
-    s = re.sub(r"[\s\t]+", " ", s)
+    s = _WS_RE.sub(" ", s)
     # keep alnum + spaces, turn the rest into spaces
-    s = re.sub(r"[^a-z0-9 ]+", " ", s)
-    s = re.sub(r"\s+", "_", s).strip("_")
+    s = _NONALNUM_RE.sub(" ", s)
+    s = _WS_COLLAPSE_RE.sub("_", s).strip("_")
     return s
 
 
 def normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    df.columns = [normalize_col_name(c) for c in df.columns]
-    return df
+    # set_axis returns a new frame without copying the data (copy-on-write);
+    # the input frame keeps its original headers.
+    return df.set_axis([normalize_col_name(c) for c in df.columns], axis=1)
 
 
 def to_int01(value) -> int:
     """Coerce common Excel numeric/bool-ish values to 0/1."""
     if value is None:
         return 0
-    try:
-        if isinstance(value, float) and pd.isna(value):
-            return 0
-    except Exception:
-        pass
+    if isinstance(value, int):  # includes bool
+        return 1 if value else 0
+    if isinstance(value, float):
+        # NaN/inf -> 0; otherwise truncate like int(float(s)) on the string path
+        return 1 if math.isfinite(value) and int(value) != 0 else 0
     s = str(value).strip().lower()
-    if s in {"1", "true", "si", "sí", "x"}:
-        return 1
-    if s in {"0", "false", "no", ""}:
-        return 0
+    r = _INT01_MAP.get(s)
+    if r is not None:
+        return r
     try:
         return 1 if int(float(s)) != 0 else 0
     except Exception:
         return 0
 
 
-_DIGITS_RE = re.compile(r"^\d+$")
+def to_int01_series(s: pd.Series) -> pd.Series:
+    """Vectorized `to_int01` over a whole column (same truthy/falsy rules)."""
+    txt = s.astype("string").str.strip().str.lower().fillna("")
+    out = pd.Series(0, index=s.index, dtype="int64")
+    truthy = txt.isin(_TRUTHY)
+    out[truthy] = 1
+    other = ~(truthy | txt.isin(_FALSY))
+    if other.any():
+        num = pd.to_numeric(txt[other], errors="coerce").astype("float64")
+        num = num.where(np.isfinite(num), 0.0)
+        out[other] = (num.astype("int64") != 0).astype("int64")
+    return out
+
+
+def map_distinct(s: pd.Series, func) -> list:
+    """``[func(v) for v in s]``, calling ``func`` once per distinct value.
+
+    For per-cell parsers on columns that repeat heavily (SAP keys such as centro or
+    almacen). Missing cells (NaN/None) all map to ``func(None)``.
+    """
+    codes, uniques = pd.factorize(s)
+    mapped = [func(v) for v in uniques.tolist()]
+    mapped.append(func(None))  # factorize code -1
+    return [mapped[c] for c in codes.tolist()]
+
+
+def parse_int_or_none(value) -> int | None:
+    """Non-raising core of `parse_int_strict`: the int, or None when it would raise.
+
+    Used on per-cell import paths (SAP keys, lotes) where non-numeric values are
+    normal and an exception per cell is costly. ``str.isdecimal`` is the C
+    equivalent of the old ``^\\d+$`` check (and ``int()`` accepts exactly those).
+    """
+    if value is None:
+        return None
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, float):
+        if value != value or not value.is_integer():  # NaN / non-integral
+            return None
+        return int(value)
+    s = str(value).strip()
+    if s.isdecimal():
+        return int(s)
+    return None
 
 
 def parse_int_strict(value, *, field: str) -> int:
@@ -72,31 +349,29 @@ def parse_int_strict(value, *, field: str) -> int:
     Accepts ints, floats like 123.0, and digit-only strings (keeps leading zeros).
     Raises ValueError otherwise.
     """
+    n = parse_int_or_none(value)
+    if n is not None:
+        return n
+
     if value is None:
         raise ValueError(f"{field} vacío")
-
-    if isinstance(value, int):
-        return int(value)
-
     if isinstance(value, float):
         if pd.isna(value):
             raise ValueError(f"{field} vacío")
-        if float(value).is_integer():
-            return int(value)
         raise ValueError(f"{field} inválido (no entero): {value!r}")
-
-    s = str(value).strip()
-    if not s:
+    if not str(value).strip():
         raise ValueError(f"{field} vacío")
-    if _DIGITS_RE.match(s):
-        return int(s)
-
     raise ValueError(f"{field} inválido: {value!r}")
 
 
+# DD-MM-YYYY / DD/MM/YYYY (same separator twice) | YYYY/MM/DD, zero-padded.
+# ISO is left to datetime.fromisoformat, which is already C-fast.
+_DATE_RE = re.compile(r"(\d{2})([-/])(\d{2})\2(\d{4})|(\d{4})/(\d{2})/(\d{2})", re.ASCII)
+
+
 def coerce_date(value) -> str:
     """Coerce common Excel/Pandas date representations to ISO YYYY-MM-DD."""
-    if value is None or (isinstance(value, float) and pd.isna(value)):
+    if value is None or value is pd.NaT or (isinstance(value, float) and pd.isna(value)):
         raise ValueError("fecha vacía")
 
     if isinstance(value, datetime):
@@ -107,6 +382,20 @@ def coerce_date(value) -> str:
         return value.to_pydatetime().date().isoformat()
 
     s = str(value).strip()
+    # Fast path for the LATAM formats: one regex match instead of a strptime cascade
+    # (disjoint from ISO, which fromisoformat rejects in these shapes anyway)
+    m = _DATE_RE.fullmatch(s)
+    if m:
+        g = m.groups()
+        if g[0]:
+            y, mo, d = g[3], g[2], g[0]
+        else:
+            y, mo, d = g[4], g[5], g[6]
+        try:
+            return date(int(y), int(mo), int(d)).isoformat()
+        except ValueError:
+            pass  # e.g. 31/02/2024: let strptime produce the same outcome
+
     # Accept YYYY-MM-DD
     try:
         return datetime.fromisoformat(s).date().isoformat()
@@ -123,6 +412,50 @@ def coerce_date(value) -> str:
     raise ValueError(f"fecha inválida: {value!r}")
 
 
+_ISO_DATE_PREFIX_RE = re.compile(r"^\d{4}-\d{2}-\d{2}")
+_DATE_FORMATS = ("%d-%m-%Y", "%d/%m/%Y", "%Y/%m/%d")
+
+
+def coerce_date_series(s: pd.Series) -> pd.Series:
+    """Vectorized `coerce_date` over a whole column.
+
+    Returns an object Series of ISO ``YYYY-MM-DD`` strings, with None where the
+    value is empty or not in one of the supported formats (same order as
+    `coerce_date`: datetime values, ISO strings, then DD-MM-YYYY, DD/MM/YYYY,
+    YYYY/MM/DD). Callers can pass the None cells to `coerce_date` for the exact
+    per-value error.
+    """
+    out = pd.Series(None, index=s.index, dtype=object)
+    if s.empty:
+        return out
+
+    if pd.api.types.is_datetime64_any_dtype(s):
+        parsed = s.dropna()
+        out[parsed.index] = parsed.dt.strftime("%Y-%m-%d")
+        return out.astype(object).where(out.notna(), None)
+
+    is_dt = s.map(lambda v: isinstance(v, datetime))
+    if is_dt.any():
+        parsed = pd.to_datetime(s[is_dt], errors="coerce").dropna()
+        out[parsed.index] = parsed.dt.strftime("%Y-%m-%d")
+
+    text = s[~is_dt & s.notna()].astype(str).str.strip()
+    text = text[text != ""]
+    iso = text[text.str.match(_ISO_DATE_PREFIX_RE)]
+    if not iso.empty:
+        parsed = pd.to_datetime(iso, errors="coerce", format="ISO8601").dropna()
+        out[parsed.index] = parsed.dt.strftime("%Y-%m-%d")
+
+    pending = text[out[text.index].isna()]
+    for fmt in _DATE_FORMATS:
+        if pending.empty:
+            break
+        parsed = pd.to_datetime(pending, errors="coerce", format=fmt).dropna()
+        out[parsed.index] = parsed.dt.strftime("%Y-%m-%d")
+        pending = pending.drop(parsed.index)
+    return out.astype(object).where(out.notna(), None)
+
+
 def coerce_float(value) -> float | None:
     """Coerce common Excel/Pandas numeric representations to float.
 
@@ -154,3 +487,27 @@ def coerce_float(value) -> float | None:
         return float(s)
     except Exception:
         return None
+
+
+def coerce_float_series(s: pd.Series) -> pd.Series:
+    """Vectorized `coerce_float` over a whole column; returns float64 with NaN for None.
+
+    The LATAM fix-up (``1.234,56`` -> ``1234.56``, ``1,5`` -> ``1.5``) is applied per
+    cell with string kernels, then one `pd.to_numeric` pass. Cells that still fail
+    (rare spellings `float()` accepts, e.g. ``1_000``) go through `coerce_float`.
+    """
+    if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+        return s.astype("float64")
+
+    text = s.astype("string").str.strip()
+    has_comma = text.str.contains(",", regex=False).fillna(False).astype(bool)
+    has_dot = text.str.contains(".", regex=False).fillna(False).astype(bool)
+    cleaned = text.mask(has_comma & has_dot, text.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+    cleaned = cleaned.mask(has_comma & ~has_dot, text.str.replace(",", ".", regex=False))
+    out = pd.to_numeric(cleaned, errors="coerce").astype("Float64").astype("float64")
+
+    lowered = text.str.lower()
+    retry = (out.isna() & s.notna() & (lowered != "nan") & (text != "")).fillna(False).astype(bool)
+    if retry.any():
+        out[retry] = [np.nan if (v := coerce_float(x)) is None else v for x in s[retry]]
+    return out
@@ -8,10 +8,13 @@ from __future__ import annotations
 import re
 import json
 import logging
-from foundryplan.data.excel_io import parse_int_strict
+from foundryplan.data.excel_io import parse_int_or_none
 
 logger = logging.getLogger(__name__)
 
+_DIGITS_RE = re.compile(r"\d+")
+_LETTER_RE = re.compile(r"[A-Za-z]")
+
 
 def normalize_process(process: str | None, processes: dict[str, dict[str, str]]) -> str:
     """Normalize process name to canonical form."""
@@ -42,14 +45,13 @@ def normalize_sap_key(value) -> str | None:
         return None
     # Clean whitespace first (including non-breaking spaces)
     s = str(value).replace("\u00a0", " ").strip()
+    if isinstance(value, str) and s.isdecimal():
+        return str(int(s))  # common case: digit-only text such as "000010"
     if not s or s.lower() == "nan":
         return None
-    try:
-        n = parse_int_strict(value, field="sap_key")
-        return str(int(n))
-    except Exception:
-        # If it's not numeric, return the cleaned string
-        return s
+    n = parse_int_or_none(value)
+    # If it's not numeric, return the cleaned string
+    return str(n) if n is not None else s
 
 
 def lote_to_int(value) -> int | None:
@@ -70,13 +72,13 @@ def lote_to_int(value) -> int | None:
     if not s or s.lower() == "nan":
         return None
     
-    try:
-        return int(parse_int_strict(value, field="Lote"))
-    except Exception:
-        m = re.search(r"\d+", s)
+    n = parse_int_or_none(value)
+    if n is None:
+        m = _DIGITS_RE.search(s)
         if not m:
             return None  # No digits found, return None instead of raising
         return int(m.group(0))
+    return n
 
 
 def is_lote_test(lote: str) -> bool:
@@ -86,4 +88,4 @@ def is_lote_test(lote: str) -> bool:
     """
     if not lote:
         return False
-    return bool(re.search(r"[A-Za-z]", str(lote)))
+    return bool(_LETTER_RE.search(str(lote)))
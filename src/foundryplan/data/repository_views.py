@@ -66,6 +66,13 @@ class DataRepository:
     def get_orders_due_soon_rows(self, *, today=None, days: int = 49, limit: int = 200) -> list[dict]:
         return self._repo.get_orders_due_soon_rows(today=today, days=days, limit=limit)
 
+    def get_orders_dashboard_rows(
+        self, *, today=None, days: int = 49, overdue_limit: int = 200, due_soon_limit: int = 200
+    ) -> tuple[list[dict], list[dict]]:
+        return self._repo.get_orders_dashboard_rows(
+            today=today, days=days, overdue_limit=overdue_limit, due_soon_limit=due_soon_limit
+        )
+
     def get_orders_rows(self, limit: int = 200) -> list[dict]:
         return self._repo.get_orders_rows(limit=limit)
 
@@ -82,6 +89,9 @@ class DataRepository:
     def upsert_part_master(self, **kwargs) -> None:
         return self._repo.upsert_part_master(**kwargs)
 
+    def upsert_part_masters(self, parts: list[dict]) -> list[tuple[str, str]]:
+        return self._repo.upsert_part_masters(parts)
+
     def upsert_part(self, **kwargs) -> None:
         return self._repo.upsert_part(**kwargs)
 
@@ -371,11 +381,14 @@ class PlannerRepository:
     def ensure_planner_scenario(self, *, name: str = "default") -> int:
         return self._repo.ensure_planner_scenario(name=name)
 
-    def sync_planner_inputs_from_sap(self, *, scenario_id: int, asof_date, horizon_buffer_days: int = 10) -> dict:
+    def sync_planner_inputs_from_sap(
+        self, *, scenario_id: int, asof_date, horizon_buffer_days: int = 10, force: bool = False
+    ) -> dict:
         return self._repo.sync_planner_inputs_from_sap(
             scenario_id=scenario_id,
             asof_date=asof_date,
             horizon_buffer_days=horizon_buffer_days,
+            force=force,
         )
 
     def get_planner_orders_rows(self, *, scenario_id: int) -> list[dict]:
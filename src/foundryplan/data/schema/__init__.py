@@ -5,4 +5,14 @@ from foundryplan.data.schema.data_schema import seed_alloy_catalog
 from foundryplan.data.schema.dispatcher_schema import ensure_schema as ensure_dispatcher_schema
 from foundryplan.data.schema.planner_schema import ensure_schema as ensure_planner_schema
 
-__all__ = ["ensure_data_schema", "ensure_dispatcher_schema", "ensure_planner_schema", "seed_alloy_catalog"]
+# Bump whenever any DDL, migration or seed in this package changes: Db.ensure_schema
+# skips the whole pass when core_config.schema_version already matches.
+SCHEMA_VERSION = 9
+
+__all__ = [
+    "SCHEMA_VERSION",
+    "ensure_data_schema",
+    "ensure_dispatcher_schema",
+    "ensure_planner_schema",
+    "seed_alloy_catalog",
+]
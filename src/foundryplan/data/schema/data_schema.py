@@ -2,9 +2,46 @@ from __future__ import annotations
 
 import sqlite3
 
+from foundryplan.data.schema.script import add_missing_columns, ensure_without_rowid, execute_script, table_columns
+
+
+# One row per Vision order position, as the dashboard/KPI queries aggregate it.
+# Kept in sync with core_sap_vision_snapshot by the trg_vision_orderpos_* triggers.
+_VISION_ORDERPOS_SELECT = """
+    SELECT
+        pedido,
+        posicion,
+        MAX(cliente),
+        MAX(cod_material),
+        MIN(COALESCE(fecha_de_pedido, '9999-12-31')),
+        MAX(COALESCE(fecha_de_pedido, '9999-12-31')),
+        MAX(COALESCE(solicitado, 0)),
+        MAX(COALESCE(bodega, 0)),
+        MAX(COALESCE(despachado, 0)),
+        MAX(peso_unitario_ton),
+        MAX(descripcion_material),
+        MAX(peso_neto_ton)
+    FROM core_sap_vision_snapshot
+"""
+
+_VISION_ORDERPOS_COLUMNS = """
+    pedido, posicion, cliente, cod_material, fecha_de_pedido_min, fecha_de_pedido_max,
+    solicitado, bodega, despachado, peso_unitario_ton, descripcion_material, peso_neto_ton
+"""
+
 
 def ensure_schema(con: sqlite3.Connection) -> None:
-    con.executescript(
+    # Migration: core_sap_vision_orderpos is derived data (rebuilt further down); recreate it
+    # when it predates any of its columns (ALTER TABLE cannot add STORED generated ones).
+    # Its triggers live on the snapshot table and name the columns, so they go too.
+    orderpos_cols = {r[0] for r in con.execute("SELECT name FROM pragma_table_xinfo('core_sap_vision_orderpos')")}
+    if orderpos_cols and not {"pendientes", "descripcion_material", "peso_neto_ton"} <= orderpos_cols:
+        con.execute("DROP TABLE core_sap_vision_orderpos")
+        for trigger in ("trg_vision_orderpos_insert", "trg_vision_orderpos_delete", "trg_vision_orderpos_update"):
+            con.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+
+    execute_script(
+        con,
         """
         CREATE TABLE IF NOT EXISTS core_audit_log (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -25,7 +62,7 @@ def ensure_schema(con: sqlite3.Connection) -> None:
             config_key TEXT PRIMARY KEY,
             config_value TEXT NOT NULL,
             updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
-        );
+        ) WITHOUT ROWID;
 
         CREATE TABLE IF NOT EXISTS core_alloy_catalog (
             alloy_code TEXT PRIMARY KEY,
@@ -33,7 +70,7 @@ def ensure_schema(con: sqlite3.Connection) -> None:
             is_active INTEGER NOT NULL DEFAULT 1,
             created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
             updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
-        );
+        ) WITHOUT ROWID;
 
         CREATE TABLE IF NOT EXISTS core_material_master (
             part_code TEXT PRIMARY KEY,
@@ -112,10 +149,10 @@ def ensure_schema(con: sqlite3.Connection) -> None:
             almacen TEXT,
             lote TEXT,
             pb_almacen REAL,
-            libre_utilizacion INTEGER,
+            libre_utilizacion INTEGER NOT NULL DEFAULT 0,
             documento_comercial TEXT,
             posicion_sd TEXT,
-            en_control_calidad INTEGER,
+            en_control_calidad INTEGER NOT NULL DEFAULT 0,
             correlativo_int INTEGER,
             is_test INTEGER NOT NULL DEFAULT 0
         );
@@ -238,9 +275,115 @@ def ensure_schema(con: sqlite3.Connection) -> None:
             tons_por_entregar REAL NOT NULL,
             tons_atrasadas REAL NOT NULL
         );
+
+        -- Secondary indexes for the hot joins/filters (MB52 <-> Vision on pedido/posicion,
+        -- MB52 by centro/almacen + availability flags and material, orders <-> Vision).
+        -- idx_mb52_availability also covers the order-position keys and lote used by
+        -- the rebuild diagnostics; it supersedes idx_mb52_centro_almacen.
+        CREATE INDEX IF NOT EXISTS idx_mb52_material ON core_sap_mb52_snapshot(material);
+        DROP INDEX IF EXISTS idx_mb52_centro_almacen;
+        CREATE INDEX IF NOT EXISTS idx_mb52_availability ON core_sap_mb52_snapshot(
+            centro, almacen, libre_utilizacion, en_control_calidad, documento_comercial, posicion_sd, lote
+        );
+        -- Test order positions (alphanumeric lote, flagged as is_test at import) for the dispatcher
+        CREATE INDEX IF NOT EXISTS idx_mb52_test_orderpos ON core_sap_mb52_snapshot(
+            centro, almacen, libre_utilizacion, en_control_calidad, documento_comercial, posicion_sd
+        ) WHERE is_test = 1;
+        CREATE INDEX IF NOT EXISTS idx_vision_pedido_posicion ON core_sap_vision_snapshot(pedido, posicion);
+        CREATE INDEX IF NOT EXISTS idx_orders_pedido_posicion ON core_orders(pedido, posicion);
+        -- Distinct materials per process, walked in order by the missing-master diagnostics
+        CREATE INDEX IF NOT EXISTS idx_orders_process_material ON core_orders(process, material);
+
+        CREATE TABLE IF NOT EXISTS core_sap_vision_orderpos (
+            pedido TEXT NOT NULL,
+            posicion TEXT NOT NULL,
+            cliente TEXT,
+            cod_material TEXT,
+            fecha_de_pedido_min TEXT NOT NULL,
+            fecha_de_pedido_max TEXT NOT NULL,
+            solicitado INTEGER NOT NULL,
+            bodega INTEGER NOT NULL,
+            despachado INTEGER NOT NULL,
+            peso_unitario_ton REAL,
+            descripcion_material TEXT,
+            peso_neto_ton REAL,
+            pendientes INTEGER GENERATED ALWAYS AS (max(solicitado - bodega - despachado, 0)) STORED,
+            part_code TEXT GENERATED ALWAYS AS (CASE
+                WHEN substr(cod_material, 1, 2) = '40' AND substr(cod_material, 5, 2) = '00' THEN substr(cod_material, 7, 5)
+                WHEN substr(cod_material, 1, 4) = '4310' AND substr(cod_material, 10, 2) = '01' THEN substr(cod_material, 5, 5)
+                WHEN substr(cod_material, 1, 3) = '435' AND substr(cod_material, 6, 1) = '0' THEN substr(cod_material, 7, 5)
+                WHEN substr(cod_material, 1, 3) = '436' AND substr(cod_material, 6, 1) = '0' THEN substr(cod_material, 7, 5)
+            END) STORED,
+            PRIMARY KEY (pedido, posicion)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_vision_orderpos_fecha_min ON core_sap_vision_orderpos(fecha_de_pedido_min);
+        CREATE INDEX IF NOT EXISTS idx_vision_orderpos_fecha_max ON core_sap_vision_orderpos(fecha_de_pedido_max);
         """
     )
 
+    # core_sap_vision_orderpos maintenance: inserts fold into the running MAX/MIN
+    # (scalar max()/min() return NULL on a NULL argument, hence the COALESCE fallbacks);
+    # deletes and updates recompute the affected order positions from the snapshot.
+    execute_script(
+        con,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_vision_orderpos_insert
+        AFTER INSERT ON core_sap_vision_snapshot
+        BEGIN
+            INSERT INTO core_sap_vision_orderpos({_VISION_ORDERPOS_COLUMNS})
+            VALUES (
+                NEW.pedido, NEW.posicion, NEW.cliente, NEW.cod_material,
+                COALESCE(NEW.fecha_de_pedido, '9999-12-31'), COALESCE(NEW.fecha_de_pedido, '9999-12-31'),
+                COALESCE(NEW.solicitado, 0), COALESCE(NEW.bodega, 0), COALESCE(NEW.despachado, 0),
+                NEW.peso_unitario_ton, NEW.descripcion_material, NEW.peso_neto_ton
+            )
+            ON CONFLICT(pedido, posicion) DO UPDATE SET
+                cliente = COALESCE(max(cliente, excluded.cliente), cliente, excluded.cliente),
+                cod_material = COALESCE(max(cod_material, excluded.cod_material), cod_material, excluded.cod_material),
+                fecha_de_pedido_min = min(fecha_de_pedido_min, excluded.fecha_de_pedido_min),
+                fecha_de_pedido_max = max(fecha_de_pedido_max, excluded.fecha_de_pedido_max),
+                solicitado = max(solicitado, excluded.solicitado),
+                bodega = max(bodega, excluded.bodega),
+                despachado = max(despachado, excluded.despachado),
+                peso_unitario_ton = COALESCE(
+                    max(peso_unitario_ton, excluded.peso_unitario_ton), peso_unitario_ton, excluded.peso_unitario_ton
+                ),
+                descripcion_material = COALESCE(
+                    max(descripcion_material, excluded.descripcion_material), descripcion_material,
+                    excluded.descripcion_material
+                ),
+                peso_neto_ton = COALESCE(
+                    max(peso_neto_ton, excluded.peso_neto_ton), peso_neto_ton, excluded.peso_neto_ton
+                );
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_vision_orderpos_delete
+        AFTER DELETE ON core_sap_vision_snapshot
+        BEGIN
+            DELETE FROM core_sap_vision_orderpos WHERE pedido = OLD.pedido AND posicion = OLD.posicion;
+            INSERT INTO core_sap_vision_orderpos({_VISION_ORDERPOS_COLUMNS})
+            {_VISION_ORDERPOS_SELECT}
+            WHERE pedido = OLD.pedido AND posicion = OLD.posicion
+            GROUP BY pedido, posicion;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_vision_orderpos_update
+        AFTER UPDATE OF pedido, posicion, cliente, cod_material, fecha_de_pedido, solicitado, bodega, despachado,
+            peso_unitario_ton, descripcion_material, peso_neto_ton
+        ON core_sap_vision_snapshot
+        BEGIN
+            DELETE FROM core_sap_vision_orderpos
+            WHERE (pedido = OLD.pedido AND posicion = OLD.posicion)
+               OR (pedido = NEW.pedido AND posicion = NEW.posicion);
+            INSERT INTO core_sap_vision_orderpos({_VISION_ORDERPOS_COLUMNS})
+            {_VISION_ORDERPOS_SELECT}
+            WHERE (pedido = OLD.pedido AND posicion = OLD.posicion)
+               OR (pedido = NEW.pedido AND posicion = NEW.posicion)
+            GROUP BY pedido, posicion;
+        END;
+        """,
+    )
+
     con.executemany(
         "INSERT OR IGNORE INTO core_family_catalog(family_id, label) VALUES(?, ?)",
         [
@@ -252,17 +395,16 @@ def ensure_schema(con: sqlite3.Connection) -> None:
         ],
     )
 
-    con.execute("INSERT OR IGNORE INTO core_config(config_key, config_value) VALUES('sap_centro', '4000')")
-    con.execute("INSERT OR IGNORE INTO core_config(config_key, config_value) VALUES('sap_center', '4000')")
-    con.execute("INSERT OR IGNORE INTO core_config(config_key, config_value) VALUES('sap_material_prefixes', '436')")
-    con.execute("INSERT OR IGNORE INTO core_config(config_key, config_value) VALUES('job_priority_map', '{\"prueba\": 1, \"urgente\": 2, \"normal\": 3}')")
-    con.execute("INSERT OR IGNORE INTO core_config(config_key, config_value) VALUES('planner_horizon_days', '30')")
-    con.execute("INSERT OR IGNORE INTO core_config(config_key, config_value) VALUES('planner_horizon_buffer_days', '10')")
-    con.execute("INSERT OR IGNORE INTO core_config(config_key, config_value) VALUES('planner_holidays', '')")
-
     con.executemany(
         "INSERT OR IGNORE INTO core_config(config_key, config_value) VALUES(?, ?)",
         [
+            ("sap_centro", "4000"),
+            ("sap_center", "4000"),
+            ("sap_material_prefixes", "436"),
+            ("job_priority_map", '{"prueba": 1, "urgente": 2, "normal": 3}'),
+            ("planner_horizon_days", "30"),
+            ("planner_horizon_buffer_days", "10"),
+            ("planner_holidays", ""),
             ("sap_almacen_moldeo", "4032"),
             ("sap_almacen_terminaciones", "4035"),
             ("sap_almacen_toma_dureza", "4035"),
@@ -291,51 +433,69 @@ def ensure_schema(con: sqlite3.Connection) -> None:
         process_defaults,
     )
 
+    columns = table_columns(
+        con,
+        "core_material_master",
+        "core_sap_demolding_snapshot",
+        "core_moldes_por_fundir",
+        "core_piezas_fundidas",
+    )
+
+    # Migration: small key/value lookups as WITHOUT ROWID (one B-tree instead of rowid table + PK index)
+    ensure_without_rowid(con, ["core_config", "core_alloy_catalog"])
+
     # Migration: Add required columns to core_material_master before part_code migration
-    try:
-        con.execute("ALTER TABLE core_material_master ADD COLUMN descripcion_material TEXT")
-    except Exception:
-        pass
-    
-    try:
-        con.execute("ALTER TABLE core_material_master ADD COLUMN finish_days INTEGER DEFAULT 20")
-    except Exception:
-        pass
-    
-    try:
-        con.execute("ALTER TABLE core_material_master ADD COLUMN min_finish_days INTEGER DEFAULT 5")
-    except Exception:
-        pass
-    
+    add_missing_columns(
+        con,
+        columns,
+        "core_material_master",
+        [
+            ("descripcion_material", "TEXT"),
+            ("finish_days", "INTEGER DEFAULT 20"),
+            ("min_finish_days", "INTEGER DEFAULT 5"),
+        ],
+    )
+
     # Migration: Rename tiempo_enfriamiento_molde_dias to tiempo_enfriamiento_molde_horas (both store hours)
-    try:
+    mm_cols = columns["core_material_master"]
+    if "tiempo_enfriamiento_molde_dias" in mm_cols and "tiempo_enfriamiento_molde_horas" not in mm_cols:
         con.execute("ALTER TABLE core_material_master RENAME COLUMN tiempo_enfriamiento_molde_dias TO tiempo_enfriamiento_molde_horas")
-    except Exception:
-        pass
+
+    # Migration: MB52 flags are NOT NULL (0/1) on new databases; older files only get
+    # their NULLs backfilled (the import always writes 0/1), so predicates need no COALESCE
+    con.execute(
+        """
+        UPDATE core_sap_mb52_snapshot
+        SET libre_utilizacion = COALESCE(libre_utilizacion, 0),
+            en_control_calidad = COALESCE(en_control_calidad, 0)
+        WHERE libre_utilizacion IS NULL OR en_control_calidad IS NULL
+        """
+    )
+
+    # Migration: is_test is derived at import (alphanumeric lote); flag rows loaded without it
+    con.execute("UPDATE core_sap_mb52_snapshot SET is_test = 1 WHERE is_test = 0 AND lote GLOB '*[A-Za-z]*'")
+
+    # Migration: (re)build core_sap_vision_orderpos for snapshots loaded before the triggers existed
+    con.execute("DELETE FROM core_sap_vision_orderpos")
+    con.execute(
+        f"INSERT INTO core_sap_vision_orderpos({_VISION_ORDERPOS_COLUMNS}) {_VISION_ORDERPOS_SELECT} GROUP BY pedido, posicion"
+    )
 
     # Migration: Add cancha column to core_sap_demolding_snapshot
-    try:
-        con.execute("ALTER TABLE core_sap_demolding_snapshot ADD COLUMN cancha TEXT")
-    except Exception:
-        pass
-    
+    add_missing_columns(con, columns, "core_sap_demolding_snapshot", [("cancha", "TEXT")])
+
     # Migration: Add part_code columns to demolding tables
-    try:
-        con.execute("ALTER TABLE core_moldes_por_fundir ADD COLUMN part_code TEXT")
-    except Exception:
-        pass
-    
-    try:
-        con.execute("ALTER TABLE core_piezas_fundidas ADD COLUMN part_code TEXT")
-    except Exception:
-        pass
-    
+    add_missing_columns(con, columns, "core_moldes_por_fundir", [("part_code", "TEXT")])
+    add_missing_columns(con, columns, "core_piezas_fundidas", [("part_code", "TEXT")])
+
     # Note: mold_quantity should be REAL to store fractions (1/piezas_por_molde)
     # SQLite's INTEGER affinity can store REAL values, but for new tables we use REAL
     # Existing data will work correctly with float() conversion in Python
     
     # Migration: Refactor material_master to use part_code as PK (consolidates 4 material types)
     migrate_material_master_to_part_code(con)
+    # After the migration, which may rebuild core_material_master
+    con.execute("CREATE INDEX IF NOT EXISTS idx_material_master_family ON core_material_master(family_id)")
 
 
 def migrate_material_master_to_part_code(con: sqlite3.Connection) -> None:
@@ -354,20 +514,14 @@ def migrate_material_master_to_part_code(con: sqlite3.Connection) -> None:
         if columns['part_code'][5] == 1:  # pk flag is at index 5
             return  # Already migrated
     
-    # 1. Backup current table
-    try:
-        con.execute("DROP TABLE IF EXISTS _backup_material_master_20260206")
-    except Exception:
-        pass
-    
-    con.execute("""
-        CREATE TABLE _backup_material_master_20260206 AS
-        SELECT * FROM core_material_master
-    """)
+    # 1. Keep the current table as the backup: a rename is O(1), unlike copying every row
+    con.execute("DROP TABLE IF EXISTS _backup_material_master_20260206")
+    con.execute("DROP INDEX IF EXISTS idx_material_master_family")
+    con.execute("ALTER TABLE core_material_master RENAME TO _backup_material_master_20260206")
     
     # 2. Create new table with part_code as PK
     con.execute("""
-        CREATE TABLE core_material_master_new (
+        CREATE TABLE core_material_master (
             part_code TEXT PRIMARY KEY,
             descripcion_pieza TEXT,
             family_id TEXT,
@@ -392,7 +546,7 @@ def migrate_material_master_to_part_code(con: sqlite3.Connection) -> None:
     # 3. Migrate data - consolidate by part_code, keeping most recent/complete data
     # Use MAX aggregation to pick non-null values, prioritize Pieza materials
     con.execute("""
-        INSERT INTO core_material_master_new
+        INSERT INTO core_material_master
         SELECT
             part_code,
             MAX(descripcion_material) AS descripcion_pieza,
@@ -420,17 +574,11 @@ def migrate_material_master_to_part_code(con: sqlite3.Connection) -> None:
                     WHEN substr(material, 1, 3) = '436' AND substr(material, 6, 1) = '0' THEN substr(material, 7, 5)
                 END AS part_code,
                 *
-            FROM core_material_master
+            FROM _backup_material_master_20260206
         )
         WHERE part_code IS NOT NULL
         GROUP BY part_code
     """)
-    
-    # 4. Replace old table
-    con.execute("DROP TABLE core_material_master")
-    con.execute("ALTER TABLE core_material_master_new RENAME TO core_material_master")
-    
-    con.commit()
 
 
 def seed_alloy_catalog(con: sqlite3.Connection) -> None:
@@ -454,4 +602,3 @@ def seed_alloy_catalog(con: sqlite3.Connection) -> None:
         INSERT INTO core_alloy_catalog (alloy_code, alloy_name, is_active)
         VALUES (?, ?, 1)
     """, initial_alloys)
-    con.commit()
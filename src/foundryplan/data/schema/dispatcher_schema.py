@@ -2,9 +2,12 @@ from __future__ import annotations
 
 import sqlite3
 
+from foundryplan.data.schema.script import add_missing_columns, ensure_without_rowid, execute_script, table_columns
+
 
 def ensure_schema(con: sqlite3.Connection) -> None:
-    con.executescript(
+    execute_script(
+        con,
         """
         CREATE TABLE IF NOT EXISTS dispatcher_job (
             job_id TEXT PRIMARY KEY,
@@ -38,6 +41,13 @@ def ensure_schema(con: sqlite3.Connection) -> None:
             FOREIGN KEY(job_id) REFERENCES dispatcher_job(job_id)
         );
 
+        -- MB52 import / orders rebuild sync jobs per (process, order position, material) and
+        -- rewrite their units by job_id; without these every lookup is a full table scan.
+        CREATE INDEX IF NOT EXISTS idx_dispatcher_job_orderpos ON dispatcher_job(
+            process_id, pedido, posicion, material
+        );
+        CREATE INDEX IF NOT EXISTS idx_dispatcher_job_unit_job ON dispatcher_job_unit(job_id, lote);
+
         CREATE TABLE IF NOT EXISTS dispatcher_line_config (
             process TEXT NOT NULL,
             line_id INTEGER NOT NULL,
@@ -46,7 +56,7 @@ def ensure_schema(con: sqlite3.Connection) -> None:
             mec_perf_inclinada INTEGER DEFAULT 0,
             sobre_medida_mecanizado INTEGER DEFAULT 0,
             PRIMARY KEY(process, line_id)
-        );
+        ) WITHOUT ROWID;
 
         CREATE TABLE IF NOT EXISTS dispatcher_last_program (
             process TEXT PRIMARY KEY,
@@ -79,7 +89,7 @@ def ensure_schema(con: sqlite3.Connection) -> None:
         CREATE TABLE IF NOT EXISTS dispatcher_order_priority (
             pedido TEXT PRIMARY KEY,
             is_priority INTEGER NOT NULL DEFAULT 0
-        );
+        ) WITHOUT ROWID;
 
         CREATE TABLE IF NOT EXISTS dispatcher_orderpos_priority (
             pedido TEXT NOT NULL,
@@ -87,7 +97,7 @@ def ensure_schema(con: sqlite3.Connection) -> None:
             is_priority INTEGER NOT NULL DEFAULT 0,
             kind TEXT,
             PRIMARY KEY (pedido, posicion)
-        );
+        ) WITHOUT ROWID;
 
         CREATE VIEW IF NOT EXISTS orderpos_priority AS
             SELECT pedido, posicion, is_priority, kind FROM dispatcher_orderpos_priority;
@@ -95,7 +105,8 @@ def ensure_schema(con: sqlite3.Connection) -> None:
     )
 
     # Enable INSERT/UPDATE/DELETE on orderpos_priority view for backward-compatibility with tests
-    con.executescript(
+    execute_script(
+        con,
         """
         CREATE TRIGGER IF NOT EXISTS trg_orderpos_priority_insert
         INSTEAD OF INSERT ON orderpos_priority
@@ -121,13 +132,16 @@ def ensure_schema(con: sqlite3.Connection) -> None:
         """
     )
 
+    ensure_without_rowid(con, ["dispatcher_line_config", "dispatcher_order_priority", "dispatcher_orderpos_priority"])
+
     # Migrations: Add columns if they don't exist
-    try:
-        con.execute("ALTER TABLE dispatcher_line_config ADD COLUMN mec_perf_inclinada INTEGER DEFAULT 0")
-    except sqlite3.OperationalError:
-        pass  # Column already exists
-    
-    try:
-        con.execute("ALTER TABLE dispatcher_line_config ADD COLUMN sobre_medida_mecanizado INTEGER DEFAULT 0")
-    except sqlite3.OperationalError:
-        pass  # Column already exists
\ No newline at end of file
+    columns = table_columns(con, "dispatcher_line_config")
+    add_missing_columns(
+        con,
+        columns,
+        "dispatcher_line_config",
+        [
+            ("mec_perf_inclinada", "INTEGER DEFAULT 0"),
+            ("sobre_medida_mecanizado", "INTEGER DEFAULT 0"),
+        ],
+    )
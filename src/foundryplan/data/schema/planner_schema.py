@@ -2,14 +2,19 @@ from __future__ import annotations
 
 import sqlite3
 
+from foundryplan.data.schema.script import add_missing_columns, execute_script, table_columns
+
 
 def ensure_schema(con: sqlite3.Connection) -> None:
-    con.executescript(
+    execute_script(
+        con,
         """
         CREATE TABLE IF NOT EXISTS planner_scenarios (
             scenario_id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT,
-            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            inputs_fingerprint TEXT,
+            inputs_summary_json TEXT
         );
 
         CREATE TABLE IF NOT EXISTS planner_parts (
@@ -111,66 +116,54 @@ def ensure_schema(con: sqlite3.Connection) -> None:
         """
     )
     
-    # Add shift columns if they don't exist
-    try:
-        con.execute("ALTER TABLE planner_resources ADD COLUMN molding_max_per_shift INTEGER")
-    except Exception:
-        pass
-    try:
-        con.execute("ALTER TABLE planner_resources ADD COLUMN molding_shifts_json TEXT")
-    except Exception:
-        pass
-    try:
-        con.execute("ALTER TABLE planner_resources ADD COLUMN pour_max_ton_per_shift REAL")
-    except Exception:
-        pass
-    try:
-        con.execute("ALTER TABLE planner_resources ADD COLUMN pour_shifts_json TEXT")
-    except Exception:
-        pass
-    
-    # Add pouring breakdown columns
-    try:
-        con.execute("ALTER TABLE planner_resources ADD COLUMN heats_per_shift REAL")
-    except Exception:
-        pass
-    try:
-        con.execute("ALTER TABLE planner_resources ADD COLUMN tons_per_heat REAL")
-    except Exception:
-        pass
-    
-    # Add heuristic configuration columns
-    try:
-        con.execute("ALTER TABLE planner_resources ADD COLUMN max_placement_search_days INTEGER DEFAULT 365")
-    except Exception:
-        pass
-    try:
-        con.execute("ALTER TABLE planner_resources ADD COLUMN allow_molding_gaps INTEGER DEFAULT 0")
-    except Exception:
-        pass
-    
-    # Add lag configuration columns
-    try:
-        con.execute("ALTER TABLE planner_resources ADD COLUMN pour_lag_days INTEGER DEFAULT 1")
-    except Exception:
-        pass
-    try:
-        con.execute("ALTER TABLE planner_resources ADD COLUMN shakeout_lag_days INTEGER DEFAULT 1")
-    except Exception:
-        pass
-    
+    columns = table_columns(con, "planner_scenarios", "planner_resources", "planner_parts")
+
+    # Add input fingerprint columns (skip re-sync when upstream data is unchanged)
+    add_missing_columns(
+        con,
+        columns,
+        "planner_scenarios",
+        [
+            ("inputs_fingerprint", "TEXT"),
+            ("inputs_summary_json", "TEXT"),
+        ],
+    )
+
+    add_missing_columns(
+        con,
+        columns,
+        "planner_resources",
+        [
+            # Shift columns
+            ("molding_max_per_shift", "INTEGER"),
+            ("molding_shifts_json", "TEXT"),
+            ("pour_max_ton_per_shift", "REAL"),
+            ("pour_shifts_json", "TEXT"),
+            # Pouring breakdown columns
+            ("heats_per_shift", "REAL"),
+            ("tons_per_heat", "REAL"),
+            # Heuristic configuration columns
+            ("max_placement_search_days", "INTEGER DEFAULT 365"),
+            ("allow_molding_gaps", "INTEGER DEFAULT 0"),
+            # Lag configuration columns
+            ("pour_lag_days", "INTEGER DEFAULT 1"),
+            ("shakeout_lag_days", "INTEGER DEFAULT 1"),
+        ],
+    )
+
     # Migrate finish_hours to finish_days (add new columns, keep old for compatibility)
-    try:
-        con.execute("ALTER TABLE planner_parts ADD COLUMN finish_days INTEGER")
-    except Exception:
-        pass
-    try:
-        con.execute("ALTER TABLE planner_parts ADD COLUMN min_finish_days INTEGER")
-    except Exception:
-        pass
-    
+    add_missing_columns(
+        con,
+        columns,
+        "planner_parts",
+        [
+            ("finish_days", "INTEGER"),
+            ("min_finish_days", "INTEGER"),
+        ],
+    )
+
     # Migrate data if finish_days is NULL but finish_hours exists
-    try:
+    if {"finish_hours", "min_finish_hours"} <= columns["planner_parts"]:
         con.execute("""
             UPDATE planner_parts 
             SET finish_days = CAST(ROUND(finish_hours / 24.0) AS INTEGER)
@@ -181,5 +174,3 @@ def ensure_schema(con: sqlite3.Connection) -> None:
             SET min_finish_days = CAST(ROUND(min_finish_hours / 24.0) AS INTEGER)
             WHERE min_finish_days IS NULL AND min_finish_hours IS NOT NULL
         """)
-    except Exception:
-        pass
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import sqlite3
+
+
+def execute_script(con: sqlite3.Connection, script: str) -> None:
+    """Run a multi-statement SQL script inside the caller's transaction.
+
+    ``Connection.executescript`` issues an implicit COMMIT first, which would split
+    ``Db.ensure_schema`` into one commit per script. This splits the script on
+    statement boundaries (``sqlite3.complete_statement`` understands quotes and
+    trigger bodies) and runs each statement with ``execute``.
+    """
+    buf = ""
+    for chunk in script.split(";"):
+        buf += chunk + ";"
+        if sqlite3.complete_statement(buf):
+            if buf.strip(" \t\r\n;"):
+                con.execute(buf)
+            buf = ""
+    if buf.strip(" \t\r\n;"):
+        con.execute(buf)
+
+
+def table_columns(con: sqlite3.Connection, *tables: str) -> dict[str, set[str]]:
+    """Column names for several tables in one round trip (``pragma_table_info``)."""
+    out: dict[str, set[str]] = {t: set() for t in tables}
+    if not tables:
+        return out
+    sql = " UNION ALL ".join("SELECT ? AS tbl, name FROM pragma_table_info(?)" for _ in tables)
+    params = [p for t in tables for p in (t, t)]
+    for tbl, name in con.execute(sql, params):
+        out[tbl].add(name)
+    return out
+
+
+def add_missing_columns(
+    con: sqlite3.Connection,
+    columns: dict[str, set[str]],
+    table: str,
+    definitions: list[tuple[str, str]],
+) -> None:
+    """``ALTER TABLE ... ADD COLUMN`` only for the (name, decl) pairs not in ``columns[table]``."""
+    existing = columns[table]
+    for name, decl in definitions:
+        if name not in existing:
+            con.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+            existing.add(name)
+
+
+def ensure_without_rowid(con: sqlite3.Connection, tables: list[str]) -> None:
+    """Rebuild existing rowid tables as ``WITHOUT ROWID`` (fresh DBs create them that way).
+
+    Only for small lookup tables with a NOT NULL primary key that no FOREIGN KEY
+    references. The old table is renamed first under ``legacy_alter_table`` so views
+    and triggers keep pointing at the table name, which the rebuilt table reuses.
+    Rows with a NULL primary key (unreachable by key lookups) are not copied.
+    """
+    placeholders = ", ".join("?" for _ in tables)
+    rows = con.execute(
+        f"SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name IN ({placeholders})",
+        tables,
+    ).fetchall()
+    pending = [(name, sql) for name, sql in rows if "WITHOUT ROWID" not in sql.upper()]
+    if not pending:
+        return
+
+    con.execute("PRAGMA legacy_alter_table=ON")
+    try:
+        for name, sql in pending:
+            old = f"{name}__rowid_old"
+            pk_cols = [r[1] for r in con.execute(f"SELECT pk, name FROM pragma_table_info('{name}') WHERE pk > 0 ORDER BY pk")]
+            cols = ", ".join(r[0] for r in con.execute(f"SELECT name FROM pragma_table_info('{name}') ORDER BY cid"))
+            not_null = " AND ".join(f"{c} IS NOT NULL" for c in pk_cols) or "1"
+            con.execute(f"ALTER TABLE {name} RENAME TO {old}")
+            con.execute(f"{sql.rstrip().rstrip(';')} WITHOUT ROWID")
+            con.execute(f"INSERT INTO {name}({cols}) SELECT {cols} FROM {old} WHERE {not_null}")
+            con.execute(f"DROP TABLE {old}")
+    finally:
+        con.execute("PRAGMA legacy_alter_table=OFF")
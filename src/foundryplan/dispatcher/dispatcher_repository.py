@@ -6,6 +6,7 @@ Extracted from _RepositoryImpl to separate dispatcher concerns from data layer.
 from __future__ import annotations
 
 import json
+import sys
 from datetime import date, datetime, timedelta
 from typing import TYPE_CHECKING
 
@@ -59,50 +60,48 @@ class DispatcherRepositoryImpl:
 
     def get_jobs_model(self, *, process: str = "terminaciones") -> list[Job]:
         process = self.data_repo._normalize_process(process)
+        out: list[Job] = []
         with self.db.connect() as con:
-            rows = con.execute(
+            # Build models straight off the cursor (no intermediate fetchall() list)
+            for r in con.execute(
                 "SELECT job_id, pedido, posicion, material, qty, priority, fecha_de_pedido, is_test, notes, corr_min, corr_max, cliente FROM dispatcher_job WHERE process_id = ?",
                 (process,),
-            ).fetchall()
-        
-        out: list[Job] = []
-        for r in rows:
-            out.append(
-                Job(
-                    job_id=r["job_id"],
-                    pedido=r["pedido"],
-                    posicion=r["posicion"],
-                    material=r["material"],
-                    qty=r["qty"],
-                    priority=r["priority"],
-                    fecha_de_pedido=date.fromisoformat(r["fecha_de_pedido"]) if r["fecha_de_pedido"] else None,
-                    is_test=bool(r["is_test"]),
-                    notes=r["notes"],
-                    corr_min=r["corr_min"],
-                    corr_max=r["corr_max"],
-                    cliente=r["cliente"]
+            ):
+                out.append(
+                    Job(
+                        job_id=r["job_id"],
+                        pedido=r["pedido"],
+                        posicion=r["posicion"],
+                        material=r["material"],
+                        qty=r["qty"],
+                        priority=r["priority"],
+                        fecha_de_pedido=date.fromisoformat(r["fecha_de_pedido"]) if r["fecha_de_pedido"] else None,
+                        is_test=bool(r["is_test"]),
+                        notes=r["notes"],
+                        corr_min=r["corr_min"],
+                        corr_max=r["corr_max"],
+                        cliente=r["cliente"]
+                    )
                 )
-            )
         return out
 
     def get_parts_model(self) -> list[Part]:
         with self.db.connect() as con:
-            rows = con.execute(
-                "SELECT part_code, family_id, vulcanizado_dias, mecanizado_dias, inspeccion_externa_dias, peso_unitario_ton, mec_perf_inclinada, sobre_medida_mecanizado FROM core_material_master"
-            ).fetchall()
-        return [
-            Part(
-                material=str(r[0]),  # part_code is now the identifier
-                family_id=str(r[1]),
-                vulcanizado_dias=r[2],
-                mecanizado_dias=r[3],
-                inspeccion_externa_dias=r[4],
-                peso_unitario_ton=(float(r[5]) if r[5] is not None else None),
-                mec_perf_inclinada=bool(int(r[6] or 0)),
-                sobre_medida_mecanizado=bool(int(r[7] or 0)),
-            )
-            for r in rows
-        ]
+            return [
+                Part(
+                    material=str(r[0]),  # part_code is now the identifier
+                    family_id=sys.intern(str(r[1])),
+                    vulcanizado_dias=r[2],
+                    mecanizado_dias=r[3],
+                    inspeccion_externa_dias=r[4],
+                    peso_unitario_ton=(float(r[5]) if r[5] is not None else None),
+                    mec_perf_inclinada=bool(int(r[6] or 0)),
+                    sobre_medida_mecanizado=bool(int(r[7] or 0)),
+                )
+                for r in con.execute(
+                    "SELECT part_code, family_id, vulcanizado_dias, mecanizado_dias, inspeccion_externa_dias, peso_unitario_ton, mec_perf_inclinada, sobre_medida_mecanizado FROM core_material_master"
+                )
+            ]
 
     # ---------- Lines Management ----------
 
@@ -118,8 +117,8 @@ class DispatcherRepositoryImpl:
         rule = (rule_type or "").strip().lower()
         if rule in {"set", "in", "enum", "list"}:
             if isinstance(value, (list, tuple, set)):
-                return set(value)
-            return {value}
+                return frozenset(value)
+            return frozenset({value})
         if rule in {"bool", "boolean"}:
             if isinstance(value, str):
                 return value.strip().lower() in {"1", "true", "si", "sí", "yes"}
@@ -128,7 +127,7 @@ class DispatcherRepositoryImpl:
             if isinstance(value, dict):
                 return {"min": value.get("min"), "max": value.get("max")}
         if isinstance(value, list):
-            return set(value)
+            return frozenset(value)
         return value
 
     def get_resources_model(self, *, process: str = "terminaciones") -> list[Line]:
@@ -174,7 +173,8 @@ class DispatcherRepositoryImpl:
         # Map legacy 'families' list to 'family_id' constraint + boolean restrictions
         lines = []
         for r in self.get_dispatch_lines_rows(process=process):
-            constraints = {"family_id": set(r["families"])}
+            # Frozen + interned so per-job membership checks hash/compare cheaply
+            constraints = {"family_id": frozenset(sys.intern(str(f)) for f in r["families"])}
             # Add boolean constraints explicitly (both True and False)
             constraints["mec_perf_inclinada"] = r.get("mec_perf_inclinada", False)
             constraints["sobre_medida_mecanizado"] = r.get("sobre_medida_mecanizado", False)
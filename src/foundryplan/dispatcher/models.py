@@ -5,14 +5,14 @@ from datetime import date
 from typing import Any
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Line:
     line_id: str
     constraints: dict[str, Any]
     load_capacity: float | None = None
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Job:
     job_id: str
     pedido: str
@@ -33,7 +33,7 @@ class Job:
     corr_max: int | None = None
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Order:
     # Deprecated v0.1 model
     pedido: str
@@ -52,7 +52,7 @@ class Order:
         return self.material
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Part:
     material: str
     family_id: str
@@ -64,7 +64,7 @@ class Part:
     sobre_medida_mecanizado: bool = False
 
 
-@dataclass
+@dataclass(slots=True)
 class AuditEntry:
     id: int
     timestamp: str
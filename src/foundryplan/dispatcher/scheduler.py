@@ -1,6 +1,8 @@
 from __future__ import annotations
 
+import heapq
 from datetime import date, timedelta
+from operator import itemgetter
 
 from foundryplan.dispatcher.models import Job, Line, Part
 
@@ -11,7 +13,7 @@ def check_constraints(line: Line, part: Part) -> bool:
         # strict attribute matching for now
         # Special case: family_id matches if in set/list
         if attr == "family_id":
-            if isinstance(rule_value, (set, list, tuple)):
+            if isinstance(rule_value, (set, frozenset, list, tuple)):
                 if part.family_id not in rule_value:
                     return False
             elif rule_value != part.family_id:
@@ -42,7 +44,7 @@ def check_constraints(line: Line, part: Part) -> bool:
                 return False
             if max_v is not None and part_value > max_v:
                 return False
-        elif isinstance(rule_value, (set, list, tuple)):
+        elif isinstance(rule_value, (set, frozenset, list, tuple)):
             if part_value not in rule_value:
                 return False
         elif rule_value != part_value:
@@ -78,6 +80,11 @@ def generate_dispatch_program(
 
     # Index parts for quick lookup
     part_map = {p.material: p for p in parts}
+    # Sum of lead times (vulcanizado + mecanizado + inspeccion) per material
+    lead_days_by_material = {
+        m: (p.vulcanizado_dias or 0) + (p.mecanizado_dias or 0) + (p.inspeccion_externa_dias or 0)
+        for m, p in part_map.items()
+    }
 
     # Initialize output structures
     # lines sorted by ID for deterministic behavior
@@ -114,12 +121,9 @@ def generate_dispatch_program(
         if not job.fecha_de_pedido:
             return date.max  # Push to end if no date
 
-        p = get_part(job.material)
-        if not p:
+        days = lead_days_by_material.get(job.material)
+        if days is None:
             return job.fecha_de_pedido
-
-        # Sum of lead times (vulcanizado + mecanizado + inspeccion)
-        days = (p.vulcanizado_dias or 0) + (p.mecanizado_dias or 0) + (p.inspeccion_externa_dias or 0)
         return job.fecha_de_pedido - timedelta(days=days)
 
     # 1. Handle "Pinned" (in-progress) rows
@@ -143,14 +147,23 @@ def generate_dispatch_program(
     # 2. Process Queued Jobs
     # Sort criteria: Priority ASC (1=High), StartBy ASC
 
-    # Augment jobs with sort keys
-    augmented_jobs: list[tuple[Job, date]] = []
+    # Decorate jobs with their full sort key in one pass (decorate-sort-undecorate)
+    keyed_jobs: list[tuple[tuple[int, date, date], Job, date]] = []
     for job in jobs:
         start_date = calculate_start_by(job)
-        augmented_jobs.append((job, start_date))
+        keyed_jobs.append(((job.priority, start_date, job.fecha_de_pedido or date.max), job, start_date))
+
+    # Sort (stable on key only; Job instances are not orderable)
+    keyed_jobs.sort(key=itemgetter(0))
+    augmented_jobs = [(job, start_date) for _, job, start_date in keyed_jobs]
 
-    # Sort
-    augmented_jobs.sort(key=lambda x: (x[0].priority, x[1], x[0].fecha_de_pedido or date.max))
+    # Line eligibility depends only on the part, so resolve it once per material
+    # instead of re-checking every line's constraints for every job.
+    valid_lines_by_material: dict[str, list[Line]] = {}
+    # One (load, line_id) min-heap per distinct eligible line set. A line can sit in
+    # several heaps, so entries go stale when another set loads it; stale tops are
+    # refreshed lazily (loads only grow, so a matching top is the true minimum).
+    load_heaps: dict[tuple[str, ...], list[tuple[int, str]]] = {}
 
     for job, start_date in augmented_jobs:
         part = get_part(job.material)
@@ -172,7 +185,10 @@ def generate_dispatch_program(
             continue
 
         # Filter valid lines
-        valid_lines = [line for line in sorted_lines if check_constraints(line, part)]
+        valid_lines = valid_lines_by_material.get(part.material)
+        if valid_lines is None:
+            valid_lines = [line for line in sorted_lines if check_constraints(line, part)]
+            valid_lines_by_material[part.material] = valid_lines
 
         if not valid_lines:
             errors.append(
@@ -193,8 +209,17 @@ def generate_dispatch_program(
             continue
 
         # Assign to min-load line
-        # Load balancing by quantity (piezas)
-        chosen_line = min(valid_lines, key=lambda l: line_loads[l.line_id])
+        # Load balancing by quantity (piezas); ties go to the lowest line_id
+        heap_key = tuple(line.line_id for line in valid_lines)
+        heap = load_heaps.get(heap_key)
+        if heap is None:
+            heap = [(line_loads[lid], lid) for lid in heap_key]
+            heapq.heapify(heap)
+            load_heaps[heap_key] = heap
+        while heap[0][0] != line_loads[heap[0][1]]:
+            lid = heap[0][1]
+            heapq.heapreplace(heap, (line_loads[lid], lid))
+        chosen_line_id = heap[0][1]
 
         # Add to queue
         row = {
@@ -220,8 +245,9 @@ def generate_dispatch_program(
             "familia": part.family_id,  # Legacy alias for UI
         }
 
-        queues[chosen_line.line_id].append(row)
-        line_loads[chosen_line.line_id] += job.qty
+        queues[chosen_line_id].append(row)
+        line_loads[chosen_line_id] += job.qty
+        heapq.heapreplace(heap, (line_loads[chosen_line_id], chosen_line_id))
 
     # Return formatted queues
     return queues, errors
@@ -1,11 +1,13 @@
 from __future__ import annotations
 
-from datetime import date
+from datetime import date, timedelta
+
+import numpy as np
 
 from foundryplan.data.repository_views import PlannerRepository
 from foundryplan.planner.extract import prepare_planner_inputs
 from foundryplan.planner.model import PlannerOrder, PlannerPart
-from foundryplan.planner.persist import save_schedule_result, delete_old_schedule_results
+from foundryplan.planner.persist import save_schedule_result
 from foundryplan.planner.solve import solve_planner_heuristic
 
 
@@ -186,21 +188,106 @@ def run_planner(
         allow_molding_gaps=bool(allow_molding_gaps) if allow_molding_gaps is not None else False,
     )
     
-    # Persist result to database
+    # Persist result to database and clean up old results (keep last 10), one connection
     full_result = {**result_base, **result}
     save_schedule_result(
         repo._repo.db,
         scenario_id=scenario_id,
         asof_date=asof_date.isoformat(),
         result=full_result,
+        keep_last_n=10,
     )
     
-    # Clean up old results (keep last 10)
-    delete_old_schedule_results(repo._repo.db, scenario_id=scenario_id, keep_last_n=10)
-    
     return full_result
 
 
+def week_labels_by_day(workdays: list[date]) -> list[str]:
+    """Week label (its Monday, ISO date) of each workday, indexed like ``workdays``."""
+    return [(d - timedelta(days=d.weekday())).isoformat() for d in workdays]
+
+
+def aggregate_weekly_totals(
+    molds_schedule: dict[str, dict],
+    workdays: list[date],
+    orders_rows: list[dict],
+    parts_rows: list[dict],
+) -> tuple[list[str], dict[str, int], dict[str, float], dict[str, dict[str, int]]]:
+    """Aggregate a molds schedule into weekly molds, tons and flask usage.
+
+    Weeks are labelled by their Monday (ISO date) in calendar order. Only weeks
+    with scheduled molds appear in the returned dicts. Sums are computed with
+    ``np.bincount`` over flat (week, qty) arrays instead of per-order dict updates.
+
+    Returns:
+        (week_labels, week_molds, week_tons, week_flask)
+    """
+    week_labels: list[str] = []
+    week_pos: dict[str, int] = {}
+    day_to_week_idx: dict[int, int] = {}
+    for idx, label in enumerate(week_labels_by_day(workdays)):
+        if label not in week_pos:
+            week_pos[label] = len(week_labels)
+            week_labels.append(label)
+        day_to_week_idx[idx] = week_pos[label]
+
+    order_part: dict[str, str] = {}
+    for r in orders_rows:
+        order_part.setdefault(str(r.get("order_id")), str(r.get("part_id")))
+    part_info: dict[str, tuple[float, str]] = {
+        str(r["part_id"]): (
+            float(r.get("net_weight_ton") or 0.0) * float(r.get("pieces_per_mold") or 0.0),
+            str(r.get("flask_type") or "").upper(),
+        )
+        for r in parts_rows
+    }
+
+    flask_types: list[str] = []
+    flask_pos: dict[str, int] = {}
+    weeks: list[int] = []
+    qtys: list[int] = []
+    weights: list[float] = []
+    flask_idx: list[int] = []
+    for order_id, day_map in molds_schedule.items():
+        weight_per_mold, flask_type = part_info.get(order_part.get(str(order_id), ""), (0.0, ""))
+        f_idx = -1
+        if flask_type:
+            if flask_type not in flask_pos:
+                flask_pos[flask_type] = len(flask_types)
+                flask_types.append(flask_type)
+            f_idx = flask_pos[flask_type]
+        for day_idx, qty in day_map.items():
+            w_idx = day_to_week_idx.get(int(day_idx))
+            if w_idx is None:
+                continue
+            weeks.append(w_idx)
+            qtys.append(int(qty))
+            weights.append(weight_per_mold)
+            flask_idx.append(f_idx)
+
+    n_weeks = len(week_labels)
+    week_arr = np.asarray(weeks, dtype=np.int64)
+    qty_arr = np.asarray(qtys, dtype=np.float64)
+    present = np.bincount(week_arr, minlength=n_weeks) > 0
+    molds = np.bincount(week_arr, weights=qty_arr, minlength=n_weeks)
+    tons = np.bincount(week_arr, weights=qty_arr * np.asarray(weights, dtype=np.float64), minlength=n_weeks)
+
+    week_molds = {week_labels[w]: int(molds[w]) for w in np.flatnonzero(present)}
+    week_tons = {week_labels[w]: float(tons[w]) for w in np.flatnonzero(present)}
+
+    week_flask: dict[str, dict[str, int]] = {}
+    f_arr = np.asarray(flask_idx, dtype=np.int64)
+    has_flask = f_arr >= 0
+    if has_flask.any():
+        n_flask = len(flask_types)
+        cells = week_arr[has_flask] * n_flask + f_arr[has_flask]
+        grid_hits = np.bincount(cells, minlength=n_weeks * n_flask).reshape(n_weeks, n_flask)
+        grid = np.bincount(cells, weights=qty_arr[has_flask], minlength=n_weeks * n_flask).reshape(n_weeks, n_flask)
+        for w, f in zip(*np.nonzero(grid_hits)):
+            week_flask.setdefault(week_labels[w], {})[flask_types[f]] = int(grid[w, f])
+
+    return week_labels, week_molds, week_tons, week_flask
+
+
 def build_weekly_view(
     molds_schedule: dict[str, dict[int, int]] | None,
     workdays: list[date],
@@ -11,9 +11,13 @@ def prepare_planner_inputs(
     scenario_name: str = "default",
     asof_date: date,
     horizon_buffer_days: int = 10,
+    force: bool = False,
 ) -> dict:
     """Populate planner_* tables from current SAP snapshots + master data.
 
+    The rebuild is skipped when the inputs are unchanged since the last sync,
+    unless ``force`` is set.
+
     Returns a summary dict with counts.
     """
     scenario_id = repo.ensure_planner_scenario(name=scenario_name)
@@ -21,4 +25,5 @@ def prepare_planner_inputs(
         scenario_id=scenario_id,
         asof_date=asof_date,
         horizon_buffer_days=horizon_buffer_days,
+        force=force,
     )
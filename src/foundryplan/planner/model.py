@@ -3,7 +3,7 @@ from __future__ import annotations
 from dataclasses import dataclass
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class PlannerOrder:
     order_id: str
     part_id: str
@@ -12,7 +12,7 @@ class PlannerOrder:
     priority: int
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class PlannerPart:
     part_id: str
     flask_type: str  # dynamic flask type code
@@ -24,7 +24,7 @@ class PlannerPart:
     alloy: str | None = None
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class PlannerResource:
     flask_capacity: dict[str, int]
     flask_codes: dict[str, list[str]]
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import json
+import sqlite3
 from datetime import datetime
 from typing import Any
 
@@ -13,6 +14,7 @@ def save_schedule_result(
     scenario_id: int,
     asof_date: str,
     result: dict[str, Any],
+    keep_last_n: int | None = None,
 ) -> None:
     """Save planner schedule result to database.
     
@@ -21,6 +23,8 @@ def save_schedule_result(
         scenario_id: Planner scenario ID
         asof_date: ISO date string (YYYY-MM-DD)
         result: Output dict from solve_planner_heuristic/run_planner
+        keep_last_n: If set, also prune older results (see delete_old_schedule_results)
+            on the same connection and transaction
     """
     run_timestamp = datetime.now().isoformat()
     
@@ -55,7 +59,8 @@ def save_schedule_result(
                 result.get("objective"),
             ),
         )
-        con.commit()
+        if keep_last_n is not None:
+            _delete_old_schedule_results(con, scenario_id=scenario_id, keep_last_n=keep_last_n)
 
 
 def get_latest_schedule_result(
@@ -72,7 +77,7 @@ def get_latest_schedule_result(
     Returns:
         Dict with same structure as solve_planner_heuristic output, or None if no result found
     """
-    with db.connect() as con:
+    with db.shared_conn() as con:
         row = con.execute(
             """
             SELECT 
@@ -127,19 +132,27 @@ def delete_old_schedule_results(
         keep_last_n: Number of results to keep (default 10)
     """
     with db.connect() as con:
-        con.execute(
-            """
-            DELETE FROM planner_schedule_results
+        _delete_old_schedule_results(con, scenario_id=scenario_id, keep_last_n=keep_last_n)
+
+
+def _delete_old_schedule_results(
+    con: sqlite3.Connection,
+    *,
+    scenario_id: int,
+    keep_last_n: int,
+) -> None:
+    con.execute(
+        """
+        DELETE FROM planner_schedule_results
+        WHERE scenario_id = ?
+        AND run_timestamp NOT IN (
+            SELECT run_timestamp
+            FROM planner_schedule_results
             WHERE scenario_id = ?
-            AND run_timestamp NOT IN (
-                SELECT run_timestamp
-                FROM planner_schedule_results
-                WHERE scenario_id = ?
-                ORDER BY run_timestamp DESC
-                LIMIT ?
-            )
-            """,
-            (scenario_id, scenario_id, keep_last_n),
+            ORDER BY run_timestamp DESC
+            LIMIT ?
         )
-        con.commit()
+        """,
+        (scenario_id, scenario_id, keep_last_n),
+    )
 
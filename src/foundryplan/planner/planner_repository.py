@@ -2,6 +2,7 @@
 
 from __future__ import annotations
 
+import hashlib
 import json
 import math
 import re
@@ -16,6 +17,28 @@ if TYPE_CHECKING:
     from foundryplan.data.data_repository import DataRepositoryImpl
 
 
+_PLANNER_PARTS_INSERT_SQL = """
+    INSERT INTO planner_parts(
+        scenario_id, part_id, flask_size, cool_hours, finish_days, min_finish_days,
+        pieces_per_mold, net_weight_ton, alloy
+    ) VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+_PLANNER_ORDERS_INSERT_SQL = """
+    INSERT INTO planner_orders(
+        scenario_id, order_id, part_id, qty, due_date, priority
+    ) VALUES(?, ?, ?, ?, ?, ?)
+"""
+_PLANNER_CALENDAR_INSERT_SQL = """
+    INSERT INTO planner_calendar_workdays(
+        scenario_id, workday_index, date, week_index
+    ) VALUES(?, ?, ?, ?)
+"""
+_PLANNER_PROGRESS_INSERT_SQL = """
+    INSERT INTO planner_initial_order_progress (scenario_id, asof_date, order_id, remaining_molds)
+    VALUES (?, ?, ?, ?)
+"""
+
+
 class PlannerRepositoryImpl:
     """Planner data access: scenarios, orders/parts/resources, calendar, schedules."""
 
@@ -328,7 +351,6 @@ class PlannerRepositoryImpl:
                 """,
                 rows_to_insert,
             )
-            con.commit()
         
         logger.info(f"Rebuilt {len(rows_to_insert)} daily resource records for scenario {scenario_id} (horizon={horizon_days})")
 
@@ -438,7 +460,6 @@ class PlannerRepositoryImpl:
                 """,
                 updates_piezas,
             )
-            con.commit()
         
         logger.info(f"Phase 2: Decremented {len(updates_piezas)} daily flask records from piezas_fundidas")
         
@@ -583,7 +604,6 @@ class PlannerRepositoryImpl:
                 """,
                 updates_moldes,
             )
-            con.commit()
         
         # Apply pouring capacity decrements
         updates_pouring = []
@@ -599,7 +619,6 @@ class PlannerRepositoryImpl:
                 """,
                 updates_pouring,
             )
-            con.commit()
         
         logger.info(f"Phase 3: Scheduled {moldes_scheduled} moldes_por_fundir, decremented {len(updates_moldes)} flask records, {len(updates_pouring)} pouring records")
 
@@ -619,32 +638,18 @@ class PlannerRepositoryImpl:
     def replace_planner_parts(self, *, scenario_id: int, rows: list[tuple]) -> None:
         with self.db.connect() as con:
             con.execute("DELETE FROM planner_parts WHERE scenario_id = ?", (int(scenario_id),))
-            con.executemany(
-                """
-                INSERT INTO planner_parts(
-                    scenario_id, part_id, flask_size, cool_hours, finish_days, min_finish_days,
-                    pieces_per_mold, net_weight_ton, alloy
-                ) VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                rows,
-            )
+            con.executemany(_PLANNER_PARTS_INSERT_SQL, rows)
 
     def replace_planner_orders(self, *, scenario_id: int, rows: list[tuple]) -> None:
         with self.db.connect() as con:
             con.execute("DELETE FROM planner_orders WHERE scenario_id = ?", (int(scenario_id),))
-            con.executemany(
-                """
-                INSERT INTO planner_orders(
-                    scenario_id, order_id, part_id, qty, due_date, priority
-                ) VALUES(?, ?, ?, ?, ?, ?)
-                """,
-                rows,
-            )
+            con.executemany(_PLANNER_ORDERS_INSERT_SQL, rows)
 
     def get_planner_orders_rows(self, *, scenario_id: int) -> list[dict]:
         """Return planner orders for UI selection (patterns loaded)."""
-        with self.db.connect() as con:
-            rows = con.execute(
+        with self.db.shared_conn() as con:
+            # Consume the cursor directly; no intermediate fetchall() list
+            cur = con.execute(
                 """
                 SELECT order_id, part_id, qty, due_date, priority
                 FROM planner_orders
@@ -652,21 +657,21 @@ class PlannerRepositoryImpl:
                 ORDER BY priority ASC, due_date ASC, order_id ASC
                 """,
                 (int(scenario_id),),
-            ).fetchall()
-        return [
-            {
-                "order_id": str(r[0]),
-                "part_id": str(r[1]),
-                "qty": int(r[2] or 0),
-                "due_date": str(r[3] or ""),
-                "priority": int(r[4] or 0),
-            }
-            for r in rows
-        ]
+            )
+            return [
+                {
+                    "order_id": str(r[0]),
+                    "part_id": str(r[1]),
+                    "qty": int(r[2] or 0),
+                    "due_date": str(r[3] or ""),
+                    "priority": int(r[4] or 0),
+                }
+                for r in cur
+            ]
 
     def get_planner_parts_rows(self, *, scenario_id: int) -> list[dict]:
-        with self.db.connect() as con:
-            rows = con.execute(
+        with self.db.shared_conn() as con:
+            cur = con.execute(
                 """
                 SELECT part_id, flask_size, cool_hours, finish_days, min_finish_days,
                        pieces_per_mold, net_weight_ton, alloy
@@ -674,24 +679,24 @@ class PlannerRepositoryImpl:
                 WHERE scenario_id = ?
                 """,
                 (int(scenario_id),),
-            ).fetchall()
-        return [
-            {
-                "part_id": str(r[0]),
-                "flask_type": str(r[1] or ""),
-                "cool_hours": float(r[2] or 0.0),
-                "finish_days": int(r[3] or 0),
-                "min_finish_days": int(r[4] or 0),
-                "pieces_per_mold": float(r[5] or 0.0),
-                "net_weight_ton": float(r[6] or 0.0),
-                "alloy": str(r[7]) if r[7] is not None else None,
-            }
-            for r in rows
-        ]
+            )
+            return [
+                {
+                    "part_id": str(r[0]),
+                    "flask_type": str(r[1] or ""),
+                    "cool_hours": float(r[2] or 0.0),
+                    "finish_days": int(r[3] or 0),
+                    "min_finish_days": int(r[4] or 0),
+                    "pieces_per_mold": float(r[5] or 0.0),
+                    "net_weight_ton": float(r[6] or 0.0),
+                    "alloy": str(r[7]) if r[7] is not None else None,
+                }
+                for r in cur
+            ]
 
     def get_planner_calendar_rows(self, *, scenario_id: int) -> list[dict]:
-        with self.db.connect() as con:
-            rows = con.execute(
+        with self.db.shared_conn() as con:
+            cur = con.execute(
                 """
                 SELECT workday_index, date
                 FROM planner_calendar_workdays
@@ -699,31 +704,25 @@ class PlannerRepositoryImpl:
                 ORDER BY workday_index ASC
                 """,
                 (int(scenario_id),),
-            ).fetchall()
-        return [
-            {"workday_index": int(r[0]), "date": str(r[1])}
-            for r in rows
-        ]
+            )
+            return [
+                {"workday_index": int(r[0]), "date": str(r[1])}
+                for r in cur
+            ]
 
     def replace_planner_calendar(self, *, scenario_id: int, rows: list[tuple]) -> None:
         with self.db.connect() as con:
             con.execute("DELETE FROM planner_calendar_workdays WHERE scenario_id = ?", (int(scenario_id),))
-            con.executemany(
-                """
-                INSERT INTO planner_calendar_workdays(
-                    scenario_id, workday_index, date, week_index
-                ) VALUES(?, ?, ?, ?)
-                """,
-                rows,
-            )
+            con.executemany(_PLANNER_CALENDAR_INSERT_SQL, rows)
 
     def get_planner_resources(self, *, scenario_id: int) -> dict | None:
-        with self.db.connect() as con:
+        with self.db.shared_conn() as con:
             row = con.execute(
                 """
                 SELECT molding_max_per_day, molding_max_same_part_per_day, pour_max_ton_per_day, notes,
                        molding_max_per_shift, molding_shifts_json, pour_max_ton_per_shift, pour_shifts_json,
-                       heats_per_shift, tons_per_heat, max_placement_search_days, allow_molding_gaps
+                       heats_per_shift, tons_per_heat, max_placement_search_days, allow_molding_gaps,
+                       pour_lag_days, shakeout_lag_days
                 FROM planner_resources
                 WHERE scenario_id = ?
                 """,
@@ -771,6 +770,8 @@ class PlannerRepositoryImpl:
             "tons_per_heat": float(row["tons_per_heat"] or 0.0),
             "max_placement_search_days": int(row["max_placement_search_days"] or 365),
             "allow_molding_gaps": bool(row["allow_molding_gaps"] or 0),
+            "pour_lag_days": int(row["pour_lag_days"]) if row["pour_lag_days"] is not None else None,
+            "shakeout_lag_days": int(row["shakeout_lag_days"]) if row["shakeout_lag_days"] is not None else None,
             "notes": str(row["notes"] or ""),
             "flask_types": [
                 {
@@ -1020,13 +1021,7 @@ class PlannerRepositoryImpl:
     def replace_planner_initial_order_progress(self, *, scenario_id: int, rows: list[tuple]) -> None:
         with self.db.connect() as con:
             con.execute("DELETE FROM planner_initial_order_progress WHERE scenario_id = ?", (scenario_id,))
-            con.executemany(
-                """
-                INSERT INTO planner_initial_order_progress (scenario_id, asof_date, order_id, remaining_molds)
-                VALUES (?, ?, ?, ?)
-                """,
-                rows,
-            )
+            con.executemany(_PLANNER_PROGRESS_INSERT_SQL, rows)
 
     def get_planner_initial_order_progress_rows(self, *, scenario_id: int, asof_date) -> list[dict]:
         asof_iso = asof_date.isoformat() if hasattr(asof_date, "isoformat") else str(asof_date)
@@ -1069,15 +1064,52 @@ class PlannerRepositoryImpl:
         # Currently no-op since we don't track line state yet
         pass
 
+    def get_planner_inputs_fingerprint(
+        self,
+        *,
+        scenario_id: int,
+        asof_date: date,
+        horizon_buffer_days: int = 10,
+    ) -> str:
+        """Hash every input read by sync_planner_inputs_from_sap.
+
+        Covers the Vision columns, priorities, material master, scenario resources,
+        flask types and holidays the sync consumes, plus its arguments. Rows are
+        hashed in scan order, so a reordered but equal table only costs a re-sync.
+        """
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"{asof_date.isoformat()}|{int(horizon_buffer_days)}".encode())
+        sid = int(scenario_id)
+        queries: list[tuple[str, tuple]] = [
+            ("SELECT pedido, posicion, cod_material, fecha_de_pedido, solicitado FROM core_sap_vision_snapshot", ()),
+            ("SELECT pedido, posicion, is_priority, kind FROM orderpos_priority", ()),
+            ("SELECT * FROM core_material_master", ()),
+            ("SELECT * FROM planner_resources WHERE scenario_id = ?", (sid,)),
+            ("SELECT * FROM planner_flask_types WHERE scenario_id = ?", (sid,)),
+            ("SELECT config_value FROM core_config WHERE config_key = 'planner_holidays'", ()),
+        ]
+        # Same connection as the sync: inside a caller's transaction it must hash the
+        # uncommitted writes (e.g. the flask backfill) the sync goes on to read.
+        with self.db.connect() as con:
+            for sql, params in queries:
+                h.update(b"\x1e")
+                for r in con.execute(sql, params):
+                    h.update(repr(tuple(r)).encode())
+        return h.hexdigest()
+
     def sync_planner_inputs_from_sap(
         self,
         *,
         scenario_id: int,
         asof_date: date,
         horizon_buffer_days: int = 10,
+        force: bool = False,
     ) -> dict:
         """Build planner inputs from current SAP snapshots and master data.
 
+        Skips the rebuild (returning the previous summary) when the input
+        fingerprint matches the last sync for this scenario, unless ``force``.
+
         Returns summary stats.
         """
         asof_iso = asof_date.isoformat()
@@ -1100,6 +1132,21 @@ class PlannerRepositoryImpl:
         
         self.update_master_flasks_from_history(flask_codes_map)
 
+        # Fingerprint after the flask backfill above (it writes to the material master)
+        fingerprint = self.get_planner_inputs_fingerprint(
+            scenario_id=scenario_id,
+            asof_date=asof_date,
+            horizon_buffer_days=horizon_buffer_days,
+        )
+        if not force:
+            with self.db.connect() as con:
+                row = con.execute(
+                    "SELECT inputs_fingerprint, inputs_summary_json FROM planner_scenarios WHERE scenario_id = ?",
+                    (int(scenario_id),),
+                ).fetchone()
+            if row and row["inputs_fingerprint"] == fingerprint and row["inputs_summary_json"]:
+                return json.loads(row["inputs_summary_json"])
+
         # Orders from Vision
         with self.db.connect() as con:
             orders_rows = con.execute(
@@ -1107,12 +1154,12 @@ class PlannerRepositoryImpl:
                 SELECT
                     v.pedido,
                     v.posicion,
-                    MAX(COALESCE(v.cod_material, '')) AS material,
-                    MAX(COALESCE(v.fecha_de_pedido, '')) AS fecha_de_pedido,
-                    MAX(COALESCE(v.solicitado, 0)) AS solicitado
-                FROM core_sap_vision_snapshot v
-                GROUP BY v.pedido, v.posicion
-                HAVING MAX(COALESCE(v.fecha_de_pedido, '')) <> ''
+                    COALESCE(v.cod_material, '') AS material,
+                    v.fecha_de_pedido_max AS fecha_de_pedido,
+                    v.solicitado
+                FROM core_sap_vision_orderpos v
+                -- '9999-12-31' is the orderpos stand-in for a missing fecha_de_pedido
+                WHERE v.fecha_de_pedido_max NOT IN ('', '9999-12-31')
                 """,
             ).fetchall()
 
@@ -1271,13 +1318,7 @@ class PlannerRepositoryImpl:
         progress_rows = self.get_planner_initial_order_progress(asof_date=asof_date)
         progress_out = [(scenario_id, r["asof_date"], r["order_id"], int(r["remaining_molds"])) for r in progress_rows]
 
-        # Persist all (flask/pour state now managed by planner_daily_resources)
-        self.replace_planner_parts(scenario_id=scenario_id, rows=parts_out)
-        self.replace_planner_orders(scenario_id=scenario_id, rows=orders_out)
-        self.replace_planner_calendar(scenario_id=scenario_id, rows=workdays)
-        self.replace_planner_initial_order_progress(scenario_id=scenario_id, rows=progress_out)
-
-        return {
+        summary = {
             "scenario_id": int(scenario_id),
             "orders": len(orders_out),
             "parts": len(parts_out),
@@ -1285,10 +1326,29 @@ class PlannerRepositoryImpl:
             "missing_parts": missing_parts_list,
             "skipped_orders": skipped_orders_count,
         }
+        # Persist all in a single write transaction (flask/pour state now managed by
+        # planner_daily_resources): one lock/fsync instead of one per table.
+        sid = int(scenario_id)
+        with self.db.connect() as con:
+            if not con.in_transaction:
+                con.execute("BEGIN IMMEDIATE")
+            for table, insert_sql, rows in (
+                ("planner_parts", _PLANNER_PARTS_INSERT_SQL, parts_out),
+                ("planner_orders", _PLANNER_ORDERS_INSERT_SQL, orders_out),
+                ("planner_calendar_workdays", _PLANNER_CALENDAR_INSERT_SQL, workdays),
+                ("planner_initial_order_progress", _PLANNER_PROGRESS_INSERT_SQL, progress_out),
+            ):
+                con.execute(f"DELETE FROM {table} WHERE scenario_id = ?", (sid,))
+                con.executemany(insert_sql, rows)
+            con.execute(
+                "UPDATE planner_scenarios SET inputs_fingerprint = ?, inputs_summary_json = ? WHERE scenario_id = ?",
+                (fingerprint, json.dumps(summary), sid),
+            )
+        return summary
 
     def get_daily_resources_rows(self, *, scenario_id: int) -> list[dict]:
         """Get all daily resources for a scenario (for UI display)."""
-        with self.db.connect() as con:
+        with self.db.shared_conn() as con:
             rows = con.execute(
                 """
                 SELECT day, flask_type, available_qty, molding_capacity_per_day, 
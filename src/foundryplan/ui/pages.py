@@ -9,7 +9,7 @@ from datetime import date, datetime, timedelta
 from nicegui import ui
 
 from foundryplan.dispatcher.scheduler import generate_dispatch_program
-from foundryplan.planner.api import run_planner
+from foundryplan.planner.api import aggregate_weekly_totals, run_planner, week_labels_by_day
 from foundryplan.data.repository import Repository
 from foundryplan.ui.widgets import page_container, render_line_tables, render_nav
 
@@ -169,8 +169,7 @@ def register_pages(repo: Repository) -> None:
                 }
             ).classes("w-full")
 
-            overdue = repo.data.get_orders_overdue_rows(limit=2000)
-            due_soon = repo.data.get_orders_due_soon_rows(days=49, limit=200)
+            overdue, due_soon = repo.data.get_orders_dashboard_rows(days=49, overdue_limit=2000, due_soon_limit=200)
 
             # Para alinear el título con el último valor del gráfico (KPI diario),
             # usamos la última muestra de `tons_atrasadas` si existe.
@@ -1053,57 +1052,13 @@ def register_pages(repo: Repository) -> None:
                     
                     workdays = [date.fromisoformat(r["date"]) for r in calendar_rows]
                     
-                    # Build part lookup
-                    part_map = {}
-                    for pr in parts_rows:
-                        pid = str(pr["part_id"])
-                        part_map[pid] = {
-                            "pieces_per_mold": float(pr.get("pieces_per_mold") or 0.0),
-                            "net_weight_ton": float(pr.get("net_weight_ton") or 0.0),
-                            "flask_type": str(pr.get("flask_type") or "").upper(),
-                        }
-                    
-                    # Week mapping
-                    week_labels: list[str] = []
-                    day_to_week: dict[int, str] = {}
-                    for idx, d in enumerate(workdays):
-                        week_start = d - timedelta(days=d.weekday())
-                        label = week_start.strftime("%Y-%m-%d")
-                        if label not in week_labels:
-                            week_labels.append(label)
-                        day_to_week[idx] = label
-                    
                     # Aggregates
-                    molds_schedule = result.get("molds_schedule") or {}
-                    week_molds: dict[str, int] = {}
-                    week_tons: dict[str, float] = {}
-                    week_flask: dict[str, dict[str, int]] = {}
-                    
-                    for order_id, day_map in molds_schedule.items():
-                        # Find part
-                        part_id = None
-                        for row in orders_rows:
-                            if str(row.get("order_id")) == str(order_id):
-                                part_id = str(row.get("part_id"))
-                                break
-                        part = part_map.get(part_id or "")
-                        weight_per_mold = 0.0
-                        flask_type = ""
-                        if part:
-                            weight_per_mold = float(part.get("net_weight_ton") or 0.0) * float(part.get("pieces_per_mold") or 0.0)
-                            flask_type = str(part.get("flask_type") or "")
-                        
-                        for day_idx, qty in day_map.items():
-                            week = day_to_week.get(int(day_idx))
-                            if week is None:
-                                continue
-                            
-                            week_molds[week] = week_molds.get(week, 0) + qty
-                            week_tons[week] = week_tons.get(week, 0.0) + (qty * weight_per_mold)
-                            if flask_type:
-                                if week not in week_flask:
-                                    week_flask[week] = {}
-                                week_flask[week][flask_type] = week_flask[week].get(flask_type, 0) + qty
+                    week_labels, week_molds, week_tons, week_flask = aggregate_weekly_totals(
+                        result.get("molds_schedule") or {},
+                        workdays,
+                        orders_rows,
+                        parts_rows,
+                    )
                     
                     # Build table
                     rows = []
@@ -1176,7 +1131,10 @@ def register_pages(repo: Repository) -> None:
                 async def _replan() -> None:
                     scenario_name = str(scenario.value or "default").strip() or "default"
                     try:
-                        plan_container.clear()
+                        # Show the last saved plan as a provisional view while the planner runs
+                        _render_last_saved_plan(scenario_name)
+                        with plan_container:
+                            ui.label("⏳ Recalculando plan… se muestra el último plan guardado.").classes("text-xs text-slate-500 mt-1")
                     except RuntimeError:
                         # Client disconnected before we started
                         return
@@ -1201,58 +1159,19 @@ def register_pages(repo: Repository) -> None:
                         )
                         workdays = [date.fromisoformat(r["date"]) for r in calendar_rows]
 
-                        # Build part lookup
-                        part_map = {}
-                        for pr in parts_rows:
-                            pid = str(pr["part_id"])
-                            part_map[pid] = {
-                                "pieces_per_mold": float(pr.get("pieces_per_mold") or 0.0),
-                                "net_weight_ton": float(pr.get("net_weight_ton") or 0.0),
-                                "flask_type": str(pr.get("flask_type") or "").upper(),
-                            }
-
-                        # Week mapping
-                        week_labels: list[str] = []
-                        day_to_week: dict[int, str] = {}
-                        for idx, d in enumerate(workdays):
-                            week_start = d - timedelta(days=d.weekday())
-                            label = week_start.strftime("%Y-%m-%d")
-                            if label not in week_labels:
-                                week_labels.append(label)
-                            day_to_week[idx] = label
-
                         # Aggregates
                         molds_schedule = result.get("molds_schedule") or {}
                         completion_days = result.get("completion_days") or {}
                         late_days = result.get("late_days") or {}
 
-                        week_molds: dict[str, int] = {}
-                        week_tons: dict[str, float] = {}
-                        week_flask: dict[str, dict[str, int]] = {}
-
-                        for order_id, day_map in molds_schedule.items():
-                            # Find part
-                            part_id = None
-                            for row in orders_rows:
-                                if str(row.get("order_id")) == str(order_id):
-                                    part_id = str(row.get("part_id"))
-                                    break
-                            part = part_map.get(part_id or "")
-                            weight_per_mold = 0.0
-                            flask_type = ""
-                            if part:
-                                weight_per_mold = float(part.get("net_weight_ton") or 0.0) * float(part.get("pieces_per_mold") or 0.0)
-                                flask_type = str(part.get("flask_type") or "")
-
-                            for day_idx, qty in day_map.items():
-                                week = day_to_week.get(int(day_idx))
-                                if week is None:
-                                    continue
-                                week_molds[week] = week_molds.get(week, 0) + int(qty)
-                                week_tons[week] = week_tons.get(week, 0.0) + weight_per_mold * int(qty)
-                                if flask_type:
-                                    wf = week_flask.setdefault(week, {})
-                                    wf[flask_type] = wf.get(flask_type, 0) + int(qty)
+                        week_labels, week_molds, week_tons, week_flask = aggregate_weekly_totals(
+                            molds_schedule, workdays, orders_rows, parts_rows
+                        )
+                        # Per-order cells use the same week labels, by day index
+                        day_to_week = dict(enumerate(week_labels_by_day(workdays)))
+                        part_flask = {
+                            str(pr["part_id"]): str(pr.get("flask_type") or "").upper() for pr in parts_rows
+                        }
 
                         # Build rows
                         rows: list[dict] = []
@@ -1285,7 +1204,6 @@ def register_pages(repo: Repository) -> None:
                         for ord_row in orders_rows:
                             order_id = str(ord_row.get("order_id"))
                             part_id = str(ord_row.get("part_id"))
-                            part = part_map.get(part_id)
                             day_map = molds_schedule.get(order_id, {})
                             complete_day = completion_days.get(order_id)
                             deliver_day = complete_day + 1 if complete_day is not None else None
@@ -1306,8 +1224,8 @@ def register_pages(repo: Repository) -> None:
                                     base = row.get(wk)
                                     row[wk] = f"{base or ''}{marks}"
                             row["late"] = int(late_days.get(order_id, 0) or 0)
-                            if part:
-                                row["flask"] = str(part.get("flask_type") or "")
+                            if part_id in part_flask:
+                                row["flask"] = part_flask[part_id]
                             rows.append(row)
 
                         # Columns: Item + week labels
@@ -1322,6 +1240,7 @@ def register_pages(repo: Repository) -> None:
                             })
 
                         try:
+                            plan_container.clear()
                             with plan_container:
                                 ui.label("Plan heurístico (semanal)").classes("text-lg font-semibold mb-2")
                                 ui.table(columns=columns, rows=rows, row_key="item").classes("w-full").props("dense flat bordered")
@@ -1680,14 +1599,14 @@ def register_pages(repo: Repository) -> None:
                                             ui.button("Cerrar", on_click=dialog.close).props("flat")
 
                                             def save_all() -> None:
-                                                successes = 0
+                                                parts = []
                                                 failures = []
                                                 for part_code, w in entries.items():
                                                     try:
                                                         # Use example material to derive part_code (upsert_part_master extracts it)
                                                         material = w["material"]
                                                         fam_val = str(w["fam"].value or "Otros").strip() or "Otros"
-                                                        repo.data.upsert_part_master(
+                                                        parts.append(dict(
                                                             material=material,
                                                             family_id=fam_val,
                                                             vulcanizado_dias=int(w["v"].value or 0),
@@ -1699,10 +1618,12 @@ def register_pages(repo: Repository) -> None:
                                                             flask_size=str(w["flask"].value or "").strip(),
                                                             piezas_por_molde=float(w["ppm"].value or 0.0),
                                                             tiempo_enfriamiento_molde_horas=int(w["tenfr"].value or 0),
-                                                        )
-                                                        successes += 1
+                                                        ))
                                                     except Exception as ex:
                                                         failures.append((part_code, str(ex)))
+                                                # One transaction for the whole dialog
+                                                failures.extend(repo.data.upsert_part_masters(parts))
+                                                successes = len(entries) - len(failures)
 
                                                 # Report summary
                                                 if successes > 0:
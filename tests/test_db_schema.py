@@ -1,5 +1,6 @@
 """Tests for database schema and migrations."""
 
+import json
 import sqlite3
 import tempfile
 from pathlib import Path
@@ -265,3 +266,527 @@ def test_auto_test_detection_in_rebuild_orders(temp_db):
         total_count = cursor.fetchone()[0]
         
     assert total_count == 0, "All priorities should be removed when keep_tests=False"
+
+
+def test_rebuild_orders_uses_stored_correlativo_and_rejects_lotes_without_digits(temp_db):
+    db, db_path = temp_db
+    db.ensure_schema()
+    repo = Repository(db)
+
+    with db.connect() as con:
+        con.execute("UPDATE core_config SET config_value = '4022' WHERE config_key = 'sap_almacen_terminaciones'")
+        con.executemany(
+            """
+            INSERT INTO core_sap_mb52_snapshot (
+                centro, almacen, material, lote, documento_comercial, posicion_sd,
+                libre_utilizacion, en_control_calidad, correlativo_int, is_test
+            ) VALUES ('4000', '4022', '436001', ?, '5000001', '10', 1, 0, ?, 0)
+            """,
+            [("0030", 30), ("0031", None)],  # NULL correlativo_int is derived from the lote
+        )
+        con.execute(
+            "INSERT INTO core_sap_vision_snapshot (pedido, posicion, fecha_de_pedido, cod_material) "
+            "VALUES ('5000001', '10', '2024-03-15', '436001')"
+        )
+
+    assert repo.rebuild_orders_from_sap_for(process="terminaciones") == 1
+    with db.connect() as con:
+        row = con.execute("SELECT cantidad, primer_correlativo, ultimo_correlativo FROM core_orders").fetchone()
+        assert tuple(row) == (2, 30, 31)
+        con.execute(
+            """
+            INSERT INTO core_sap_mb52_snapshot (
+                centro, almacen, material, lote, documento_comercial, posicion_sd,
+                libre_utilizacion, en_control_calidad, correlativo_int, is_test
+            ) VALUES ('4000', '4022', '436001', 'PDXX', '5000001', '10', 1, 0, NULL, 1)
+            """
+        )
+
+    with pytest.raises(ValueError, match="PDXX"):
+        repo.rebuild_orders_from_sap_for(process="terminaciones")
+
+
+def test_shared_conn_is_cached_and_read_only(temp_db):
+    """shared_conn() reuses one connection per thread and rejects writes."""
+    db, db_path = temp_db
+    db.ensure_schema()
+
+    with db.shared_conn() as con1:
+        journal = con1.execute("PRAGMA journal_mode").fetchone()[0]
+    with db.shared_conn() as con2:
+        assert con2 is con1
+        with pytest.raises(sqlite3.OperationalError):
+            con2.execute("INSERT INTO core_family_catalog(family_id, label) VALUES ('X', 'X')")
+
+    assert journal.lower() == "wal"
+
+    # Writes through connect() are visible to the cached reader
+    with db.connect() as con:
+        con.execute("INSERT INTO core_family_catalog(family_id, label) VALUES ('Nueva', 'Nueva')")
+    with db.shared_conn() as con:
+        row = con.execute("SELECT 1 FROM core_family_catalog WHERE family_id = 'Nueva'").fetchone()
+    assert row is not None
+
+
+def test_connect_reuses_connection_and_scopes_nested_blocks(temp_db):
+    """connect() keeps one connection; nested blocks commit/roll back only their own work."""
+    db, db_path = temp_db
+    db.ensure_schema()
+
+    with db.connect() as outer:
+        outer.execute("INSERT INTO core_family_catalog(family_id, label) VALUES ('Outer', 'Outer')")
+        with pytest.raises(ValueError):
+            with db.connect() as inner:
+                assert inner is outer
+                inner.execute("INSERT INTO core_family_catalog(family_id, label) VALUES ('Inner', 'Inner')")
+                raise ValueError("boom")
+        with db.connect() as inner_ok:
+            inner_ok.execute("INSERT INTO core_family_catalog(family_id, label) VALUES ('InnerOk', 'InnerOk')")
+
+    other = sqlite3.connect(db_path)
+    try:
+        ids = {r[0] for r in other.execute("SELECT family_id FROM core_family_catalog")}
+    finally:
+        other.close()
+    assert {"Outer", "InnerOk"} <= ids
+    assert "Inner" not in ids
+
+    db.close()
+    with db.connect() as con:
+        assert con.execute("SELECT COUNT(*) FROM core_family_catalog WHERE family_id = 'Outer'").fetchone()[0] == 1
+
+
+def test_nested_planner_write_rolls_back_with_outer_block(temp_db):
+    """Helpers that write in their own connect() block do not commit the caller's transaction."""
+    from foundryplan.planner.persist import delete_old_schedule_results
+
+    db, db_path = temp_db
+    db.ensure_schema()
+
+    with pytest.raises(ValueError):
+        with db.connect() as con:
+            con.execute("INSERT INTO core_family_catalog(family_id, label) VALUES ('Pending', 'Pending')")
+            delete_old_schedule_results(db, scenario_id=1, keep_last_n=1)
+            raise ValueError("outer fails")
+
+    with db.connect() as con:
+        assert con.execute("SELECT COUNT(*) FROM core_family_catalog WHERE family_id = 'Pending'").fetchone()[0] == 0
+
+
+def test_after_commit_runs_on_outer_commit_and_drops_rolled_back_callbacks(temp_db):
+    db, _ = temp_db
+    calls = []
+    with db.connect():
+        db.after_commit(lambda: calls.append("kept"))
+        with pytest.raises(ValueError):
+            with db.connect():
+                db.after_commit(lambda: calls.append("dropped"))
+                raise ValueError("boom")
+        assert calls == []
+    assert calls == ["kept"]
+
+    db.after_commit(lambda: calls.append("now"))
+    assert calls == ["kept", "now"]
+    db.close()
+
+
+def test_close_releases_connections_of_other_threads(temp_db):
+    import threading
+
+    db, db_path = temp_db
+    db.ensure_schema()
+
+    opened = []
+
+    def worker():
+        with db.connect() as con:
+            con.execute("SELECT 1")
+        with db.shared_conn() as ro:
+            ro.execute("SELECT 1")
+        opened.extend([con, ro])
+
+    t = threading.Thread(target=worker)
+    t.start()
+    t.join()
+
+    db.close()
+    for con in opened:
+        with pytest.raises(sqlite3.ProgrammingError, match="closed"):
+            con.execute("SELECT 1")
+    with db.connect() as con:
+        assert con not in opened
+        assert con.execute("SELECT 1").fetchone()[0] == 1
+
+
+def test_bulk_insert_consumes_generator_in_batches(temp_db):
+    from foundryplan.data.db import bulk_insert
+
+    db, db_path = temp_db
+    db.ensure_schema()
+
+    rows = ((f"F{i}", f"Fam {i}") for i in range(25))
+    with db.connect() as con:
+        n = bulk_insert(con, "INSERT INTO core_family_catalog(family_id, label) VALUES(?, ?)", rows, batch_size=10)
+        assert con.in_transaction
+    assert n == 25
+    with db.connect() as con:
+        assert con.execute("SELECT COUNT(*) FROM core_family_catalog WHERE family_id LIKE 'F%'").fetchone()[0] == 25
+
+
+def test_bulk_insert_multirow_batches_respect_variable_limit(temp_db):
+    from foundryplan.data.db import bulk_insert
+
+    db, db_path = temp_db
+    db.ensure_schema()
+
+    with db.connect() as con:
+        old_limit = con.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 7)
+        try:
+            # 2 values per row -> at most 3 rows per multi-row statement
+            n = bulk_insert(
+                con,
+                "INSERT INTO core_family_catalog(family_id, label)\n VALUES(?, ?)\n",
+                [(f"M{i}", f"Fam {i}") for i in range(10)],
+            )
+            assert n == 10
+            with pytest.raises(sqlite3.ProgrammingError):
+                bulk_insert(con, "INSERT INTO core_family_catalog(family_id, label) VALUES(?, ?)", [("X1",), ("X2", "a", "b")])
+        finally:
+            con.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, old_limit)
+    with db.connect() as con:
+        rows = con.execute("SELECT family_id, label FROM core_family_catalog WHERE family_id LIKE 'M%' ORDER BY label").fetchall()
+        assert [tuple(r) for r in rows] == sorted((f"M{i}", f"Fam {i}") for i in range(10))
+        assert con.execute("SELECT COUNT(*) FROM core_family_catalog WHERE family_id LIKE 'X%'").fetchone()[0] == 0
+
+
+def test_lookup_tables_migrate_to_without_rowid(temp_db):
+    """Legacy rowid lookup tables are rebuilt as WITHOUT ROWID keeping their rows."""
+    db, db_path = temp_db
+    con = sqlite3.connect(db_path)
+    con.executescript(
+        """
+        CREATE TABLE dispatcher_orderpos_priority (
+            pedido TEXT NOT NULL,
+            posicion TEXT NOT NULL,
+            is_priority INTEGER NOT NULL DEFAULT 0,
+            kind TEXT,
+            PRIMARY KEY (pedido, posicion)
+        );
+        INSERT INTO dispatcher_orderpos_priority VALUES ('P1', '10', 1, 'test');
+        """
+    )
+    con.close()
+
+    db.ensure_schema()
+
+    with db.connect() as con:
+        sql = con.execute(
+            "SELECT sql FROM sqlite_master WHERE name = 'dispatcher_orderpos_priority'"
+        ).fetchone()[0]
+        assert "WITHOUT ROWID" in sql.upper()
+        # The compatibility view and its triggers still target the rebuilt table
+        con.execute("INSERT INTO orderpos_priority(pedido, posicion, is_priority, kind) VALUES ('P2', '20', 1, 'x')")
+        rows = {tuple(r) for r in con.execute("SELECT pedido, posicion FROM orderpos_priority")}
+    assert rows == {("P1", "10"), ("P2", "20")}
+
+
+def test_ensure_schema_skips_when_version_is_current(temp_db):
+    """A current schema_version short-circuits the DDL pass; a stale one re-runs it."""
+    from foundryplan.data.schema import SCHEMA_VERSION
+
+    db, db_path = temp_db
+    db.ensure_schema()
+
+    con = sqlite3.connect(db_path)
+    version = con.execute("SELECT config_value FROM core_config WHERE config_key = 'schema_version'").fetchone()[0]
+    assert version == str(SCHEMA_VERSION)
+    con.execute("DROP INDEX idx_mb52_material")
+    con.commit()
+    con.close()
+
+    db.ensure_schema()
+    con = sqlite3.connect(db_path)
+    assert con.execute("SELECT 1 FROM sqlite_master WHERE name = 'idx_mb52_material'").fetchone() is None
+    con.execute("UPDATE core_config SET config_value = '0' WHERE config_key = 'schema_version'")
+    con.commit()
+    con.close()
+
+    db.ensure_schema()
+    con = sqlite3.connect(db_path)
+    assert con.execute("SELECT 1 FROM sqlite_master WHERE name = 'idx_mb52_material'").fetchone() is not None
+    con.close()
+
+
+def test_rename_and_delete_family_update_line_families(temp_db):
+    """Family renames/deletes rewrite families_json of the dispatch lines that use them."""
+    db, _ = temp_db
+    db.ensure_schema()
+    repo = Repository(db)
+    repo.dispatcher.upsert_line(line_id=1, families=["Lifters", "Parrillas"])
+    repo.dispatcher.upsert_line(line_id=2, families=["Corazas", "Parrillas"])
+    repo.dispatcher.upsert_line(line_id=3, families=["Corazas"])
+
+    def families():
+        with db.connect() as con:
+            return {
+                int(r["line_id"]): json.loads(r["families_json"])
+                for r in con.execute("SELECT line_id, families_json FROM dispatcher_line_config")
+            }
+
+    repo.data.rename_family(old="Parrillas", new="Corazas")
+    assert families() == {1: ["Corazas", "Lifters"], 2: ["Corazas"], 3: ["Corazas"]}
+
+    repo.data.delete_family(name="Lifters", force=True)
+    assert families() == {1: ["Corazas", "Otros"], 2: ["Corazas"], 3: ["Corazas"]}
+
+    repo.data.delete_family(name="Corazas")
+    assert families() == {1: ["Otros"], 2: [], 3: []}
+
+
+def test_delete_family_moves_or_drops_part_mappings(temp_db):
+    """force=True reassigns the family's parts to 'Otros'; the default drops their mapping."""
+    db, _ = temp_db
+    db.ensure_schema()
+    repo = Repository(db)
+    repo.upsert_part_master(material="40330012345", family_id="Lifters")
+    repo.upsert_part_master(material="40330067890", family_id="Corazas")
+
+    def part_families():
+        with db.connect() as con:
+            return {r[0]: r[1] for r in con.execute("SELECT part_code, family_id FROM core_material_master")}
+
+    repo.data.delete_family(name="Lifters", force=True)
+    assert part_families() == {"12345": "Otros", "67890": "Corazas"}
+
+    repo.data.delete_family(name="Corazas")
+    assert part_families() == {"12345": "Otros"}
+
+
+def test_upsert_part_master_keeps_program_on_noop(temp_db):
+    """Re-upserting an identical part does not invalidate the last generated program."""
+    db, _ = temp_db
+    db.ensure_schema()
+    repo = Repository(db)
+
+    def save_program():
+        with db.connect() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO dispatcher_last_program(process, generated_on, program_json) "
+                "VALUES ('terminaciones', '2026-01-01', '{}')"
+            )
+
+    def has_program():
+        with db.connect() as con:
+            return con.execute("SELECT COUNT(*) FROM dispatcher_last_program").fetchone()[0] == 1
+
+    repo.upsert_part_master(material="40330012345", family_id="Lifters", peso_unitario_ton=1.5)
+    save_program()
+    repo.upsert_part_master(material="40330012345", family_id="Lifters", peso_unitario_ton=1.5)
+    assert has_program()
+
+    repo.upsert_part_master(material="40330012345", family_id="Lifters", peso_unitario_ton=2.0)
+    assert not has_program()
+
+
+def test_upsert_part_masters_skips_failing_rows(temp_db):
+    """The batch upsert keeps good rows and reports the failing ones."""
+    db, _ = temp_db
+    db.ensure_schema()
+    repo = Repository(db)
+
+    failures = repo.data.upsert_part_masters(
+        [
+            {"material": "40330012345", "family_id": "Lifters"},
+            {"material": "XYZ", "family_id": "Lifters"},
+            {"material": "40330054321", "family_id": "Parrillas"},
+        ]
+    )
+
+    assert [m for m, _ in failures] == ["XYZ"]
+    assert [r["part_code"] for r in repo.data.get_parts_rows()] == ["12345", "54321"]
+
+
+def test_upsert_part_masters_rolls_back_whole_failing_row(temp_db):
+    """A row failing after its family was added leaves no trace of that family."""
+    db, _ = temp_db
+    db.ensure_schema()
+    repo = Repository(db)
+    impl = repo.data._repo
+    log_audit = impl.log_audit
+
+    def failing_log_audit(category, message, details=None):
+        if message == "Upsert Part" and "54321" in details:
+            raise RuntimeError("audit failed")
+        log_audit(category, message, details)
+
+    impl.log_audit = failing_log_audit
+    failures = repo.data.upsert_part_masters(
+        [
+            {"material": "40330012345", "family_id": "Lifters"},
+            {"material": "40330054321", "family_id": "Nueva"},
+        ]
+    )
+    del impl.log_audit
+
+    assert [m for m, _ in failures] == ["40330054321"]
+    assert [r["part_code"] for r in repo.data.get_parts_rows()] == ["12345"]
+    with db.connect() as con:
+        families = {r[0] for r in con.execute("SELECT family_id FROM core_family_catalog")}
+    assert "Lifters" in families
+    assert "Nueva" not in families
+
+
+def test_mb52_flags_are_backfilled_and_not_null(temp_db):
+    """Legacy NULL MB52 flags become 0; new databases declare them NOT NULL DEFAULT 0."""
+    db, db_path = temp_db
+    con = sqlite3.connect(db_path)
+    con.executescript(
+        """
+        CREATE TABLE core_sap_mb52_snapshot (
+            snapshot_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            loaded_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            material TEXT NOT NULL,
+            material_base TEXT,
+            texto_breve TEXT,
+            centro TEXT,
+            almacen TEXT,
+            lote TEXT,
+            pb_almacen REAL,
+            libre_utilizacion INTEGER,
+            documento_comercial TEXT,
+            posicion_sd TEXT,
+            en_control_calidad INTEGER,
+            correlativo_int INTEGER,
+            is_test INTEGER NOT NULL DEFAULT 0
+        );
+        INSERT INTO core_sap_mb52_snapshot(material, libre_utilizacion, en_control_calidad) VALUES ('m', NULL, 1);
+        """
+    )
+    con.close()
+
+    db.ensure_schema()
+    with db.connect() as con:
+        row = con.execute("SELECT libre_utilizacion, en_control_calidad FROM core_sap_mb52_snapshot").fetchone()
+    assert tuple(row) == (0, 1)
+
+    fresh = Db(db_path.with_name("test.db.fresh"))
+    fresh.ensure_schema()
+    with fresh.connect() as con:
+        notnull = {
+            r["name"]: r["notnull"]
+            for r in con.execute("SELECT name, \"notnull\" FROM pragma_table_info('core_sap_mb52_snapshot')")
+        }
+    fresh.close()
+    assert notnull["libre_utilizacion"] == 1 and notnull["en_control_calidad"] == 1
+
+
+def test_update_process_config_changes_availability_predicate(temp_db):
+    """Process filter edits reach core_processes and the cached availability SQL."""
+    db, _ = temp_db
+    db.ensure_schema()
+    repo = Repository(db)
+    impl = repo.data._repo
+
+    assert impl._mb52_availability_predicate_sql(process="mecanizado") == (
+        "(libre_utilizacion = 1 AND en_control_calidad = 0)"
+    )
+    repo.data.update_process_config(process_id="mecanizado", libre_utilizacion=1)
+    assert impl._mb52_availability_predicate_sql(process="mecanizado") == "(libre_utilizacion = 1)"
+    assert repo.data.get_process_config(process_id="mecanizado")["en_control_calidad"] is None
+
+
+def test_test_orderpos_set_reads_is_test_flag(temp_db):
+    """Test order positions come from MB52's is_test flag; legacy rows get it backfilled."""
+    db, db_path = temp_db
+    db.ensure_schema()
+    with db.connect() as con:
+        con.executemany(
+            "INSERT INTO core_sap_mb52_snapshot(material, centro, almacen, lote, libre_utilizacion, en_control_calidad, "
+            "documento_comercial, posicion_sd, is_test) VALUES ('m', '4000', '4035', ?, 1, 0, ?, '10', 0)",
+            [("1234A", "P1"), ("1234", "P2")],
+        )
+        con.execute("UPDATE core_config SET config_value = '0' WHERE config_key = 'schema_version'")
+    db.close()
+
+    db = Db(db_path)
+    db.ensure_schema()
+    repo = Repository(db)
+    assert repo.dispatcher.get_test_orderpos_set() == {("P1", "10")}
+    db.close()
+
+
+def test_orderpos_sets_are_cached_until_data_changes(temp_db):
+    """Priority/test sets skip SQLite while unchanged and reload after any write."""
+    db, db_path = temp_db
+    db.ensure_schema()
+    repo = Repository(db)
+    impl = repo.data._repo
+
+    assert repo.dispatcher.get_priority_orderpos_set() == set()
+    calls = []
+    impl._load_priority_orderpos = lambda con: calls.append(1) or {("X", "1")}
+    assert repo.dispatcher.get_priority_orderpos_set() == set()
+    assert calls == []
+
+    with db.connect() as con:
+        con.execute("INSERT INTO dispatcher_orderpos_priority(pedido, posicion, is_priority, kind) VALUES ('P1', '10', 1, 'manual')")
+    assert repo.dispatcher.get_priority_orderpos_set() == {("X", "1")}
+    del impl._load_priority_orderpos
+
+    other = sqlite3.connect(db_path)
+    other.execute("DELETE FROM dispatcher_orderpos_priority")
+    other.commit()
+    other.close()
+    assert repo.dispatcher.get_priority_orderpos_set() == set()
+    db.close()
+
+
+def test_orderpos_sets_do_not_cache_rolled_back_writes(temp_db):
+    """A set read inside a transaction that later rolls back is not served afterwards."""
+    db, _ = temp_db
+    db.ensure_schema()
+    repo = Repository(db)
+
+    assert repo.dispatcher.get_priority_orderpos_set() == set()
+    with pytest.raises(ValueError):
+        with db.connect() as con:
+            con.execute("INSERT INTO dispatcher_orderpos_priority(pedido, posicion, is_priority, kind) VALUES ('P1', '10', 1, 'manual')")
+            assert repo.dispatcher.get_priority_orderpos_set() == {("P1", "10")}
+            raise ValueError("boom")
+    assert repo.dispatcher.get_priority_orderpos_set() == set()
+    db.close()
+
+
+def test_row_counts_follow_writes_from_any_connection(temp_db):
+    """Cached count_* values refresh after own writes and after other connections commit."""
+    db, db_path = temp_db
+    db.ensure_schema()
+    repo = Repository(db)
+
+    assert repo.data.count_sap_vision() == 0
+    with db.connect() as con:
+        con.execute("INSERT INTO core_sap_vision_snapshot(pedido, posicion, fecha_de_pedido) VALUES ('P1', '10', '2025-01-01')")
+    assert repo.data.count_sap_vision() == 1
+
+    other = sqlite3.connect(db_path)
+    other.execute("INSERT INTO core_sap_vision_snapshot(pedido, posicion, fecha_de_pedido) VALUES ('P2', '10', '2025-01-01')")
+    other.commit()
+    other.close()
+    assert repo.data.count_sap_vision() == 2
+    db.close()
+
+
+def test_row_counts_do_not_cache_rolled_back_writes(temp_db):
+    """A count taken inside a transaction that later rolls back is not served afterwards."""
+    db, _ = temp_db
+    db.ensure_schema()
+    repo = Repository(db)
+
+    assert repo.data.count_sap_vision() == 0
+    with pytest.raises(ValueError):
+        with db.connect() as con:
+            con.execute("INSERT INTO core_sap_vision_snapshot(pedido, posicion, fecha_de_pedido) VALUES ('P1', '10', '2025-01-01')")
+            assert repo.data.count_sap_vision() == 1
+            raise ValueError("boom")
+    assert repo.data.count_sap_vision() == 0
+    db.close()
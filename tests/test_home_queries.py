@@ -86,3 +86,115 @@ def test_get_orders_due_soon_execution(temp_db):
         
     assert len(rows) > 0
     assert rows[0]['pedido'] == 'DS1'
+
+
+def test_sap_rebuild_diagnostics_counts(temp_db):
+    db, repo = temp_db
+
+    with db.connect() as con:
+        con.executemany(
+            """
+            INSERT INTO core_sap_mb52_snapshot(
+                material, centro, almacen, lote, libre_utilizacion, en_control_calidad,
+                documento_comercial, posicion_sd
+            ) VALUES ('m', '4000', '4035', ?, ?, 0, ?, ?)
+            """,
+            [
+                ("1", 1, "P1", "10"),
+                ("2", 1, "P1", "10"),
+                ("3", 1, "P2", "10"),
+                ("", 1, "P3", "10"),  # usable, but no lote
+                ("4", 0, "P4", "10"),  # not available
+            ],
+        )
+        # Duplicate Vision rows multiply the joined count, as a JOIN would
+        con.executemany(
+            "INSERT INTO core_sap_vision_snapshot(pedido, posicion, fecha_de_pedido) VALUES (?, ?, '2026-01-01')",
+            [("P1", "10"), ("P1", "10")],
+        )
+
+    diag = repo.data.get_sap_rebuild_diagnostics(process="terminaciones")
+
+    assert diag["usable_total"] == 4
+    assert diag["usable_with_keys"] == 3
+    assert diag["usable_with_keys_and_vision"] == 4
+    assert diag["distinct_orderpos"] == 2
+    assert diag["distinct_orderpos_missing_vision"] == 1
+
+
+def test_sap_orderpos_missing_vision_rows(temp_db):
+    db, repo = temp_db
+
+    with db.connect() as con:
+        con.executemany(
+            """
+            INSERT INTO core_sap_mb52_snapshot(
+                material, centro, almacen, lote, libre_utilizacion, en_control_calidad,
+                documento_comercial, posicion_sd
+            ) VALUES ('m', '4000', '4035', ?, 1, 0, ?, ?)
+            """,
+            [("1", "P1", "10"), ("2", "P2", "10"), ("3", "P2", "10")],
+        )
+        con.execute(
+            "INSERT INTO core_sap_vision_snapshot(pedido, posicion, fecha_de_pedido) VALUES ('P1', '10', '2026-01-01')"
+        )
+
+    rows = repo.data.get_sap_orderpos_missing_vision_rows()
+
+    assert [(r["pedido"], r["posicion"], r["piezas"]) for r in rows] == [("P2", "10", 2)]
+
+
+def test_vision_orderpos_tracks_snapshot_writes(temp_db):
+    db, repo = temp_db
+
+    def orderpos():
+        with db.connect() as con:
+            return [
+                tuple(r)
+                for r in con.execute(
+                    "SELECT pedido, posicion, fecha_de_pedido_min, fecha_de_pedido_max, solicitado, bodega "
+                    "FROM core_sap_vision_orderpos ORDER BY pedido, posicion"
+                )
+            ]
+
+    with db.connect() as con:
+        con.executemany(
+            "INSERT INTO core_sap_vision_snapshot(pedido, posicion, fecha_de_pedido, solicitado, bodega) "
+            "VALUES (?, '10', ?, ?, ?)",
+            [("P1", "2025-02-01", 10, None), ("P1", "2025-01-01", 4, 2), ("P2", "2025-03-01", 5, 0)],
+        )
+    assert orderpos() == [("P1", "10", "2025-01-01", "2025-02-01", 10, 2), ("P2", "10", "2025-03-01", "2025-03-01", 5, 0)]
+
+    with db.connect() as con:
+        con.execute("DELETE FROM core_sap_vision_snapshot WHERE pedido = 'P1' AND solicitado = 10")
+        con.execute("UPDATE core_sap_vision_snapshot SET solicitado = 7 WHERE pedido = 'P2'")
+    assert orderpos() == [("P1", "10", "2025-01-01", "2025-01-01", 4, 2), ("P2", "10", "2025-03-01", "2025-03-01", 7, 0)]
+
+    repo.data.clear_imported_data()
+    assert orderpos() == []
+
+
+def test_orders_dashboard_rows_match_separate_queries(temp_db):
+    db, repo = temp_db
+    today = date(2026, 3, 10)
+
+    with db.connect() as con:
+        con.executemany(
+            "INSERT INTO core_sap_vision_snapshot(pedido, posicion, cod_material, fecha_de_pedido, solicitado, bodega) "
+            "VALUES (?, '10', '40330012345', ?, 10, ?)",
+            [
+                ("A1", "2026-03-01", 0),
+                ("A2", "2026-02-01", 10),
+                ("S1", "2026-03-10", 2),
+                ("S2", "2026-03-20", 0),
+                ("L1", "2026-06-01", 0),
+            ],
+        )
+
+    overdue, due_soon = repo.data.get_orders_dashboard_rows(today=today, days=14, overdue_limit=10, due_soon_limit=1)
+
+    assert [r["pedido"] for r in overdue] == ["A2", "A1"]
+    assert [r["pedido"] for r in due_soon] == ["S1"]
+    assert overdue == repo.get_orders_overdue_rows(today=today, limit=10)
+    assert due_soon == repo.get_orders_due_soon_rows(today=today, days=14, limit=1)
+    assert overdue[0]["pendientes"] == 0 and overdue[0]["dias"] == 37
@@ -65,6 +65,32 @@ def test_import_mb52_invalid_mode_raises(repo):
         repo.import_sap_mb52_bytes(content=b"irrelevant", mode="invalid")
 
 
+def test_import_mb52_merge_replaces_only_uploaded_centro_almacen(repo):
+    def mb52(rows):
+        return make_excel_bytes(
+            {
+                "Material": [r[0] for r in rows],
+                "Centro": [r[1] for r in rows],
+                "Almacen": [r[2] for r in rows],
+                "Lote": [r[3] for r in rows],
+                "Libre utilizacion": [1] * len(rows),
+                "Documento comercial": ["0030517821"] * len(rows),
+                "Posicion SD": ["000010"] * len(rows),
+                "En control calidad": [0] * len(rows),
+            }
+        )
+
+    repo.import_sap_mb52_bytes(
+        content=mb52([("M1", "4000", "4035", "1"), ("M2", "4000", "4049", "2"), ("M3", "4001", "4035", "3")]),
+        mode="replace",
+    )
+    repo.import_sap_mb52_bytes(content=mb52([("M4", "4000", "4035", "4")]), mode="merge")
+
+    with repo.db.connect() as con:
+        rows = con.execute("SELECT material, centro, almacen FROM core_sap_mb52_snapshot ORDER BY material").fetchall()
+    assert [tuple(r) for r in rows] == [("M2", "4000", "4049"), ("M3", "4001", "4035"), ("M4", "4000", "4035")]
+
+
 def test_import_demolding_truncates_flask_id_and_skips_invalid(repo):
     demolding_bytes = make_excel_bytes(
         {
@@ -110,3 +136,127 @@ def test_import_demolding_truncates_flask_id_and_skips_invalid(repo):
         
         assert piezas[1]["material"] == "43533098765"
         assert piezas[1]["part_code"] == "98765"  # Extracted from Fundido pattern
+
+
+def test_to_int01_series_matches_scalar():
+    from foundryplan.data.excel_io import to_int01, to_int01_series
+
+    values = ["Sí", "x", 1, 1.0, 0, "0", None, float("nan"), "2.5", "0.4", "abc", True, False, "", " TRUE "]
+    series = pd.Series(values, dtype=object)
+    assert to_int01_series(series).tolist() == [to_int01(v) for v in values]
+
+
+def test_map_distinct_matches_scalar_sap_keys():
+    from foundryplan.data.data_repository import DataRepositoryImpl
+    from foundryplan.data.excel_io import map_distinct
+
+    norm = DataRepositoryImpl._normalize_sap_key
+    values = ["000010", 10, 10.0, "10", None, float("nan"), " 4035\u00a0", "abc", 4000, "04000"]
+    series = pd.Series(values, dtype=object)
+    assert map_distinct(series, norm) == [norm(v) for v in values]
+
+
+def test_read_xlsx_streaming_matches_read_excel_bytes():
+    from foundryplan.data.excel_io import read_excel_bytes, read_xlsx_streaming
+
+    content = make_excel_bytes(
+        {
+            "Material": ["40XX00123451", "x", None, "4310000123"],
+            "Centro": [4000, 4000, 4000, None],
+            "Almacén": [4035, 4035.5, 4035, 4035],
+            "Lote": ["0030PD0674", "1", None, "ab"],
+            "Libre utilización": [1, "", 2, 3],
+            "En control calidad": [True, False, None, True],
+        }
+    )
+    pd.testing.assert_frame_equal(read_xlsx_streaming(content), read_excel_bytes(content))
+
+
+def test_read_xlsx_streaming_converts_date_cells():
+    from datetime import datetime, time
+
+    from foundryplan.data.excel_io import read_excel_bytes, read_xlsx_streaming
+
+    content = make_excel_bytes(
+        {
+            "Pedido": [1234567, 1234568, 1234569],
+            "Fecha de Pedido": [datetime(2025, 3, 5), None, datetime(2024, 12, 31, 8, 30)],
+            "Hora": [time(7, 15), time(0, 0), None],
+            "Cliente": ["ACME", None, "Foo"],
+        }
+    )
+    df = read_xlsx_streaming(content)
+    assert df["Fecha de Pedido"].iloc[0] == pd.Timestamp(2025, 3, 5)
+    pd.testing.assert_frame_equal(df, read_excel_bytes(content))
+
+
+def test_coerce_date_series_matches_scalar():
+    from datetime import datetime
+
+    from foundryplan.data.excel_io import coerce_date, coerce_date_series
+
+    values = [
+        "2024-03-05",
+        " 2024-03-05T10:00 ",
+        "05-03-2024",
+        "05/03/2024",
+        "2024/03/05",
+        datetime(2024, 3, 5, 8),
+        pd.Timestamp("2024-03-05"),
+        "31/02/2024",
+        "abc",
+        "",
+        None,
+        float("nan"),
+        pd.NaT,
+    ]
+    out = coerce_date_series(pd.Series(values, dtype=object)).tolist()
+    for value, got in zip(values, out):
+        try:
+            expected = coerce_date(value)
+        except ValueError:
+            expected = None
+        assert got == expected, value
+
+
+def test_coerce_float_series_matches_scalar():
+    import math
+
+    from foundryplan.data.excel_io import coerce_float, coerce_float_series
+
+    values = ["1.234,56", "1,5", "12", " 3.25 ", "", "nan", None, float("nan"), "abc", "1_000", "1.234.567", 2, 2.5, "-0,5"]
+    out = coerce_float_series(pd.Series(values, dtype=object)).tolist()
+    for value, got in zip(values, out):
+        expected = coerce_float(value)
+        if expected is None:
+            assert math.isnan(got), value
+        else:
+            assert got == expected, value
+
+
+def test_import_vision_updates_master_from_earliest_order(repo):
+    with repo.db.connect() as con:
+        con.executemany(
+            "INSERT INTO core_material_master(part_code, peso_unitario_ton, aleacion, descripcion_pieza) VALUES(?, ?, ?, ?)",
+            [("12345", None, None, None), ("54321", 9.0, "99", "keep")],
+        )
+
+    content = make_excel_bytes(
+        {
+            "Pedido": ["1000002", "1000001", "1000003"],
+            "Pos": ["10", "10", "10"],
+            "Cod. Material": ["40330012345", "40330012345", "40330012345"],
+            "Descripción Material": ["late", "early", "latest"],
+            "Fecha de Pedido": ["2025-03-01", "2025-01-15", "2025-04-01"],
+            "Solicitado": [2, 4, 1],
+            "Peso Neto (kg)": [3000, 2000, 7000],
+            "Status comercial": ["1", "1", "1"],
+        }
+    )
+    repo.import_sap_vision_bytes(content=content)
+
+    with repo.db.connect() as con:
+        rows = con.execute(
+            "SELECT part_code, peso_unitario_ton, aleacion, descripcion_pieza FROM core_material_master ORDER BY part_code"
+        ).fetchall()
+    assert [tuple(r) for r in rows] == [("12345", 0.5, "33", "early"), ("54321", 9.0, "99", "keep")]
@@ -47,3 +47,78 @@ def test_move_in_progress_config_check(temp_repo):
     repo.set_config(key="ui_allow_move_in_progress_line", value="0")
     with pytest.raises(ValueError, match="Movimiento manual deshabilitado"):
         repo.move_in_progress(pedido="X", posicion="1", line_id=2)
+
+
+def test_get_config_reflects_set_config(temp_repo):
+    repo = temp_repo
+
+    assert repo.data.get_config(key="sap_almacen_terminaciones") == "4035"
+    assert repo.data.get_config(key="no_such_key", default="x") == "x"
+
+    repo.set_config(key="sap_almacen_terminaciones", value=" 4022 ")
+    repo.set_config(key="no_such_key", value="1")
+
+    assert repo.data.get_config(key="sap_almacen_terminaciones") == "4022"
+    assert repo.data.get_config(key="no_such_key") == "1"
+    # A fresh repository reads the persisted values
+    assert Repository(repo.db).data.get_config(key="sap_almacen_terminaciones") == "4022"
+
+
+def test_get_config_ignores_rolled_back_set_config(temp_repo):
+    repo = temp_repo
+    assert repo.data.get_config(key="sap_almacen_terminaciones") == "4035"
+
+    with pytest.raises(RuntimeError):
+        with repo.db.connect():
+            repo.set_config(key="sap_almacen_terminaciones", value="4022")
+            raise RuntimeError("boom")
+    assert repo.data.get_config(key="sap_almacen_terminaciones") == "4035"
+
+    with repo.db.connect():
+        repo.set_config(key="sap_almacen_terminaciones", value="4022")
+    assert repo.data.get_config(key="sap_almacen_terminaciones") == "4022"
+
+
+def test_set_config_invalidates_derived_data_only_for_sap_keys(temp_repo):
+    repo = temp_repo
+
+    def seed():
+        with repo.db.connect() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO core_orders(process, almacen, pedido, posicion, material, cantidad, "
+                "fecha_de_pedido, primer_correlativo, ultimo_correlativo) "
+                "VALUES ('terminaciones', '4035', 'P1', '10', 'm', 1, '2026-01-01', 1, 1)"
+            )
+
+    def orders_count():
+        with repo.db.connect() as con:
+            return con.execute("SELECT COUNT(*) FROM core_orders").fetchone()[0]
+
+    seed()
+    repo.set_config(key="planner_horizon_days", value="45")
+    assert orders_count() == 1
+
+    repo.set_config(key="sap_almacen_terminaciones", value="4036")
+    assert orders_count() == 0
+
+
+def test_set_config_writes_audit_in_same_transaction(temp_repo):
+    repo = temp_repo
+
+    repo.set_config(key="planner_horizon_days", value="45")
+
+    with repo.db.connect() as con:
+        assert not con.in_transaction
+        row = con.execute(
+            "SELECT message, details FROM core_audit_log WHERE category = 'CONFIG' ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+    assert row["message"] == "Updated 'planner_horizon_days'"
+    assert row["details"].endswith("to '45'")
+
+
+def test_almacen_for_process_follows_config_changes(temp_repo):
+    data = temp_repo.data._repo
+
+    assert data._almacen_for_process("vulc") == data._almacen_for_process("en_vulcanizado")
+    temp_repo.set_config(key="sap_almacen_terminaciones", value="004036")
+    assert data._almacen_for_process("terminaciones") == "4036"
@@ -0,0 +1,55 @@
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+from foundryplan.data.db import Db
+from foundryplan.data.repository import Repository
+
+
+@pytest.fixture()
+def repo(tmp_path) -> Repository:
+    db = Db(Path(tmp_path) / "test.db")
+    db.ensure_schema()
+    return Repository(db)
+
+
+def test_planner_inputs_fingerprint_tracks_upstream_changes(repo):
+    planner = repo.planner._repo
+    sid = repo.planner.ensure_planner_scenario(name="default")
+    asof = date(2026, 1, 5)
+
+    with repo.db.connect() as con:
+        con.execute(
+            "INSERT INTO core_sap_vision_snapshot(pedido, posicion, cod_material, fecha_de_pedido, solicitado) "
+            "VALUES ('P1', '10', '40330012345', '2026-03-01', 5)"
+        )
+
+    fp1 = planner.get_planner_inputs_fingerprint(scenario_id=sid, asof_date=asof)
+    assert planner.get_planner_inputs_fingerprint(scenario_id=sid, asof_date=asof) == fp1
+    assert planner.get_planner_inputs_fingerprint(scenario_id=sid, asof_date=date(2026, 1, 6)) != fp1
+
+    with repo.db.connect() as con:
+        con.execute("UPDATE core_sap_vision_snapshot SET solicitado = 6")
+    fp2 = planner.get_planner_inputs_fingerprint(scenario_id=sid, asof_date=asof)
+    assert fp2 != fp1
+
+    repo.data.set_config(key="planner_holidays", value="2026-01-07")
+    assert planner.get_planner_inputs_fingerprint(scenario_id=sid, asof_date=asof) != fp2
+
+
+def test_planner_inputs_fingerprint_sees_uncommitted_writes(repo):
+    planner = repo.planner._repo
+    sid = repo.planner.ensure_planner_scenario(name="default")
+    asof = date(2026, 1, 5)
+    fp1 = planner.get_planner_inputs_fingerprint(scenario_id=sid, asof_date=asof)
+
+    with pytest.raises(RuntimeError):
+        with repo.db.connect() as con:
+            con.execute(
+                "INSERT INTO core_sap_vision_snapshot(pedido, posicion, cod_material, fecha_de_pedido, solicitado) "
+                "VALUES ('P1', '10', '40330012345', '2026-03-01', 5)"
+            )
+            assert planner.get_planner_inputs_fingerprint(scenario_id=sid, asof_date=asof) != fp1
+            raise RuntimeError("rollback")
+    assert planner.get_planner_inputs_fingerprint(scenario_id=sid, asof_date=asof) == fp1
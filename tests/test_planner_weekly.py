@@ -0,0 +1,36 @@
+from datetime import date
+
+from foundryplan.planner.api import aggregate_weekly_totals, week_labels_by_day
+
+
+def test_aggregate_weekly_totals_groups_by_week():
+    # Mon 2026-01-05 .. Fri 2026-01-09, then Mon 2026-01-12
+    workdays = [date(2026, 1, d) for d in (5, 6, 7, 8, 9, 12)]
+    orders_rows = [
+        {"order_id": "O1", "part_id": "P1"},
+        {"order_id": "O2", "part_id": "P2"},
+        {"order_id": "O3", "part_id": "MISSING"},
+    ]
+    parts_rows = [
+        {"part_id": "P1", "net_weight_ton": 0.5, "pieces_per_mold": 2, "flask_type": "l10"},
+        {"part_id": "P2", "net_weight_ton": 1.0, "pieces_per_mold": 1, "flask_type": ""},
+    ]
+    schedule = {
+        "O1": {"0": 3, "4": 2, "5": 1},
+        "O2": {"1": 4},
+        "O3": {"5": 7, "99": 5},  # day 99 is outside the horizon
+    }
+
+    labels, molds, tons, flask = aggregate_weekly_totals(schedule, workdays, orders_rows, parts_rows)
+
+    assert labels == ["2026-01-05", "2026-01-12"]
+    assert week_labels_by_day(workdays) == ["2026-01-05"] * 5 + ["2026-01-12"]
+    assert molds == {"2026-01-05": 9, "2026-01-12": 8}
+    assert tons == {"2026-01-05": 9.0, "2026-01-12": 1.0}
+    assert flask == {"2026-01-05": {"L10": 5}, "2026-01-12": {"L10": 1}}
+
+
+def test_aggregate_weekly_totals_empty_schedule():
+    labels, molds, tons, flask = aggregate_weekly_totals({}, [date(2026, 1, 5)], [], [])
+    assert labels == ["2026-01-05"]
+    assert molds == {} and tons == {} and flask == {}
@@ -104,3 +104,35 @@ def test_config_change_recalculates_priorities(temp_db):
     assert p_normal == 4, "Normal job should update to new normal value"
     assert p_urgent == 3, "Urgent job should update to new urgent value"
     assert p_test == 1, "Test job should stay 1"
+
+
+def test_pedidos_master_rows_resolve_priority_and_order(temp_db):
+    db, _ = temp_db
+    repo = Repository(db)
+    with db.connect() as con:
+        for i, (pedido, fecha) in enumerate([("P1", "2025-01-03"), ("P2", "2025-01-01"), ("P3", "2025-01-02")]):
+            con.execute(
+                """
+                INSERT INTO core_orders(process, almacen, pedido, posicion, material, cantidad,
+                    fecha_de_pedido, primer_correlativo, ultimo_correlativo)
+                VALUES ('terminaciones', '4035', ?, '10', 'M1', 1, ?, ?, ?)
+                """,
+                (pedido, fecha, i, i),
+            )
+        con.execute(
+            "INSERT INTO core_sap_vision_snapshot(pedido, posicion, fecha_de_pedido, solicitado, bodega, peso_neto_ton) "
+            "VALUES ('P2', '10', '2025-01-01', 5, 2, 1.5)"
+        )
+        # Position-level row wins over the legacy pedido-level flag.
+        con.execute("INSERT INTO dispatcher_orderpos_priority(pedido, posicion, is_priority, kind) VALUES ('P1', '10', 0, 'manual')")
+        con.execute("INSERT INTO dispatcher_order_priority(pedido, is_priority) VALUES ('P1', 1), ('P3', 1)")
+
+    rows = repo.data.get_pedidos_master_rows()
+
+    assert [(r["pedido"], r["is_priority"], r["priority_kind"]) for r in rows] == [
+        ("P3", 1, ""),
+        ("P2", 0, ""),
+        ("P1", 0, "manual"),
+    ]
+    assert rows[1]["pendientes"] == 3
+    assert rows[1]["peso_neto"] == 1.5